@@ -0,0 +1,217 @@
+"""An asyncio HTTP transport, for keeping many requests in flight on one thread.
+
+Requires aiohttp, which is installed with the optional `aio` extra. AIOHTTP_AVAILABLE
+is False if it isn't installed, and the threaded transport should be used instead.
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from typing import Any, NamedTuple
+
+from .metrics import MetricEvent, Metrics, classify_request
+from .ratecontrol import AdaptiveLimiter
+from .session import RETRY_STATUSES, backoff_delay, retry_after
+
+try:
+    import aiohttp
+
+    AIOHTTP_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+# Like the threaded transport, only requests that are safe to repeat are retried
+IDEMPOTENT_METHODS = frozenset(["DELETE", "GET", "HEAD", "OPTIONS", "PUT", "TRACE"])
+
+
+class AsyncResponse(NamedTuple):
+    """A response whose body has been read in full."""
+
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    @property
+    def ok(self) -> bool:
+        """Return True if the request succeeded."""
+        return 200 <= self.status < 300
+
+
+class AsyncClient:
+    """Send authenticated requests with aiohttp, on the running event loop.
+
+    Idempotent requests that fail with a connection error or a throttling or server
+    error status are retried with backoff (others only if asked to, and then only after
+    connection errors if the connection couldn't be made, so none of the request was
+    sent), and the access token is refreshed once on a 401. The semaphore limits how
+    many operations (e.g. whole downloads) are in progress at once, and the connection
+    pool is sized to match. Every request is recorded in the metrics, and each attempt
+    waits for a slot from the adaptive concurrency limiter, if given.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        timeout: tuple[float, float],
+        get_token: Callable[[str | None], str | None],
+        retries: int,
+        backoff_factor: float,
+        *,
+        metrics: Metrics | None = None,
+        limiter: AdaptiveLimiter | None = None,
+    ):
+        """Create the client. It must be entered (async with) before use.
+
+        Args:
+            concurrency (int): The maximum number of operations in progress at once.
+            timeout (tuple[float, float]): The connect and read timeouts in seconds.
+            get_token (Callable): Returns an access token. It's passed the token that
+            was rejected when one needs refreshing, otherwise None.
+            retries (int): The number of times to retry a failed request.
+            backoff_factor (float): The base delay between retries.
+            metrics (Metrics, optional): Records every request. Defaults to None.
+            limiter (AdaptiveLimiter, optional): Limits the requests in flight.
+            Defaults to None.
+        """
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.get_token = get_token
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.metrics = metrics
+        self.limiter = limiter
+        self.token: str | None = None
+        self.session: Any = None
+
+    async def __aenter__(self) -> "AsyncClient":
+        """Open the connection pool."""
+        self.token = await asyncio.to_thread(self.get_token, None)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=self.timeout[0], sock_read=self.timeout[1]
+            ),
+            # Responses are passed on exactly as they're received, like the stream
+            # of a requests download
+            auto_decompress=False,
+        )
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        """Close the connection pool."""
+        await self.session.close()
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, *, retries: int | None = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """Send a request, and yield the response before its body is read.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            retries (int, optional): The number of times to retry the request.
+            Defaults to the client's retries for idempotent methods, otherwise 0.
+            **kwargs: Any other arguments accepted by aiohttp.ClientSession.request.
+
+        Yields:
+            aiohttp.ClientResponse: The final response, after any retries.
+        """
+        headers = kwargs.pop("headers", None) or {}
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        refreshed = False
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            headers["Authorization"] = f"Bearer {self.token}"
+            response = None
+            if self.limiter is not None:
+                await self.limiter.acquire_async()
+            sent = time.perf_counter()
+            try:
+                response = await self.session.request(
+                    method, url, headers=headers, **kwargs
+                )
+            except (TimeoutError, aiohttp.ClientError) as e:
+                self._release(sent, None)
+                # A request that isn't safe to repeat may already have been applied
+                # if the connection failed after it was sent
+                if attempt >= retries or not (
+                    method in IDEMPOTENT_METHODS
+                    or isinstance(e, aiohttp.ClientConnectorError)
+                ):
+                    self._record(method, url, start, None, attempt)
+                    raise
+            except BaseException:
+                # e.g. cancelled, which says nothing about the load on GCS
+                if self.limiter is not None:
+                    self.limiter.discard()
+                raise
+            else:
+                self._release(sent, response)
+                if response.status == 401 and not refreshed:
+                    response.release()
+                    refreshed = True
+                    self.token = await asyncio.to_thread(self.get_token, self.token)
+                    continue
+                if response.status not in RETRY_STATUSES or attempt >= retries:
+                    self._record(method, url, start, response, attempt)
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                    return
+                response.release()
+
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_factor, response))
+            attempt += 1
+
+    def _release(self, sent: float, response: Any) -> None:
+        """Give the limiter back the slot taken for an attempt, with its outcome."""
+        if self.limiter is None:
+            return
+        self.limiter.release(
+            response.status if response is not None else None,
+            time.perf_counter() - sent,
+            retry_after(response) if response is not None else None,
+        )
+
+    def _record(
+        self, method: str, url: str, start: float, response: Any, retries: int
+    ) -> None:
+        """Record a request once it has its final response, or has failed."""
+        if self.metrics is None:
+            return
+        self.metrics.record(
+            MetricEvent(
+                "request",
+                classify_request(method, url),
+                time.perf_counter() - start,
+                status=response.status if response is not None else None,
+                bytes=(response.content_length or 0) if response is not None else 0,
+                retries=retries,
+            )
+        )
+
+    async def request(
+        self, method: str, url: str, *, retries: int | None = None, **kwargs: Any
+    ) -> AsyncResponse:
+        """Send a request, and read the whole response.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            retries (int, optional): The number of times to retry the request.
+            Defaults to the client's retries for idempotent methods, otherwise 0.
+            **kwargs: Any other arguments accepted by aiohttp.ClientSession.request.
+
+        Returns:
+            AsyncResponse: The final response, after any retries.
+        """
+        async with self.stream(method, url, retries=retries, **kwargs) as response:
+            body = await response.read()
+            return AsyncResponse(response.status, dict(response.headers), body)
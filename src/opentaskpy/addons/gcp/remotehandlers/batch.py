@@ -0,0 +1,101 @@
+"""Requests to the GCS JSON API batch endpoint.
+
+A batch request combines up to MAX_BATCH_SIZE API calls into a single multipart/mixed
+HTTP request. Each call is sent as an embedded HTTP request, and the response
+contains an embedded HTTP response for each of them, in any order, identified by its
+Content-ID.
+"""
+
+import json
+import uuid
+from email import policy
+from email.parser import BytesParser
+from typing import NamedTuple
+
+MAX_BATCH_SIZE = 100
+
+
+class BatchResponse(NamedTuple):
+    """The result of a single call within a batch."""
+
+    status_code: int
+    data: dict
+
+    @property
+    def ok(self) -> bool:
+        """Return True if the call succeeded."""
+        return 200 <= self.status_code < 300
+
+
+def build_batch_body(calls: list[tuple[str, str]]) -> tuple[bytes, str]:
+    """Build the body of a batch request.
+
+    Args:
+        calls (list[tuple[str, str]]): The method and path (e.g.
+        /storage/v1/b/bucket/o/name) of each call.
+
+    Returns:
+        tuple[bytes, str]: The request body, and its Content-Type.
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    lines = []
+    for index, (method, path) in enumerate(calls):
+        lines.extend(
+            [
+                f"--{boundary}",
+                "Content-Type: application/http",
+                "Content-Transfer-Encoding: binary",
+                f"Content-ID: <{index}>",
+                "",
+                f"{method} {path} HTTP/1.1",
+                "Content-Type: application/json",
+                "Content-Length: 0",
+                "",
+                "",
+            ]
+        )
+    lines.append(f"--{boundary}--")
+    lines.append("")
+    return "\r\n".join(lines).encode(), f"multipart/mixed; boundary={boundary}"
+
+
+def _parse_http_response(payload: bytes) -> BatchResponse:
+    """Parse an embedded HTTP response."""
+    head, _, body = payload.replace(b"\r\n", b"\n").partition(b"\n\n")
+    status_line = head.split(b"\n", 1)[0].decode()
+    status_code = int(status_line.split(" ")[1])
+    body = body.strip()
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        data = {
+            "error": {"code": status_code, "message": body.decode(errors="replace")}
+        }
+    return BatchResponse(status_code, data if isinstance(data, dict) else {})
+
+
+def parse_batch_response(content_type: str, content: bytes) -> dict[int, BatchResponse]:
+    """Parse the response to a batch request.
+
+    Args:
+        content_type (str): The Content-Type header of the response, including the
+        boundary.
+        content (bytes): The response body.
+
+    Returns:
+        dict[int, BatchResponse]: The response to each call, keyed on its index in the
+        request. Calls missing from the response are not included.
+    """
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + content
+    )
+    responses = {}
+    for part in message.iter_parts():
+        content_id = str(part.get("Content-ID", "")).strip("<>")
+        # GCS responds with "response-" followed by the request's Content-ID
+        index = content_id.removeprefix("response-")
+        payload = part.get_payload(decode=True)
+        if not index.isdigit() or not isinstance(payload, bytes):
+            continue
+        responses[int(index)] = _parse_http_response(payload)
+    return responses
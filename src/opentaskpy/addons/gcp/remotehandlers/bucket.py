@@ -1,15 +1,141 @@
 """GCP Cloud Bucket remote handler."""
 
+import asyncio
+import base64
 import glob
+import hashlib
+import io
+import json
+import os
 import re
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections.abc import (
+    Awaitable,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    Mapping,
+)
+from contextlib import closing
+from typing import IO, Any, NamedTuple
+from urllib.parse import quote
 
 import opentaskpy.otflogging
 import requests
+from opentaskpy.exceptions import RemoteTransferError
 from opentaskpy.remotehandlers.remotehandler import RemoteTransferHandler
 
+from .aio import AIOHTTP_AVAILABLE, AsyncClient
+from .batch import (
+    MAX_BATCH_SIZE,
+    BatchResponse,
+    build_batch_body,
+    parse_batch_response,
+)
+from .checksum import (
+    FAST_CRC32C,
+    StreamingHash,
+    crc32c_combine,
+    crc32c_extend,
+    crc32c_from_base64,
+    fast_hash_available,
+    object_hashes,
+    parse_goog_hash,
+)
+from .compression import (
+    DEFAULT_COMPRESSION_LEVEL,
+    GzipDecoder,
+    gzip_chunks,
+    gzip_stream,
+)
+from .concurrency import run_concurrently
 from .creds import get_access_token
+from .listindex import get_listing_index, listing_key
+from .matchglob import regex_to_match_glob
+from .metrics import MetricEvent, Metrics, classify_request, load_hook
+from .ratecontrol import get_limiter, reserve_object_write
+from .session import (
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_RETRIES,
+    MAX_BACKOFF,
+    RETRY_STATUSES,
+    backoff_delay,
+    get_session,
+    get_timeout,
+    retry_after,
+)
 
-MAX_OBJECTS_PER_QUERY = 100
+STORAGE_URL = "https://storage.googleapis.com"
+PUBSUB_URL = "https://pubsub.googleapis.com"
+DEFAULT_PUBSUB_MAX_MESSAGES = 100
+DEFAULT_PUBSUB_PULL_TIMEOUT = 10
+MAX_OBJECTS_PER_QUERY = 1000
+LIST_FIELDS = ["name", "size", "updated", "crc32c", "md5Hash"]
+DEFAULT_LIST_ATTEMPTS = 5
+DEFAULT_RESCAN_INTERVAL = 3600
+DEFAULT_BATCH_ATTEMPTS = 5
+REWRITE_CONCURRENCY = 8
+# Upload settings that a server-side copy still honours. Any others mean the copies
+# have to be uploaded from the worker, so they're stored the way the upload would be
+REWRITE_UPLOAD_OPTIONS = {"concurrency", "verify"}
+DEFAULT_REWRITE_ATTEMPTS = 5
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+# Resumable upload chunks must be a multiple of 256 KiB
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_RESUME_ATTEMPTS = 5
+RESUME_INCOMPLETE = 308
+DEFAULT_COMPOSITE_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_COMPOSITE_PARTS = 8
+MAX_COMPOSE_COMPONENTS = 32
+DELETE_CONCURRENCY = 8
+DEFAULT_SLICED_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_SLICES = 8
+DEFAULT_SLICE_ATTEMPTS = 3
+DEFAULT_ASYNC_CONCURRENCY = 100
+# The pure Python CRC32C is slow enough to cap a download at a few MB/s
+SLOW_CRC32C_WARNING = (
+    "Not verifying the download of an object that only has a CRC32C checksum, as the"
+    " C implementation of CRC32C isn't installed (install the crc32c extra)"
+)
+
+
+class ObjectInfo(NamedTuple):
+    """The details of an object from a listing.
+
+    A plain tuple, so it's cheap to hold or pass on for every object in a very large
+    listing.
+    """
+
+    name: str
+    size: int
+    updated: str
+    crc32c: str | None = None
+    md5_hash: str | None = None
+
+    @classmethod
+    def from_resource(cls, item: dict) -> "ObjectInfo":
+        """Create the record from an object resource in a listing."""
+        return cls(
+            item["name"],
+            int(item["size"]),
+            item["updated"],
+            item.get("crc32c"),
+            item.get("md5Hash"),
+        )
+
+    def listing(self) -> dict:
+        """Get the details in the form returned by list_files."""
+        details = {"size": str(self.size), "modified_time": self.updated}
+        if self.crc32c:
+            details["crc32c"] = self.crc32c
+        if self.md5_hash:
+            details["md5Hash"] = self.md5_hash
+        return details
 
 
 class BucketTransfer(RemoteTransferHandler):
@@ -29,20 +155,189 @@ class BucketTransfer(RemoteTransferHandler):
         )
         super().__init__(spec)
 
+        metrics_spec = self.spec["protocol"].get("metrics", {})
+        self.metrics = Metrics(
+            [load_hook(hook) for hook in metrics_spec.get("hooks", [])],
+            self.spec["bucket"],
+        )
+
         # Generating Access Token for Transfer
-        self.credentials = get_access_token(self.spec["protocol"])
+        self.credentials = get_access_token(self.spec["protocol"], metrics=self.metrics)
+
+        # Allow a local emulator (e.g. fake-gcs-server) to be used in place of GCS
+        self.storage_url = os.environ.get("STORAGE_EMULATOR_HOST", STORAGE_URL)
+        # The Pub/Sub emulator is given as host:port
+        pubsub_emulator_host = os.environ.get("PUBSUB_EMULATOR_HOST")
+        self.pubsub_url = (
+            f"http://{pubsub_emulator_host}" if pubsub_emulator_host else PUBSUB_URL
+        )
+        # State of a file watch using Pub/Sub notifications
+        self.watch_reconciled = False
+        self.watch_complete = False
+
+        # Connections are pooled and shared with other handlers in this process. Make
+        # sure there are enough for every concurrent request to keep its connection
+        upload_spec = self.spec.get("upload", {})
+        composite_spec = upload_spec.get("composite", {})
+        download_spec = self.spec.get("download", {})
+        sliced_spec = download_spec.get("sliced", {})
+        concurrency = max(
+            self.spec.get("postCopyAction", {}).get("concurrency", 1)
+            * REWRITE_CONCURRENCY,
+            download_spec.get("concurrency", 1)
+            * sliced_spec.get("concurrency", sliced_spec.get("slices", DEFAULT_SLICES)),
+            upload_spec.get("concurrency", 1)
+            * composite_spec.get(
+                "concurrency", composite_spec.get("parts", DEFAULT_COMPOSITE_PARTS)
+            ),
+        )
+        self.session = get_session(self.spec["protocol"], min_pool_size=concurrency)
+        self.timeout = get_timeout(self.spec["protocol"])
+        # Requests to the bucket share an adaptive concurrency limit, if enabled
+        adaptive_spec = self.spec["protocol"].get("http", {}).get("adaptive")
+        self.limiter = (
+            get_limiter(self.spec["bucket"], adaptive_spec)
+            if adaptive_spec is not None
+            else None
+        )
 
     def validate_or_refresh_creds(self) -> None:
         """Ensure the credentials are valid, refresh if necessary."""
-        self.credentials = get_access_token(self.spec["protocol"])
+        self.credentials = get_access_token(self.spec["protocol"], metrics=self.metrics)
+
+    def _request(
+        self, method: str, url: str, *, retried: bool = False, **kwargs: Any
+    ) -> requests.Response:
+        """Send an authenticated request using the pooled session.
+
+        The time until the response headers arrive, its status, the bytes sent and
+        received, and any retries are recorded in the metrics. With adaptive concurrency
+        enabled, requests to Cloud Storage wait for a slot from the limiter, which is
+        released once the response headers arrive.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            retried (bool): The request repeats one that failed. Defaults to False.
+            **kwargs: Any other arguments accepted by requests.Session.request.
+
+        Returns:
+            requests.Response: The response.
+        """
+        headers = kwargs.pop("headers", None) or {}
+        headers["Authorization"] = f"Bearer {self.credentials}"
+        kwargs.setdefault("timeout", self.timeout)
+        operation = classify_request(method, url)
+        sent = _body_size(kwargs.get("data"))
+        limiter = self.limiter if url.startswith(self.storage_url) else None
+        if limiter is not None:
+            limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, headers=headers, **kwargs)
+        except Exception:
+            duration = time.perf_counter() - start
+            if limiter is not None:
+                limiter.release(None, duration)
+            self.metrics.record(
+                MetricEvent(
+                    "request", operation, duration, bytes=sent, retries=int(retried)
+                )
+            )
+            raise
+        retry = getattr(response.raw, "retries", None)
+        if limiter is not None:
+            limiter.release(
+                response.status_code,
+                time.perf_counter() - start,
+                retry_after(response),
+                throttled=bool(retry and retry.history),
+            )
+        self.metrics.record(
+            MetricEvent(
+                "request",
+                operation,
+                time.perf_counter() - start,
+                status=response.status_code,
+                bytes=sent + int(response.headers.get("Content-Length", 0)),
+                retries=(len(retry.history) if retry else 0) + int(retried),
+            )
+        )
+        return response
+
+    def _request_with_retries(
+        self, method: str, url: str, **kwargs: Any
+    ) -> requests.Response:
+        """Send a request, retrying it if it's throttled or the service is unavailable.
+
+        This is for idempotent requests without a retry loop of their own. The session
+        only retries connection errors, so these responses are retried here, up to
+        http.retries times, with jittered backoff honouring Retry-After.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            **kwargs: Any other arguments accepted by requests.Session.request.
+
+        Returns:
+            requests.Response: The last response.
+        """
+        retries = self.spec["protocol"].get("http", {}).get("retries", DEFAULT_RETRIES)
+        attempt = 0
+        while True:
+            response = self._request(method, url, retried=attempt > 0, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            response.close()
+            delay = backoff_delay(attempt, self._backoff_factor(), response)
+            attempt += 1
+            self.logger.warning(
+                f"{method} {url} returned {response.status_code}, retrying in"
+                f" {delay:.1f}s (retry {attempt} of {retries})"
+            )
+            time.sleep(delay)
+
+    def _backoff_factor(self) -> float:
+        """Return the protocol's backoffFactor."""
+        return float(
+            self.spec["protocol"]
+            .get("http", {})
+            .get("backoffFactor", DEFAULT_BACKOFF_FACTOR)
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        """Get the number of seconds to wait before retrying an operation.
+
+        Args:
+            attempt (int): The number of attempts that have failed so far.
+
+        Returns:
+            float: The delay in seconds, using the protocol's backoffFactor.
+        """
+        return float(min(self._backoff_factor() * 2**attempt, MAX_BACKOFF))
 
     def supports_direct_transfer(self) -> bool:
-        """Return False, as all files should go via the worker."""
-        return False
+        """Return whether objects can be copied straight to their destination.
+
+        Direct transfers are opt-in, with directTransfer on the source, since the
+        copies are made with the source's credentials and can't be encrypted. They
+        can't be used if the source needs decrypting, which has to be done on the
+        worker. The destination spec isn't known here, so transfer_files goes via the
+        worker itself if the destination has upload settings that a copy can't honour.
+
+        Returns:
+            bool: True if directTransfer is set and the source isn't to be decrypted.
+        """
+        decrypt = self.spec.get("encryption", {}).get("decrypt", False)
+        return bool(self.spec.get("directTransfer", False) and not decrypt)
 
     def handle_post_copy_action(self, files: list[str]) -> int:
         """Handle the post copy action specified in the config.
 
+        Files are moved in batches of up to MAX_BATCH_SIZE, with postCopyAction
+        concurrency batches in progress at once. Unless continueOnError is set, no new
+        batches are started once a file has failed to move.
+
         Args:
             files (list[str]): A list of files that need to be handled.
 
@@ -55,78 +350,415 @@ class BucketTransfer(RemoteTransferHandler):
         ):
             try:
                 self.validate_or_refresh_creds()  # refresh creds
-                # Append a directory if one is defined
-
-                for file in files:
-                    source_file_encoded = file.replace("/", "%2F")
-                    dest_file_encoded = f"{self.spec['postCopyAction']['destination'].replace('/','%2F')}%2F{file.split('/')[-1]}"
-
-                    # Check if operation contains renaming
-                    if self.spec["postCopyAction"]["action"] == "rename":
-                        rename_regex = self.spec["postCopyAction"]["pattern"]
-                        rename_sub = self.spec["postCopyAction"]["sub"]
-                        dest_file_encoded = re.sub(
-                            rename_regex, rename_sub, dest_file_encoded
-                        )
+                destinations = self._post_copy_destinations(files)
+                concurrency = self.spec["postCopyAction"].get("concurrency", 1)
+                continue_on_error = self.spec["postCopyAction"].get(
+                    "continueOnError", False
+                )
 
-                    response = requests.post(
-                        f"https://storage.googleapis.com/storage/v1/b/{self.spec['bucket']}/o/{source_file_encoded}/rewriteTo/b/{self.spec['bucket']}/o/{dest_file_encoded}",
-                        headers={"Authorization": f"Bearer {self.credentials}"},
-                        timeout=1800,
-                    )
-                    self.logger.info(response.status_code)
-                    check_copy = requests.get(
-                        f"https://storage.googleapis.com/storage/v1/b/{self.spec['bucket']}/o/{dest_file_encoded}",
-                        headers={"Authorization": f"Bearer {self.credentials}"},
-                        timeout=1800,
-                    )
-                    ## Verify file has been copied successfully.
-                    if not check_copy.ok:
-                        self.logger.info(
-                            f"File {dest_file_encoded.replace('%2F','/')} failed to be created in bucket {self.spec['bucket']}"
-                        )
-                        self.logger.error(check_copy)
-                        return 1
+                batches = [
+                    files[start : start + MAX_BATCH_SIZE]
+                    for start in range(0, len(files), MAX_BATCH_SIZE)
+                ]
+                # The error for each file that failed, or None if it was moved
+                outcomes: dict[str, str | None] = {}
 
-                    response = requests.delete(
-                        f"https://storage.googleapis.com/storage/v1/b/{self.spec['bucket']}/o/{source_file_encoded}",
-                        headers={"Authorization": f"Bearer {self.credentials}"},
-                        timeout=1800,
-                    )
-                    ## Verify file has been deleted successfully.
-                    check_delete = requests.get(
-                        f"https://storage.googleapis.com/storage/v1/b/{self.spec['bucket']}/o/{source_file_encoded}",
-                        headers={"Authorization": f"Bearer {self.credentials}"},
-                        timeout=1800,
-                    )
-                    if check_delete.status_code != 404:
-                        self.logger.info(
-                            f"File {file} failed to be delete in bucket {self.spec['bucket']}"
-                        )
-                        self.logger.error(check_delete)
-                        return 1
+                def move_batch(index: int) -> int:
+                    batch_outcomes = self._move_objects(batches[index], destinations)
+                    outcomes.update(batch_outcomes)
+                    return 1 if any(batch_outcomes.values()) else 0
 
-                    self.logger.info(response.status_code)
-                    self.logger.info(
-                        f"Moved file {file} to {dest_file_encoded.replace('%2F','/')}"
+                run_concurrently(
+                    move_batch,
+                    range(len(batches)),
+                    concurrency,
+                    stop_on_error=not continue_on_error,
+                )
+
+                failures = {
+                    file: outcomes.get(file, "Not attempted after an earlier failure")
+                    for file in files
+                    if outcomes.get(file, "") is not None
+                }
+                if failures:
+                    self.logger.error(
+                        f"Failed to move {len(failures)} of {len(files)} files"
                     )
+                    for file, error in failures.items():
+                        self.logger.error(f"{file}: {error}")
+                    return 1
+                self.logger.info(f"Moved {len(files)} files")
                 return 0
             except Exception as e:
-                self.logger.info(
-                    f"Error during file copy from {file} to {dest_file_encoded.replace('%2F','/')}"
-                )
+                self.logger.info("Error during post copy action")
                 self.logger.error(e)
                 return 1
         return 1
 
+    def _move_objects(
+        self, files: list[str], destinations: dict[str, str]
+    ) -> dict[str, str | None]:
+        """Move a batch of objects within the bucket.
+
+        Each object is copied to its new name, and the original is then deleted. Both
+        steps use the batch endpoint, so the whole batch takes a single request for
+        each. The result of each call is taken from the batch response, and only the
+        calls that failed are retried.
+
+        Args:
+            files (list[str]): The objects to move, at most MAX_BATCH_SIZE.
+            destinations (dict[str, str]): The new name of each object.
+
+        Returns:
+            dict[str, str | None]: The error for each file that failed to move, or None
+            if it was moved.
+        """
+        outcomes = self._copy_objects(
+            files,
+            self.spec["bucket"],
+            self.spec["bucket"],
+            destinations,
+            self.spec["postCopyAction"].get("maxBytesRewrittenPerCall"),
+        )
+        copied = [file for file, error in outcomes.items() if error is None]
+
+        objects_path = f"/storage/v1/b/{self.spec['bucket']}/o"
+        deletes = self._batch_with_retries(
+            {
+                file: ("DELETE", f"{objects_path}/{quote(file, safe='')}")
+                for file in copied
+            }
+        )
+        for file, response in deletes.items():
+            ## Verify file has been deleted successfully.
+            if response.ok or response.status_code == 404:
+                outcomes[file] = None
+                self.logger.info(f"Moved file {file} to {destinations[file]}")
+            else:
+                outcomes[file] = (
+                    f"Copied to {destinations[file]}, but failed to delete:"
+                    f" {response.status_code} {response.data.get('error', '')}"
+                )
+        self._forget_objects([file for file, error in outcomes.items() if not error])
+        return outcomes
+
+    def _forget_objects(self, names: list[str]) -> None:
+        """Remove objects that no longer exist from the listing index, if one is used.
+
+        The objects have already gone, so a failure to update the index is only
+        logged. They're dropped from it by the next full listing instead.
+
+        Args:
+            names (list[str]): The names of the objects.
+        """
+        index_spec = self.spec.get("fileWatch", {}).get("index")
+        if not index_spec or not names:
+            return
+        try:
+            get_listing_index(index_spec["path"]).remove(self.spec["bucket"], names)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Failed to remove objects from the listing index: {e}")
+
+    def _copy_objects(
+        self,
+        files: list[str],
+        source_bucket: str,
+        destination_bucket: str,
+        destinations: dict[str, str],
+        max_bytes: int | None = None,
+    ) -> dict[str, str | None]:
+        """Copy a batch of objects server-side with rewriteTo.
+
+        The first call for every object is made through the batch endpoint. Any copies
+        that need more calls to finish are carried on individually. GCS allows about
+        one write a second to each object name, so copies to a name that has only just
+        been written (e.g. several files renamed to the same name) are also made
+        individually, once their turn comes.
+
+        Args:
+            files (list[str]): The objects to copy, at most MAX_BATCH_SIZE.
+            source_bucket (str): The bucket to copy from.
+            destination_bucket (str): The bucket to copy to.
+            destinations (dict[str, str]): The new name of each object.
+            max_bytes (int, optional): The maxBytesRewrittenPerCall for each call.
+            Defaults to None.
+
+        Returns:
+            dict[str, str | None]: The error for each file that failed to copy, or None
+            if it was copied.
+        """
+        outcomes: dict[str, str | None] = {}
+        query = f"?maxBytesRewrittenPerCall={max_bytes}" if max_bytes else ""
+        now = time.monotonic()
+        ready_at = {
+            file: now + reserve_object_write(destination_bucket, destinations[file])
+            for file in files
+        }
+        copies = self._batch_with_retries(
+            {
+                file: (
+                    "POST",
+                    f"/storage/v1/b/{source_bucket}/o/{quote(file, safe='')}"
+                    f"/rewriteTo/b/{destination_bucket}/o/"
+                    f"{quote(destinations[file], safe='')}{query}",
+                )
+                for file in files
+                if ready_at[file] <= now
+            }
+        )
+        incomplete = [file for file in files if ready_at[file] > now]
+        for file, response in copies.items():
+            ## Verify file has been copied successfully.
+            if response.ok and response.data.get("done", True):
+                outcomes[file] = None
+            elif response.ok:
+                incomplete.append(file)
+            else:
+                outcomes[file] = (
+                    f"Failed to copy to {destinations[file]}: {response.status_code}"
+                    f" {response.data.get('error', '')}"
+                )
+
+        # Large objects, or copies between locations or storage classes, need more
+        # calls to finish. Carry on with those outside of a batch, a few at a time
+        def finish_rewrite(file: str) -> int:
+            if file not in copies:
+                time.sleep(max(ready_at[file] - time.monotonic(), 0))
+            finished = self._rewrite(
+                source_bucket,
+                file,
+                destination_bucket,
+                destinations[file],
+                response=copies[file].data if file in copies else None,
+                max_bytes=max_bytes,
+            )
+            return 0 if finished else 1
+
+        for file, result in run_concurrently(
+            finish_rewrite, incomplete, REWRITE_CONCURRENCY
+        ).items():
+            outcomes[file] = (
+                None if result == 0 else f"Failed to copy to {destinations[file]}"
+            )
+        return outcomes
+
+    def _rewrite(
+        self,
+        source_bucket: str,
+        source: str,
+        destination_bucket: str,
+        destination: str,
+        *,
+        response: dict | None = None,
+        max_bytes: int | None = None,
+    ) -> bool:
+        """Copy an object with rewriteTo, making as many calls as needed to finish.
+
+        Each call copies up to maxBytesRewrittenPerCall bytes (if set), and returns a
+        rewriteToken that the next call continues from, until the response is done.
+        Calls that fail transiently are retried from the same token.
+
+        Args:
+            source_bucket (str): The bucket to copy from.
+            source (str): The name of the object to copy.
+            destination_bucket (str): The bucket to copy to.
+            destination (str): The name of the new object.
+            response (dict, optional): The response to a rewrite call that has
+            already been made (e.g. in a batch), to continue from. Defaults to None.
+            max_bytes (int, optional): The maxBytesRewrittenPerCall for each call.
+            Defaults to None.
+
+        Returns:
+            bool: True if the object was copied, False if not.
+        """
+        url = (
+            f"{self.storage_url}/storage/v1/b/{source_bucket}/o/{quote(source, safe='')}"
+            f"/rewriteTo/b/{destination_bucket}/o/{quote(destination, safe='')}"
+        )
+        params = {}
+        if max_bytes:
+            params["maxBytesRewrittenPerCall"] = max_bytes
+
+        data = response or {}
+        failures = 0
+        while not data.get("done"):
+            if "rewriteToken" in data:
+                params["rewriteToken"] = data["rewriteToken"]
+                self.logger.info(
+                    f"Rewritten {data.get('totalBytesRewritten')} of"
+                    f" {data.get('objectSize')} bytes of {source} to {destination}"
+                )
+
+            rewrite_response: requests.Response | None = None
+            try:
+                rewrite_response = self._request("POST", url, params=params)
+            except requests.RequestException as e:
+                self.logger.warning(f"Rewrite of {source} failed: {e}")
+
+            if rewrite_response is not None and rewrite_response.ok:
+                data = rewrite_response.json()
+                failures = 0
+                continue
+
+            status_code = getattr(rewrite_response, "status_code", None)
+            if status_code == 401:
+                self.credentials = get_access_token(
+                    self.spec["protocol"],
+                    stale_token=self.credentials,
+                    metrics=self.metrics,
+                )
+            elif status_code is not None and status_code not in RETRY_STATUSES:
+                self.logger.error(
+                    f"Failed to rewrite {source} to {destination}. Got return code:"
+                    f" {status_code}"
+                )
+                return False
+
+            failures += 1
+            if failures > DEFAULT_REWRITE_ATTEMPTS:
+                self.logger.error(
+                    f"Failed to rewrite {source} to {destination} after"
+                    f" {failures} attempts"
+                )
+                return False
+            time.sleep(self._backoff(failures - 1))
+
+        return True
+
+    def _post_copy_destinations(self, files: list[str]) -> dict[str, str]:
+        """Get the name each file is moved to by the post copy action.
+
+        Args:
+            files (list[str]): The names of the objects to move.
+
+        Returns:
+            dict[str, str]: The new name of each object.
+        """
+        post_copy_action = self.spec["postCopyAction"]
+        rename_regex = (
+            re.compile(post_copy_action["pattern"])
+            if post_copy_action["action"] == "rename"
+            else None
+        )
+        destinations = {}
+        for file in files:
+            dest_file_encoded = f"{post_copy_action['destination'].replace('/','%2F')}%2F{file.split('/')[-1]}"
+
+            # Check if operation contains renaming. The pattern is applied to the
+            # encoded name, as it always has been
+            if rename_regex:
+                dest_file_encoded = rename_regex.sub(
+                    post_copy_action["sub"], dest_file_encoded
+                )
+            destinations[file] = dest_file_encoded.replace("%2F", "/")
+        return destinations
+
+    def _batch(self, calls: list[tuple[str, str]]) -> dict[int, BatchResponse]:
+        """Send a single batch request.
+
+        Args:
+            calls (list[tuple[str, str]]): The method and path of each call, at most
+            MAX_BATCH_SIZE.
+
+        Returns:
+            dict[int, BatchResponse]: The response to each call, keyed on its index.
+            If the batch request itself fails, this is empty.
+        """
+        body, content_type = build_batch_body(calls)
+        try:
+            response = self._request(
+                "POST",
+                f"{self.storage_url}/batch/storage/v1",
+                data=body,
+                headers={"Content-Type": content_type},
+            )
+            if response.status_code == 401:
+                self.credentials = get_access_token(
+                    self.spec["protocol"],
+                    stale_token=self.credentials,
+                    metrics=self.metrics,
+                )
+                return {}
+        except requests.RequestException as e:
+            self.logger.warning(f"Batch request failed: {e}")
+            return {}
+        if not response.ok:
+            self.logger.warning(
+                f"Batch request failed. Got return code: {response.status_code}"
+            )
+            return {}
+        return parse_batch_response(response.headers["Content-Type"], response.content)
+
+    def _batch_with_retries(
+        self, calls: dict[str, tuple[str, str]]
+    ) -> dict[str, BatchResponse]:
+        """Send calls using the batch endpoint, retrying any that fail transiently.
+
+        Calls that are throttled, fail with a server error, or are missing from the
+        response (e.g. because the whole batch failed) are sent again in a new batch,
+        up to DEFAULT_BATCH_ATTEMPTS times.
+
+        Args:
+            calls (dict[str, tuple[str, str]]): The method and path of each call, keyed
+            on the file it's for.
+
+        Returns:
+            dict[str, BatchResponse]: The final response to each call.
+        """
+        results = {}
+        pending = dict(calls)
+        for attempt in range(DEFAULT_BATCH_ATTEMPTS):
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1, self._backoff_factor()))
+                self.logger.info(f"Retrying {len(pending)} failed batch calls")
+
+            keys = list(pending)
+            retry = {}
+            for start in range(0, len(keys), MAX_BATCH_SIZE):
+                batch_keys = keys[start : start + MAX_BATCH_SIZE]
+                responses = self._batch([pending[key] for key in batch_keys])
+                for index, key in enumerate(batch_keys):
+                    response = responses.get(
+                        index, BatchResponse(0, {"error": "No response in batch"})
+                    )
+                    results[key] = response
+                    if response.status_code == 0 or (
+                        response.status_code in RETRY_STATUSES
+                    ):
+                        retry[key] = pending[key]
+
+            pending = retry
+            if not pending:
+                break
+        return results
+
     def move_files_to_final_location(self, files: list[str]) -> None:
         """Not implemented for this handler."""
         raise NotImplementedError
 
     # When GCP is the source
-    def pull_files(self, files: list[str]) -> None:
-        """Not implemented for this handler."""
-        raise NotImplementedError
+    def pull_files(  # pylint: disable=arguments-differ
+        self, files: list[str] | dict, source_spec: dict
+    ) -> int:
+        """Copy files straight from the source bucket into this one.
+
+        If this bucket has upload settings that a server-side copy can't honour, the
+        files are transferred via the worker instead.
+
+        Args:
+            files (list | dict): The objects to copy, or the dict returned by
+            list_files.
+            source_spec (dict): The source spec, containing the bucket to copy from.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        if self._uncopyable_upload_options(self.spec):
+            # The source's handler downloads the objects, and they're uploaded from
+            # the worker
+            return BucketTransfer(source_spec).transfer_files(files, self.spec, self)
+        return self._copy_between_buckets(list(files), source_spec["bucket"], self)
 
     def push_files_from_worker(
         self, local_staging_directory: str, file_list: dict | None = None
@@ -147,188 +779,2439 @@ class BucketTransfer(RemoteTransferHandler):
                 files = list(file_list.keys())
             else:
                 files = glob.glob(f"{local_staging_directory}/*")
+            return self._push_files(files)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.logger.error("Failed to upload files")
+            self.logger.exception(e)
+            return 1
 
-            for file in files:
-                result = 0
-                # Strip the directory from the file
-                file_name = file.split("/")[-1]
-                # Handle any rename that might be specified in the spec
-                if "rename" in self.spec:
-                    rename_regex = self.spec["rename"]["pattern"]
-                    rename_sub = self.spec["rename"]["sub"]
+    def _push_files(self, files: list[str]) -> int:
+        """Upload files to the bucket, as many at once as the upload concurrency.
 
-                    file_name = re.sub(rename_regex, rename_sub, file_name)
-                    self.logger.info(f"Renaming file to {file_name}")
+        Args:
+            files (list[str]): The paths of the local files to upload.
 
-                # Append a directory if one is defined
-                if "directory" in self.spec and self.spec["directory"] != "":
-                    file_name = f"{self.spec['directory']}/{file_name}"
+        Returns:
+            int: 0 if every file was uploaded (or skipped, in sync mode), 1 if not.
+        """
+        start = time.perf_counter()
+        upload_spec = self.spec.get("upload", {})
+        concurrency = upload_spec.get("concurrency", 1)
+        sync = upload_spec.get("sync", False)
+        # In sync mode, the objects already in the destination are listed once
+        existing_objects = self._existing_objects() if sync else {}
+        skipped_files = []
 
-                self.logger.info(
-                    f"Uploading file to GCP Bucket {self.spec['bucket']} with path: {file_name}"
-                )
-                with open(file, "rb") as file_data:
-                    response = requests.post(
-                        f"https://storage.googleapis.com/upload/storage/v1/b/{self.spec['bucket']}/o",
-                        headers={"Authorization": f"Bearer {self.credentials}"},
-                        data=file_data,
-                        timeout=1800,
-                        params={"name": file_name, "uploadType": "media"},
-                    )
-                    if response.status_code == 401:
-                        self.logger.error(f"Unauthorised to Push file: {file}")
-                        result = 1
-                    elif response.status_code == 403:
-                        self.logger.error(f"Failed to Push file: {file}")
-                        self.logger.error(
-                            f"File already exists or no Delete permissions (for upsert) on Bucket. Status Code: {response.status_code}"
-                        )
-                        result = 1
-                    elif not response.ok:
-                        self.logger.error(f"Failed to Push file: {file}")
-                        self.logger.error(f"Got return code: {response.status_code}")
-                        self.logger.error(response.json())
-                        result = 1
-                    else:
-                        self.logger.info(
-                            f"Successfully uploaded {file_name} to GCP bucket {self.spec['bucket']}"
-                        )
-            return result
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            self.logger.error(f"Failed to download file: {file}")
-            self.logger.exception(e)
+        def upload(file: str) -> int:
+            try:
+                if not sync:
+                    return self._upload_file(file)
+
+                preconditions = self._sync_preconditions(file, existing_objects)
+                if preconditions is None:
+                    skipped_files.append(file)
+                    return 0
+                return self._upload_file(file, preconditions)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.logger.error(f"Failed to upload file: {file}")
+                self.logger.exception(e)
+                return 1
+
+        results: dict[str, int] = {}
+        if self._async_transport():
+            # Small files are sent in a single request each, so many can be in flight
+            # at once on the event loop. Larger files are left to the threads below
+            results = self._push_files_async(
+                [file for file in files if self._single_request_upload(file)],
+                existing_objects if sync else None,
+                skipped_files,
+            )
+        # Files are only opened once a worker picks them up, so no more than
+        # `concurrency` uploads are ever streaming at once, however many are queued
+        results.update(
+            run_concurrently(
+                upload, [file for file in files if file not in results], concurrency
+            )
+        )
+        self._record_transfer(
+            "upload",
+            start,
+            [
+                file
+                for file, result in results.items()
+                if result == 0 and file not in skipped_files
+            ],
+        )
+
+        failed_files = [file for file, result in results.items() if result != 0]
+        if failed_files:
+            self.logger.error(
+                f"Failed to upload {len(failed_files)} of {len(results)} files:"
+                f" {failed_files}"
+            )
             return 1
 
-    def pull_files_to_worker(
-        self, files: list[str], local_staging_directory: str
-    ) -> int:
-        """Pull files to the worker.
+        if sync:
+            self.logger.info(
+                f"Uploaded {len(results) - len(skipped_files)} files to GCP, skipped"
+                f" {len(skipped_files)} unchanged files"
+            )
+        else:
+            self.logger.info(f"Uploaded {len(results)} files to GCP")
+        return 0
 
-        Download files from GCP to the local staging directory.
+    def _sync_preconditions(
+        self, file: str, existing_objects: dict[str, dict]
+    ) -> dict | None:
+        """Decide whether a file needs uploading in sync mode.
 
         Args:
-            files (list): A list of files to download.
-            local_staging_directory (str): The local staging directory to download the
-            files to.
+            file (str): The path of the local file.
+            existing_objects (dict[str, dict]): The objects in the destination.
 
         Returns:
-            int: 0 if successful, 1 if not.
+            dict | None: The preconditions to upload the file with, or None if it's
+            unchanged and can be skipped.
         """
-        result = 0
-        self.logger.info("Downloading file from GCP.")
-        try:
-            self.validate_or_refresh_creds()  # refresh creds
-            for file in files:
-                self.logger.info(file)
-                file = file.replace(
-                    "/", "%2F"
-                )  # Encoding front slashes from eventual directory
-
-                response = requests.get(
-                    f"https://storage.googleapis.com/download/storage/v1/b/{self.spec['bucket']}/o/{file}",
-                    headers={"Authorization": f"Bearer {self.credentials}"},
-                    timeout=1800,
-                    params={"alt": "media"},  # Remove to only grab obj metadata
-                )
-                if response.status_code == 401:
-                    self.logger.error(f"Unauthorized to GET file: {file}")
-                    result = 1
-                elif response.status_code == 403:
-                    self.logger.error(f"Failed to GET file: {file}")
-                    self.logger.error(f"Forbidden Status Code: {response.status_code}")
-                    result = 1
-                elif not response.ok:
-                    self.logger.error(f"Failed to GET file: {file}")
-                    self.logger.error(f"Got return code: {response.status_code}")
-                    self.logger.error(response)
-                    result = 1
-                else:
-                    with open(
-                        f"{local_staging_directory}/{file.split('%2F')[-1]}", "wb"
-                    ) as f:
-                        f.write(response.content)
-                    self.logger.info(
-                        f"Successfully downloaded {file} to local Staging directory"
-                    )
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            self.logger.error(f"Failed to download file: {file}")
-            self.logger.exception(e)
-            result = 1
+        existing_object = existing_objects.get(self.destination_name(file))
+        if existing_object and self._unchanged(file, existing_object):
+            self.logger.info(f"Skipping unchanged file: {file}")
+            return None
+        # Only replace the object that was listed, or create a new one, in case
+        # something else has changed it since
+        generation = existing_object["generation"] if existing_object else 0
+        return {"ifGenerationMatch": generation}
 
-        return result
-
-    def transfer_files(
+    def _push_files_async(
         self,
         files: list[str],
-        remote_spec: dict,
-        dest_remote_handler: RemoteTransferHandler,
-    ) -> int:
-        """Not implemented for this transfer type."""
-        raise NotImplementedError
+        existing_objects: dict[str, dict] | None,
+        skipped_files: list[str],
+    ) -> dict[str, int]:
+        """Upload small files with the asyncio transport.
 
-    def create_flag_files(self) -> int:
-        """Not implemented for this transfer type."""
-        raise NotImplementedError
+        Args:
+            files (list[str]): The paths of the files to upload.
+            existing_objects (dict[str, dict] | None): The objects in the destination,
+            in sync mode, otherwise None.
+            skipped_files (list[str]): Unchanged files that are skipped in sync mode
+            are added to this list.
 
-    def list_files(
-        self, directory: str | None = None, file_pattern: str | None = None
-    ) -> dict:
-        """List Files in GCP with pagination and local regex matching.
+        Returns:
+            dict[str, int]: The result of each upload, 0 if successful, 1 if not.
+        """
+
+        async def upload(client: AsyncClient, file: str) -> int:
+            async with client.semaphore:
+                try:
+                    preconditions: dict | None = {}
+                    if existing_objects is not None:
+                        preconditions = await asyncio.to_thread(
+                            self._sync_preconditions, file, existing_objects
+                        )
+                        if preconditions is None:
+                            skipped_files.append(file)
+                            return 0
+                    return await self._upload_file_async(client, file, preconditions)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    self.logger.error(f"Failed to upload file: {file}")
+                    self.logger.exception(e)
+                    return 1
+
+        return self._run_async(files, upload)
+
+    async def _upload_file_async(
+        self, client: AsyncClient, file: str, preconditions: dict | None = None
+    ) -> int:
+        """Upload a single small file in one request, with the asyncio transport.
+
+        Like the threaded single-request upload, it's sent again up to resumeAttempts
+        times if it fails. The whole file is sent each time, with the same
+        preconditions, so a retry can't replace an object that's changed since the
+        destination was listed in sync mode.
 
         Args:
-            directory (str): A directory to list on the bucket.
-            file_pattern (str): File pattern to match files.
+            client (AsyncClient): The client to send the request with.
+            file (str): The path of the local file to upload.
+            preconditions (dict, optional): Precondition parameters for the upload.
+            Defaults to None.
 
         Returns:
-            dict: A dict of filenames if successful, an empty list if not.
+            int: 0 if successful, 1 if not.
         """
-        self.logger.info("Listing Files in Bucket.")
-        try:
-            self.validate_or_refresh_creds()  # refresh creds
-            directory = directory or self.spec.get("directory", "")
+        file_name = self.destination_name(file)
+        self.logger.info(
+            f"Uploading file to GCP Bucket {self.spec['bucket']} with path: {file_name}"
+        )
+        # Reading (and compressing) the file is done off the event loop
+        body, headers = await asyncio.to_thread(self._media_body, file)
+        response = await client.request(
+            "POST",
+            f"{self.storage_url}/upload/storage/v1/b/{self.spec['bucket']}/o",
+            retries=self.spec.get("upload", {}).get(
+                "resumeAttempts", DEFAULT_RESUME_ATTEMPTS
+            ),
+            data=body,
+            params={
+                "name": file_name,
+                "uploadType": "media",
+                **self._insert_params(),
+                **(preconditions or {}),
+            },
+            headers=headers,
+        )
+        return self._upload_result(
+            file, file_name, response.status, response.body.decode(errors="replace")
+        )
 
-            base_url = (
-                f"https://storage.googleapis.com/storage/v1/b/{self.spec['bucket']}/o"
-            )
-            headers = {"Authorization": f"Bearer {self.credentials}"}
-            params = {"prefix": directory, "maxResults": MAX_OBJECTS_PER_QUERY}
-            items = []
+    def _media_body(self, file: str) -> tuple[bytes, dict[str, str]]:
+        """Read a small file to send in a single upload request.
 
-            while True:
-                response = requests.get(
-                    base_url, headers=headers, params=params, timeout=1800
+        Args:
+            file (str): The path of the file.
+
+        Returns:
+            tuple[bytes, dict[str, str]]: The request body (compressed, if uploads
+            are), and its headers.
+        """
+        upload_spec = self.spec.get("upload", {})
+        with open(file, "rb") as file_data:
+            if upload_spec.get("compress"):
+                body = b"".join(
+                    gzip_chunks(
+                        file_data,
+                        DEFAULT_UPLOAD_CHUNK_SIZE,
+                        upload_spec.get("compressionLevel", DEFAULT_COMPRESSION_LEVEL),
+                    )
                 )
-                if response.status_code == 200:
-                    data = response.json()
-                    if "items" in data:
-                        items.extend(data["items"])
+            else:
+                body = file_data.read()
+        headers = {}
+        if upload_spec.get("verify", True):
+            checksum = StreamingHash()
+            checksum.update(body)
+            headers["X-Goog-Hash"] = checksum.header()
+        return body, headers
 
-                    if "nextPageToken" in data:
-                        # Set the nextPageToken for the next request
-                        params["pageToken"] = data["nextPageToken"]
-                    else:
-                        break
-                else:
-                    self.logger.error(f"List files returned {response.status_code}")
-                    self.logger.error(f"Remote files not found: {response}")
-
-            remote_files = {}
-            for item in items:
-                if "name" in item:
-                    file_name = item["name"].split("/")[-1]
-                    if not file_pattern or re.match(file_pattern, file_name):
-                        remote_files[item["name"]] = {
-                            "size": item["size"],
-                            "modified_time": item["updated"],
-                        }
-            return remote_files
+    def _single_request_upload(self, file: str) -> bool:
+        """Check whether a file is small enough to upload in a single request.
 
-        except Exception as e:
-            self.logger.error(
-                f"Error listing files in directory {self.spec['bucket']}/{directory}"
-            )
-            self.logger.exception(e)
-            return {}
+        Args:
+            file (str): The path of the file.
 
-    def tidy(self) -> None:
-        """Nothing to tidy."""
+        Returns:
+            bool: True if the file is below the resumable (and composite) threshold.
+        """
+        upload_spec = self.spec.get("upload", {})
+        threshold: int = upload_spec.get(
+            "resumableThreshold", DEFAULT_RESUMABLE_THRESHOLD
+        )
+        if "composite" in upload_spec:
+            threshold = min(
+                threshold,
+                upload_spec["composite"].get("threshold", DEFAULT_COMPOSITE_THRESHOLD),
+            )
+        return os.path.getsize(file) < threshold
+
+    def _existing_objects(self) -> dict[str, dict]:
+        """List the objects already in the destination directory.
+
+        Returns:
+            dict[str, dict]: The metadata of each object, keyed on its name.
+        """
+        directory = self.spec.get("directory", "")
+        params = {
+            "prefix": f"{directory}/" if directory else "",
+            "delimiter": "/",
+            "maxResults": MAX_OBJECTS_PER_QUERY,
+            "fields": "nextPageToken,items(name,size,generation,crc32c,md5Hash)",
+        }
+        return {
+            item["name"]: item
+            for item in self._iter_listing(
+                f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o", params
+            )
+        }
+
+    def _unchanged(self, file: str, existing_object: dict) -> bool:
+        """Check whether a local file has the same content as an existing object.
+
+        The file is only read if it's the same size as the object. Compressed uploads
+        are compared by compressing the file again, since compression is deterministic.
+
+        Args:
+            file (str): The path of the local file.
+            existing_object (dict): The metadata of the object.
+
+        Returns:
+            bool: True if the file matches the object.
+        """
+        upload_spec = self.spec.get("upload", {})
+        compress = upload_spec.get("compress", False)
+        if not compress and os.path.getsize(file) != int(existing_object["size"]):
+            return False
+        expected_hashes = object_hashes(existing_object)
+        checksum = StreamingHash.for_expected(expected_hashes)
+        if checksum is None:
+            return False
+        size = 0
+        with open(file, "rb") as file_data:
+            if compress:
+                chunks = gzip_chunks(
+                    file_data,
+                    DEFAULT_UPLOAD_CHUNK_SIZE,
+                    upload_spec.get("compressionLevel", DEFAULT_COMPRESSION_LEVEL),
+                )
+            else:
+                chunks = iter(lambda: file_data.read(DEFAULT_UPLOAD_CHUNK_SIZE), b"")
+            for chunk in chunks:
+                checksum.update(chunk)
+                size += len(chunk)
+        return size == int(existing_object["size"]) and checksum.matches(
+            expected_hashes
+        )
+
+    def destination_name(self, file: str) -> str:
+        """Get the object name a file should be uploaded or copied to.
+
+        Args:
+            file (str): The path of the local file, or the name of the source object.
+
+        Returns:
+            str: The object name, with any rename and directory applied.
+        """
+        # Strip the directory from the file
+        file_name = file.split("/")[-1]
+        # Handle any rename that might be specified in the spec
+        if "rename" in self.spec:
+            rename_regex = self.spec["rename"]["pattern"]
+            rename_sub = self.spec["rename"]["sub"]
+
+            file_name = re.sub(rename_regex, rename_sub, file_name)
+            self.logger.info(f"Renaming file to {file_name}")
+
+        # Append a directory if one is defined
+        if "directory" in self.spec and self.spec["directory"] != "":
+            file_name = f"{self.spec['directory']}/{file_name}"
+
+        return file_name
+
+    def _upload_file(self, file: str, preconditions: dict | None = None) -> int:
+        """Upload a single local file to the destination bucket.
+
+        Args:
+            file (str): The path of the local file to upload.
+            preconditions (dict, optional): Precondition parameters (e.g.
+            ifGenerationMatch) for the request that creates the object. Defaults to
+            None.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        file_name = self.destination_name(file)
+        compress = self.spec.get("upload", {}).get("compress", False)
+
+        self.logger.info(
+            f"Uploading file to GCP Bucket {self.spec['bucket']} with path: {file_name}"
+        )
+        # Compressed files are gzipped to a temporary file first, so each part, chunk
+        # or resumed upload is a fixed range of known bytes
+        content_file = self._gzip_file(file) if compress else file
+        try:
+            response = self._send_file(content_file, file_name, preconditions)
+        finally:
+            if compress:
+                os.remove(content_file)
+        if response is None:
+            return 1
+        return self._upload_result(file, file_name, response.status_code, response.text)
+
+    def upload_stream(self, stream: IO[bytes] | Iterable[bytes], file_name: str) -> int:
+        """Upload an object from a stream, without staging it as a local file.
+
+        The stream is sent as a resumable upload in chunks of upload.chunkSize, so
+        about one chunk is held in memory however large the object is, and its size
+        doesn't need to be known up front. The checksum is calculated as the stream is
+        read, and sent with the last chunk. If a chunk fails, GCS is asked how much it
+        has committed, and the rest is sent again. With upload.compress, the stream is
+        gzipped as it's read. If reading the stream raises an exception (e.g. the
+        checksum of an object from iter_object doesn't match), the upload is never
+        completed, so no object is created.
+
+        Args:
+            stream (IO[bytes] | Iterable[bytes]): A readable binary file, or an
+            iterable of chunks, such as the iterator from another handler's
+            iter_object.
+            file_name (str): The name of the file. The rename and directory of the spec
+            are applied to it, as they are to local files.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        upload_spec = self.spec.get("upload", {})
+        chunk_size = upload_spec.get("chunkSize", DEFAULT_UPLOAD_CHUNK_SIZE)
+        attempts = upload_spec.get("resumeAttempts", DEFAULT_RESUME_ATTEMPTS)
+        name = self.destination_name(file_name)
+        self.logger.info(
+            f"Streaming upload to GCP Bucket {self.spec['bucket']} with path: {name}"
+        )
+        start = time.perf_counter()
+
+        chunks: Iterable[bytes] = stream
+        if isinstance(stream, io.IOBase) or hasattr(stream, "read"):
+            file_data: IO[bytes] = stream  # type: ignore[assignment]
+            chunks = iter(lambda: file_data.read(chunk_size), b"")
+        if upload_spec.get("compress", False):
+            chunks = gzip_stream(
+                chunks,
+                upload_spec.get("compressionLevel", DEFAULT_COMPRESSION_LEVEL),
+            )
+        chunk_iterator = iter(chunks)
+
+        response = self._request(
+            "POST",
+            f"{self.storage_url}/upload/storage/v1/b/{self.spec['bucket']}/o",
+            params={"name": name, "uploadType": "resumable", **self._insert_params()},
+            json={},
+        )
+        if not response.ok:
+            return self._upload_result(
+                file_name, name, response.status_code, response.text
+            )
+        session_uri = response.headers["Location"]
+
+        checksum = StreamingHash() if upload_spec.get("verify", True) else None
+        # Data read from the stream that GCS hasn't committed yet, which starts at
+        # offset in the object. The total size is known once the stream has ended
+        buffer = bytearray()
+        offset = 0
+        total: int | None = None
+        query = False
+        failures = 0
+        while True:
+            # Read until there's more than a chunk buffered, so it's known whether the
+            # next chunk is the last
+            while not query and total is None and len(buffer) <= chunk_size:
+                data = next(chunk_iterator, None)
+                if data is None:
+                    total = offset + len(buffer)
+                    break
+                buffer += data
+                if checksum:
+                    checksum.update(data)
+
+            body = b""
+            if not query:
+                body = bytes(buffer if total is not None else buffer[:chunk_size])
+            content_range = "bytes " + (
+                f"{offset}-{offset + len(body) - 1}" if body else "*"
+            )
+            headers = {
+                "Content-Range": f"{content_range}/{'*' if total is None else total}"
+            }
+            if checksum and total is not None:
+                headers["X-Goog-Hash"] = checksum.header()
+            try:
+                response = self._request(
+                    "PUT",
+                    session_uri,
+                    data=body,
+                    headers=headers,
+                    allow_redirects=False,
+                )
+            except requests.RequestException as e:
+                failures += 1
+                if failures > attempts:
+                    self.logger.error(f"Failed to stream {name} to GCP: {e}")
+                    return 1
+                self.logger.warning(f"Upload of {name} interrupted: {e}")
+                query = True
+                time.sleep(self._backoff(failures))
+                continue
+
+            if response.status_code == RESUME_INCOMPLETE:
+                committed = _committed_offset(response)
+                if committed < offset:
+                    self.logger.error(
+                        f"Failed to stream {name} to GCP. GCS has committed"
+                        f" {committed} bytes, but the stream has been read from"
+                        f" {offset}"
+                    )
+                    return 1
+                del buffer[: committed - offset]
+                offset = committed
+                query = False
+                failures = 0
+                continue
+
+            if response.status_code in RETRY_STATUSES and failures < attempts:
+                failures += 1
+                self.logger.warning(
+                    f"Upload of {name} interrupted with status {response.status_code}"
+                )
+                query = True
+                time.sleep(self._backoff(failures))
+                continue
+
+            result = self._upload_result(
+                file_name, name, response.status_code, response.text
+            )
+            if result == 0:
+                self.metrics.record(
+                    MetricEvent(
+                        "transfer",
+                        "stream_upload",
+                        time.perf_counter() - start,
+                        bytes=total or 0,
+                    )
+                )
+            return result
+
+    def _upload_result(
+        self, file: str, file_name: str, status_code: int, text: str
+    ) -> int:
+        """Check the response to the request that created an object.
+
+        Args:
+            file (str): The path of the local file.
+            file_name (str): The name of the object.
+            status_code (int): The status code of the response.
+            text (str): The response body.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        if status_code == 401:
+            self.logger.error(f"Unauthorised to Push file: {file}")
+            return 1
+        if status_code == 412:
+            self.logger.error(
+                f"Failed to Push file: {file}. {file_name} has been changed since the"
+                " destination was listed"
+            )
+            return 1
+        if status_code == 403:
+            self.logger.error(f"Failed to Push file: {file}")
+            self.logger.error(
+                f"File already exists or no Delete permissions (for upsert) on Bucket. Status Code: {status_code}"
+            )
+            return 1
+        if not 200 <= status_code < 300:
+            self.logger.error(f"Failed to Push file: {file}")
+            self.logger.error(f"Got return code: {status_code}")
+            self.logger.error(text)
+            return 1
+
+        self.logger.info(
+            f"Successfully uploaded {file_name} to GCP bucket {self.spec['bucket']}"
+        )
+        return 0
+
+    def _send_file(
+        self, file: str, file_name: str, preconditions: dict | None = None
+    ) -> requests.Response | None:
+        """Send the content of a file, using the upload method suited to its size.
+
+        Args:
+            file (str): The path of the file to send.
+            file_name (str): The name of the object to create.
+            preconditions (dict, optional): Precondition parameters for the request
+            that creates the object. Defaults to None.
+
+        Returns:
+            requests.Response | None: The final response from GCS, or None if a
+            composite upload failed before the final compose.
+        """
+        size = os.path.getsize(file)
+        upload_spec = self.spec.get("upload", {})
+        composite_spec = upload_spec.get("composite")
+        if composite_spec and size >= composite_spec.get(
+            "threshold", DEFAULT_COMPOSITE_THRESHOLD
+        ):
+            composite_response = self._composite_upload(
+                file, file_name, size, preconditions
+            )
+            if composite_response is None:
+                return None
+            response = composite_response
+        elif size >= upload_spec.get("resumableThreshold", DEFAULT_RESUMABLE_THRESHOLD):
+            response = self._resumable_upload(file, file_name, size, preconditions)
+        else:
+            response = self._media_upload(file, file_name, preconditions)
+        return response
+
+    def _media_upload(
+        self, file: str, file_name: str, preconditions: dict | None = None
+    ) -> requests.Response:
+        """Upload a small file in a single request.
+
+        Uploads that are throttled, or fail with a server error, are sent again after a
+        backoff (honouring any Retry-After), up to resumeAttempts times.
+
+        Args:
+            file (str): The path of the file to send.
+            file_name (str): The name of the object to create.
+            preconditions (dict, optional): Precondition parameters for the request.
+            Defaults to None.
+
+        Returns:
+            requests.Response: The final response from GCS.
+        """
+        upload_spec = self.spec.get("upload", {})
+        attempts = upload_spec.get("resumeAttempts", DEFAULT_RESUME_ATTEMPTS)
+        failures = 0
+        with open(file, "rb") as file_data:
+            headers = {}
+            body: IO[bytes] | bytes = file_data
+            if upload_spec.get("verify", True):
+                # The file is small, so is read once into memory to hash it.
+                # GCS rejects the upload if its content doesn't match
+                body = file_data.read()
+                checksum = StreamingHash()
+                checksum.update(body)
+                headers["X-Goog-Hash"] = checksum.header()
+            while True:
+                file_data.seek(0)
+                response = self._request(
+                    "POST",
+                    f"{self.storage_url}/upload/storage/v1/b/{self.spec['bucket']}/o",
+                    retried=failures > 0,
+                    data=body,
+                    params={
+                        "name": file_name,
+                        "uploadType": "media",
+                        **self._insert_params(),
+                        **(preconditions or {}),
+                    },
+                    headers=dict(headers),
+                )
+                if response.status_code not in RETRY_STATUSES or failures >= attempts:
+                    return response
+                failures += 1
+                self.logger.warning(
+                    f"Upload of {file_name} failed with {response.status_code}, retrying"
+                )
+                time.sleep(
+                    backoff_delay(failures - 1, self._backoff_factor(), response)
+                )
+
+    def _gzip_file(self, file: str) -> str:
+        """Gzip a file into a hidden temporary file next to it.
+
+        The compressed file is named after the size and modification time of the file
+        (and the compression level), and given the same modification time, so a
+        resumable session saved for it in sessionDirectory is found again by a retried
+        task that compresses the same file.
+
+        Args:
+            file (str): The path of the file to compress.
+
+        Returns:
+            str: The path of the compressed file.
+        """
+        level = self.spec["upload"].get("compressionLevel", DEFAULT_COMPRESSION_LEVEL)
+        directory, name = os.path.split(file)
+        source = os.stat(file)
+        compressed_file = os.path.join(
+            directory, f".{name}.{source.st_size}.{source.st_mtime_ns}.{level}.gz"
+        )
+        fd, temp_file = tempfile.mkstemp(
+            dir=directory, prefix=f".{name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f, open(file, "rb") as file_data:
+                for chunk in gzip_chunks(file_data, DEFAULT_UPLOAD_CHUNK_SIZE, level):
+                    f.write(chunk)
+            os.utime(temp_file, ns=(source.st_atime_ns, source.st_mtime_ns))
+            os.replace(temp_file, compressed_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+        self.logger.info(
+            f"Compressed {file} from {os.path.getsize(file)} to"
+            f" {os.path.getsize(compressed_file)} bytes"
+        )
+        return compressed_file
+
+    def _insert_params(self) -> dict:
+        """Get the metadata to set on uploaded objects.
+
+        The same fields can be sent as query parameters of an upload, or as the
+        destination of a compose.
+
+        Returns:
+            dict: contentEncoding for compressed uploads, otherwise nothing.
+        """
+        if self.spec.get("upload", {}).get("compress"):
+            return {"contentEncoding": "gzip"}
+        return {}
+
+    def _resumable_upload(
+        self,
+        file: str,
+        file_name: str,
+        size: int,
+        preconditions: dict | None = None,
+    ) -> requests.Response:
+        """Upload a file in chunks using the GCS resumable upload protocol.
+
+        If a chunk fails, the offset GCS has committed is queried and the upload carries
+        on from there, rather than starting again. If a session directory is configured,
+        the session URI is saved there, so a retried task can also resume the upload.
+
+        Args:
+            file (str): The path of the local file to upload.
+            file_name (str): The name of the object to create.
+            size (int): The size of the file.
+            preconditions (dict, optional): Precondition parameters for the upload.
+            Defaults to None.
+
+        Returns:
+            requests.Response: The final response from GCS.
+        """
+        upload_spec = self.spec.get("upload", {})
+        chunk_size = upload_spec.get("chunkSize", DEFAULT_UPLOAD_CHUNK_SIZE)
+        attempts = upload_spec.get("resumeAttempts", DEFAULT_RESUME_ATTEMPTS)
+        session_file = self._upload_session_file(file, file_name, size)
+
+        session_uri = None
+        # Offset of the next byte to send, None if it needs to be queried from GCS
+        offset: int | None = 0
+        resumed = False
+        if session_file and os.path.exists(session_file):
+            with open(session_file, encoding="utf-8") as f:
+                session_uri = json.load(f)["session_uri"]
+            self.logger.info(f"Resuming previous upload session for {file_name}")
+            offset = None
+            resumed = True
+
+        if not session_uri:
+            response = self._request(
+                "POST",
+                f"{self.storage_url}/upload/storage/v1/b/{self.spec['bucket']}/o",
+                params={
+                    "name": file_name,
+                    "uploadType": "resumable",
+                    **self._insert_params(),
+                    **(preconditions or {}),
+                },
+                headers={"X-Upload-Content-Length": str(size)},
+                json={},
+            )
+            if not response.ok:
+                return response
+            session_uri = response.headers["Location"]
+            if session_file:
+                with open(session_file, "w", encoding="utf-8") as f:
+                    json.dump({"session_uri": session_uri, "name": file_name}, f)
+
+        # The checksum is calculated as chunks are sent, and sent with the last one,
+        # so GCS rejects the upload if the object doesn't match the file
+        checksum = StreamingHash() if upload_spec.get("verify", True) else None
+        hashed = 0
+        failures = 0
+        with open(file, "rb") as file_data:
+            while True:
+                try:
+                    if offset is None:
+                        # Ask GCS how much of the file it has already committed
+                        response = self._request(
+                            "PUT",
+                            session_uri,
+                            headers={"Content-Range": f"bytes */{size}"},
+                            allow_redirects=False,
+                        )
+                    else:
+                        if checksum and offset > hashed:
+                            # Resuming a saved session, so hash what's already sent
+                            file_data.seek(hashed)
+                            while hashed < offset:
+                                data = file_data.read(min(chunk_size, offset - hashed))
+                                checksum.update(data)
+                                hashed += len(data)
+                        file_data.seek(offset)
+                        chunk = file_data.read(chunk_size)
+                        content_range = (
+                            f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+                            if chunk
+                            else f"bytes */{size}"
+                        )
+                        headers = {"Content-Range": content_range}
+                        if checksum:
+                            # Chunks resent after a failure are already hashed
+                            if offset + len(chunk) > hashed:
+                                checksum.update(chunk[hashed - offset :])
+                                hashed = offset + len(chunk)
+                            if hashed == size:
+                                headers["X-Goog-Hash"] = checksum.header()
+                        response = self._request(
+                            "PUT",
+                            session_uri,
+                            data=chunk,
+                            headers=headers,
+                            allow_redirects=False,
+                        )
+                except requests.RequestException as e:
+                    failures += 1
+                    if failures > attempts:
+                        raise
+                    self.logger.warning(f"Upload of {file_name} interrupted: {e}")
+                    offset = None
+                    time.sleep(self._backoff(failures))
+                    continue
+
+                if response.status_code == RESUME_INCOMPLETE:
+                    offset = _committed_offset(response)
+                    self.logger.debug(f"Uploaded {offset} of {size} bytes of {file}")
+                    failures = 0
+                    resumed = False
+                    continue
+
+                if resumed and session_file and response.status_code in (404, 410):
+                    self.logger.info(
+                        f"Previous upload session for {file_name} has expired,"
+                        " starting again"
+                    )
+                    os.remove(session_file)
+                    return self._resumable_upload(file, file_name, size, preconditions)
+
+                if response.status_code in RETRY_STATUSES and failures < attempts:
+                    failures += 1
+                    self.logger.warning(
+                        f"Upload of {file_name} interrupted with status"
+                        f" {response.status_code}"
+                    )
+                    offset = None
+                    time.sleep(self._backoff(failures))
+                    continue
+
+                # Either complete, or failed in a way that can't be resumed
+                if session_file and (response.ok or response.status_code in (404, 410)):
+                    os.remove(session_file)
+                return response
+
+    def _composite_upload(
+        self,
+        file: str,
+        file_name: str,
+        size: int,
+        preconditions: dict | None = None,
+    ) -> requests.Response | None:
+        """Upload a file as parts in parallel, then compose them into one object.
+
+        Each part is uploaded to a temporary object. The parts are then joined with the
+        compose API (in several levels if there are more than 32). Temporary objects
+        are always removed afterwards.
+
+        Unless upload.verify is false, the checksum of each part is compared as it's
+        uploaded. With the C implementation of CRC32C, the parts' checksums are then
+        combined and compared against the final object too. Otherwise each part's MD5
+        is checked instead, since the pure Python CRC32C would be far slower than the
+        parallel upload. Composed objects have no MD5, so the final object is only
+        checked through its parts.
+
+        Args:
+            file (str): The path of the local file to upload.
+            file_name (str): The name of the object to create.
+            size (int): The size of the file.
+            preconditions (dict, optional): Precondition parameters for the final
+            compose. Defaults to None.
+
+        Returns:
+            requests.Response | None: The response to the final compose, or None if the
+            upload failed before then.
+        """
+        composite_spec = self.spec["upload"]["composite"]
+        part_count = min(composite_spec.get("parts", DEFAULT_COMPOSITE_PARTS), size)
+        part_size = -(-size // part_count)
+        part_count = -(-size // part_size)
+        concurrency = composite_spec.get("concurrency", part_count)
+
+        # Parts go under a hidden prefix next to the destination, unique to this upload
+        directory = f"{file_name.rsplit('/', 1)[0]}/" if "/" in file_name else ""
+        temp_prefix = f"{directory}.otf-composite/{uuid.uuid4().hex}/"
+        parts = [
+            (
+                f"{temp_prefix}part-{i:05}",
+                i * part_size,
+                min(part_size, size - i * part_size),
+            )
+            for i in range(part_count)
+        ]
+        temp_objects = [name for name, _, _ in parts]
+        algorithm = None
+        if self.spec["upload"].get("verify", True):
+            algorithm = StreamingHash().algorithm
+        part_checksums: dict[str, int] = {}
+
+        def upload_part(part: tuple[str, int, int]) -> int:
+            name, offset, length = part
+            try:
+                resource = self._upload_part(
+                    file, name, offset, length, algorithm=algorithm
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.logger.error(f"Failed to upload part {name} of {file}")
+                self.logger.exception(e)
+                return 1
+            if resource is None:
+                return 1
+            if algorithm == "crc32c":
+                part_checksums[name] = crc32c_from_base64(resource["crc32c"])
+            return 0
+
+        self.logger.info(
+            f"Uploading {file} as {part_count} parts of up to {part_size} bytes"
+        )
+        try:
+            results = run_concurrently(
+                upload_part, parts, concurrency, stop_on_error=True
+            )
+            if len(results) != len(parts) or any(results.values()):
+                self.logger.error(f"Failed to upload all parts of {file}")
+                return None
+
+            response = self._compose(
+                file_name, temp_objects.copy(), temp_objects, preconditions
+            )
+            if not response.ok or algorithm != "crc32c":
+                return response
+
+            # GCS derives the composed object's checksum from its components, so
+            # combine the checksums of the parts in the same way
+            expected_checksum = 0
+            for name, _, length in parts:
+                expected_checksum = crc32c_combine(
+                    expected_checksum, part_checksums[name], length
+                )
+            actual_checksum = response.json().get("crc32c")
+            if (
+                actual_checksum is None
+                or crc32c_from_base64(actual_checksum) != expected_checksum
+            ):
+                self.logger.error(
+                    f"Checksum of composed object {file_name} doesn't match {file}"
+                )
+                self._delete_objects([file_name])
+                return None
+            return response
+        finally:
+            self._delete_objects(temp_objects)
+
+    def _upload_part(
+        self,
+        file: str,
+        name: str,
+        offset: int,
+        length: int,
+        *,
+        algorithm: str | None = None,
+    ) -> dict | None:
+        """Upload a byte range of a local file to its own object.
+
+        Args:
+            file (str): The path of the local file.
+            name (str): The name of the object to create.
+            offset (int): The offset of the first byte of the part.
+            length (int): The length of the part.
+            algorithm (str, optional): The hash ("crc32c" or "md5") to calculate as
+            the part is sent, and compare against the object. Defaults to None, so
+            the part isn't verified.
+
+        Returns:
+            dict | None: The object resource of the part if it was uploaded (and
+            verified), None if not.
+        """
+        attempts = self.spec["upload"].get("resumeAttempts", DEFAULT_RESUME_ATTEMPTS)
+        failures = 0
+        with open(file, "rb") as file_data:
+            while True:
+                checksum = StreamingHash(algorithm) if algorithm else None
+                part = _FileSlice(file_data, offset, length, checksum)
+                try:
+                    response = self._request(
+                        "POST",
+                        f"{self.storage_url}/upload/storage/v1/b/{self.spec['bucket']}/o",
+                        data=part,
+                        params={"name": name, "uploadType": "media"},
+                    )
+                except requests.RequestException as e:
+                    if failures >= attempts:
+                        raise
+                    self.logger.warning(f"Upload of part {name} failed: {e}")
+                else:
+                    if response.ok:
+                        break
+                    if response.status_code not in RETRY_STATUSES or (
+                        failures >= attempts
+                    ):
+                        self.logger.error(
+                            f"Failed to upload part {name}. Got return code:"
+                            f" {response.status_code}"
+                        )
+                        return None
+                failures += 1
+                time.sleep(self._backoff(failures))
+
+        resource: dict = response.json()
+        if checksum is not None and not checksum.matches(object_hashes(resource)):
+            self.logger.error(f"Checksum of part {name} doesn't match {file}")
+            return None
+        return resource
+
+    def _compose(
+        self,
+        file_name: str,
+        components: list[str],
+        temp_objects: list[str],
+        preconditions: dict | None = None,
+    ) -> requests.Response:
+        """Compose objects into one, using intermediate objects if there are over 32.
+
+        Args:
+            file_name (str): The name of the object to create.
+            components (list[str]): The objects to compose, in order.
+            temp_objects (list[str]): Any intermediate objects created are added to this
+            list, so they can be removed afterwards.
+            preconditions (dict, optional): Precondition parameters for the final
+            compose. Defaults to None.
+
+        Returns:
+            requests.Response: The response to the final compose request.
+        """
+        temp_prefix = components[0].rsplit("/", 1)[0]
+        level = 0
+        while len(components) > MAX_COMPOSE_COMPONENTS:
+            level += 1
+            intermediates = []
+            for i in range(0, len(components), MAX_COMPOSE_COMPONENTS):
+                name = f"{temp_prefix}/level{level}-{i // MAX_COMPOSE_COMPONENTS:05}"
+                temp_objects.append(name)
+                response = self._compose_request(
+                    name, components[i : i + MAX_COMPOSE_COMPONENTS]
+                )
+                if not response.ok:
+                    return response
+                intermediates.append(name)
+            components = intermediates
+
+        return self._compose_request(file_name, components, preconditions)
+
+    def _compose_request(
+        self,
+        file_name: str,
+        components: list[str],
+        preconditions: dict | None = None,
+    ) -> requests.Response:
+        """Send a single compose request.
+
+        Args:
+            file_name (str): The name of the object to create.
+            components (list[str]): The objects to compose, in order (32 at most).
+            preconditions (dict, optional): Precondition parameters. Defaults to None.
+
+        Returns:
+            requests.Response: The response.
+        """
+        return self._request(
+            "POST",
+            f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o/{file_name.replace('/', '%2F')}/compose",
+            json={
+                "sourceObjects": [{"name": name} for name in components],
+                "destination": {
+                    "contentType": "application/octet-stream",
+                    **self._insert_params(),
+                },
+            },
+            params=preconditions,
+        )
+
+    def _delete_objects(self, names: list[str]) -> None:
+        """Delete objects from the bucket, logging (but ignoring) any failures.
+
+        Args:
+            names (list[str]): The names of the objects to delete.
+        """
+
+        def delete(name: str) -> int:
+            try:
+                response = self._request_with_retries(
+                    "DELETE",
+                    f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o/{name.replace('/', '%2F')}",
+                )
+            except requests.RequestException as e:
+                self.logger.warning(f"Failed to delete {name}: {e}")
+                return 1
+            if not response.ok and response.status_code != 404:
+                self.logger.warning(
+                    f"Failed to delete {name}. Got return code: {response.status_code}"
+                )
+                return 1
+            return 0
+
+        results = run_concurrently(delete, names, DELETE_CONCURRENCY)
+        self._forget_objects([name for name in names if not results[name]])
+
+    def _upload_session_file(self, file: str, file_name: str, size: int) -> str | None:
+        """Get the path of the file used to persist the resumable session for a file.
+
+        Args:
+            file (str): The path of the local file to upload.
+            file_name (str): The name of the object to create.
+            size (int): The size of the file.
+
+        Returns:
+            str | None: The path, or None if sessions aren't persisted.
+        """
+        session_directory = self.spec.get("upload", {}).get("sessionDirectory")
+        if not session_directory:
+            return None
+        os.makedirs(session_directory, exist_ok=True)
+        # A changed file must not resume a session started with different content
+        key = "|".join(
+            [
+                self.spec["bucket"],
+                file_name,
+                os.path.abspath(file),
+                str(size),
+                str(os.stat(file).st_mtime_ns),
+            ]
+        )
+        return f"{session_directory}/{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def pull_files_to_worker(
+        self,
+        files: list[str] | dict | Iterable[ObjectInfo],
+        local_staging_directory: str,
+    ) -> int:
+        """Pull files to the worker.
+
+        Download files from GCP to the local staging directory.
+
+        Args:
+            files (list | dict | Iterable[ObjectInfo]): A list of files to download,
+            the dict returned by list_files, or the objects from iter_files. Objects
+            from iter_files start downloading as soon as they're listed.
+            local_staging_directory (str): The local staging directory to download the
+            files to.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.logger.info("Downloading file from GCP.")
+        self.validate_or_refresh_creds()  # refresh creds
+        start = time.perf_counter()
+        concurrency = self.spec.get("download", {}).get("concurrency", 1)
+        # When called with the output of list_files or iter_files, the object metadata
+        # is available
+        remote_files: dict = files if isinstance(files, dict) else {}
+        names: Iterable[str] = (
+            files
+            if isinstance(files, (list, dict))
+            else _listed_names(files, remote_files)
+        )
+
+        def download(file: str) -> int:
+            try:
+                return self._download_file(
+                    file, local_staging_directory, remote_files.get(file)
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.logger.error(f"Failed to download file: {file}")
+                self.logger.exception(e)
+                return 1
+
+        results: dict[str, int] = {}
+        if self._async_transport():
+            # Every object is needed up front to be split between the event loop and
+            # the threads
+            names = list(names)
+            # Objects that might be sliced are left to the threads below
+            sliced_spec = self.spec.get("download", {}).get("sliced")
+            threshold = (sliced_spec or {}).get("threshold", DEFAULT_SLICED_THRESHOLD)
+            results = self._pull_files_async(
+                [
+                    file
+                    for file in names
+                    if not sliced_spec
+                    or int(remote_files.get(file, {}).get("size", threshold))
+                    < threshold
+                ],
+                local_staging_directory,
+                remote_files,
+            )
+        # All downloads share the same credentials and connection pool. Names are
+        # consumed lazily, so objects from iter_files are downloaded as they're listed
+        try:
+            results.update(
+                run_concurrently(
+                    download,
+                    (file for file in names if file not in results),
+                    concurrency,
+                )
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Only iter_files can fail here, part way through the listing
+            self.logger.error("Failed to list the files to download")
+            self.logger.exception(e)
+            return 1
+        self._record_transfer(
+            "download",
+            start,
+            [
+                f"{local_staging_directory}/{file.split('/')[-1]}"
+                for file, result in results.items()
+                if result == 0
+            ],
+        )
+
+        failed_files = [file for file, result in results.items() if result != 0]
+        if failed_files:
+            self.logger.error(
+                f"Failed to download {len(failed_files)} of {len(results)} files:"
+                f" {failed_files}"
+            )
+            return 1
+
+        self.logger.info(f"Downloaded {len(results)} files from GCP")
+        return 0
+
+    def _record_transfer(
+        self, operation: str, start: float, local_files: list[str]
+    ) -> None:
+        """Record the size and duration of a download or upload of many files.
+
+        Args:
+            operation (str): "download" or "upload".
+            start (float): The time.perf_counter() when the transfer started.
+            local_files (list[str]): The local copies of the files transferred.
+        """
+        self.metrics.record(
+            MetricEvent(
+                "transfer",
+                operation,
+                time.perf_counter() - start,
+                bytes=sum(os.path.getsize(file) for file in local_files),
+            )
+        )
+
+    def _download_file(
+        self,
+        file: str,
+        local_staging_directory: str,
+        remote_file: dict | None = None,
+    ) -> int:
+        """Stream a single object from the bucket into the local staging directory.
+
+        The object is written in chunks to a temporary file, which is renamed into
+        place once the download is complete, so memory use doesn't depend on the size
+        of the object, and a partial download is never left under the final name.
+
+        Args:
+            file (str): The name of the object to download.
+            local_staging_directory (str): The local staging directory to download the
+            file to.
+            remote_file (dict, optional): The details of the object from list_files, if
+            known. Defaults to None.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.logger.info(file)
+        file_encoded = file.replace(
+            "/", "%2F"
+        )  # Encoding front slashes from eventual directory
+        file_name = file.split("/")[-1]
+        download_spec = self.spec.get("download", {})
+        chunk_size = download_spec.get("chunkSize", DEFAULT_DOWNLOAD_CHUNK_SIZE)
+
+        sliced_spec = download_spec.get("sliced")
+        if sliced_spec:
+            threshold = sliced_spec.get("threshold", DEFAULT_SLICED_THRESHOLD)
+            known_size = int((remote_file or {}).get("size", threshold))
+            if known_size >= threshold:
+                response = self._request_with_retries(
+                    "GET",
+                    f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o/{file_encoded}",
+                )
+                if not response.ok:
+                    self.logger.error(f"Failed to GET file: {file}")
+                    self.logger.error(f"Got return code: {response.status_code}")
+                    return 1
+                metadata = response.json()
+                # Byte ranges of an object stored gzipped can't be decompressed
+                # independently, so those are downloaded in one piece
+                if (
+                    int(metadata["size"]) >= threshold
+                    and metadata.get("contentEncoding") != "gzip"
+                ):
+                    return self._sliced_download(
+                        file, f"{local_staging_directory}/{file_name}", metadata
+                    )
+
+        with self._request_with_retries(
+            "GET",
+            f"{self.storage_url}/download/storage/v1/b/{self.spec['bucket']}/o/{file_encoded}",
+            params={"alt": "media"},  # Remove to only grab obj metadata
+            # Objects stored gzipped are sent as they're stored, rather than
+            # decompressed by GCS, so less is transferred
+            headers={"Accept-Encoding": "gzip"},
+            stream=True,
+        ) as response:
+            if self._download_failed(file, response.status_code):
+                return 1
+
+            sink = self._download_sink(
+                f"{local_staging_directory}/{file_name}", response.headers, remote_file
+            )
+            try:
+                for chunk in response.raw.stream(chunk_size, decode_content=False):
+                    sink.write(chunk)
+                error = sink.commit()
+            except BaseException:
+                sink.discard()
+                raise
+            if error:
+                self.logger.error(f"Failed to download {file}. {error}")
+                return 1
+
+        self.logger.info(f"Successfully downloaded {file} to local Staging directory")
+        return 0
+
+    def iter_object(
+        self, file: str, remote_file: dict | None = None
+    ) -> Generator[bytes]:
+        """Stream the content of an object, without writing it to a local file.
+
+        Chunks are yielded as they're received, and decompressed if the object is
+        stored gzipped (unless download.decompress is false), so only one chunk is held
+        in memory at a time. The checksum is checked after the last chunk, so the
+        content isn't complete until the iterator is exhausted. Closing the iterator
+        early closes the connection.
+
+        Args:
+            file (str): The name of the object.
+            remote_file (dict, optional): The details of the object from list_files, if
+            known. Defaults to None.
+
+        Yields:
+            bytes: The content of the object, in chunks of up to download.chunkSize.
+
+        Raises:
+            RemoteTransferError: If the object can't be downloaded, or its checksum
+            doesn't match.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        chunk_size = self.spec.get("download", {}).get(
+            "chunkSize", DEFAULT_DOWNLOAD_CHUNK_SIZE
+        )
+        start = time.perf_counter()
+        received = 0
+        with self._request_with_retries(
+            "GET",
+            f"{self.storage_url}/download/storage/v1/b/{self.spec['bucket']}/o/{quote(file, safe='')}",
+            params={"alt": "media"},
+            headers={"Accept-Encoding": "gzip"},
+            stream=True,
+        ) as response:
+            if self._download_failed(file, response.status_code):
+                raise RemoteTransferError(f"Failed to download {file}")
+
+            expected_hashes, decoder = self._download_checks(
+                response.headers, remote_file
+            )
+            checksum = StreamingHash.for_expected(expected_hashes)
+            for chunk in response.raw.stream(chunk_size, decode_content=False):
+                if checksum:
+                    checksum.update(chunk)
+                received += len(chunk)
+                if data := decoder.decompress(chunk) if decoder else chunk:
+                    yield data
+
+            if decoder:
+                try:
+                    decoder.finish()
+                except ValueError as e:
+                    raise RemoteTransferError(f"Failed to download {file}. {e}") from e
+            if checksum and not checksum.matches(expected_hashes):
+                raise RemoteTransferError(
+                    f"Failed to download {file}. Checksum doesn't match. Expected"
+                    f" {checksum.algorithm} {expected_hashes[checksum.algorithm]}, got"
+                    f" {checksum.digest()}"
+                )
+
+        self.metrics.record(
+            MetricEvent(
+                "transfer",
+                "stream_download",
+                time.perf_counter() - start,
+                bytes=received,
+            )
+        )
+
+    def open_object(self, file: str, remote_file: dict | None = None) -> IO[bytes]:
+        """Open an object as a binary file, that's downloaded as it's read.
+
+        The file is a wrapper around iter_object, for APIs that read from a file
+        object, such as shutil.copyfileobj. Errors are raised by read, once the
+        download has started.
+
+        Args:
+            file (str): The name of the object.
+            remote_file (dict, optional): The details of the object from list_files, if
+            known. Defaults to None.
+
+        Returns:
+            IO[bytes]: A readable, unseekable binary file. Close it when done.
+        """
+        return io.BufferedReader(
+            _ChunkReader(self.iter_object(file, remote_file)),
+            buffer_size=self.spec.get("download", {}).get(
+                "chunkSize", DEFAULT_DOWNLOAD_CHUNK_SIZE
+            ),
+        )
+
+    def _pull_files_async(
+        self, files: list[str], local_staging_directory: str, remote_files: dict
+    ) -> dict[str, int]:
+        """Download objects with the asyncio transport.
+
+        Args:
+            files (list[str]): The names of the objects to download.
+            local_staging_directory (str): The local staging directory to download the
+            files to.
+            remote_files (dict): The details of each object from list_files, if known.
+
+        Returns:
+            dict[str, int]: The result of each download, 0 if successful, 1 if not.
+        """
+
+        async def download(client: AsyncClient, file: str) -> int:
+            async with client.semaphore:
+                try:
+                    return await self._download_file_async(
+                        client, file, local_staging_directory, remote_files.get(file)
+                    )
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    self.logger.error(f"Failed to download file: {file}")
+                    self.logger.exception(e)
+                    return 1
+
+        return self._run_async(files, download)
+
+    async def _download_file_async(
+        self,
+        client: AsyncClient,
+        file: str,
+        local_staging_directory: str,
+        remote_file: dict | None = None,
+    ) -> int:
+        """Stream a single object into the local staging directory, with asyncio.
+
+        Args:
+            client (AsyncClient): The client to send the request with.
+            file (str): The name of the object to download.
+            local_staging_directory (str): The local staging directory to download the
+            file to.
+            remote_file (dict, optional): The details of the object from list_files, if
+            known. Defaults to None.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.logger.info(file)
+        chunk_size = self.spec.get("download", {}).get(
+            "chunkSize", DEFAULT_DOWNLOAD_CHUNK_SIZE
+        )
+        async with client.stream(
+            "GET",
+            f"{self.storage_url}/download/storage/v1/b/{self.spec['bucket']}/o/{quote(file, safe='')}",
+            params={"alt": "media"},
+            headers={"Accept-Encoding": "gzip"},
+        ) as response:
+            if self._download_failed(file, response.status):
+                return 1
+
+            sink = self._download_sink(
+                f"{local_staging_directory}/{file.split('/')[-1]}",
+                response.headers,
+                remote_file,
+            )
+            # Writing (and decompressing and hashing) is done off the event loop, so
+            # other downloads carry on in the meantime
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    await asyncio.to_thread(sink.write, chunk)
+                error = await asyncio.to_thread(sink.commit)
+            except BaseException:
+                sink.discard()
+                raise
+            if error:
+                self.logger.error(f"Failed to download {file}. {error}")
+                return 1
+
+        self.logger.info(f"Successfully downloaded {file} to local Staging directory")
+        return 0
+
+    def _async_transport(self) -> bool:
+        """Check whether the asyncio transport should be used.
+
+        Returns:
+            bool: True if it's configured, and aiohttp is installed.
+        """
+        if self.spec["protocol"].get("http", {}).get("transport") != "aiohttp":
+            return False
+        if not AIOHTTP_AVAILABLE:
+            self.logger.warning(
+                "aiohttp isn't installed, so the threaded transport is used instead"
+            )
+            return False
+        return True
+
+    def _run_async(
+        self,
+        items: list[str],
+        func: Callable[[AsyncClient, str], Awaitable[int]],
+    ) -> dict[str, int]:
+        """Run a coroutine for each item on a new event loop, sharing one client.
+
+        Args:
+            items (list[str]): The items to process.
+            func (Callable): The coroutine function to run for each item. It should
+            limit itself with the client's semaphore, handle its own errors, and
+            return 0 if successful, 1 if not.
+
+        Returns:
+            dict[str, int]: The result for each item.
+        """
+        if not items:
+            return {}
+        http_spec = self.spec["protocol"].get("http", {})
+
+        async def run_all() -> dict[str, int]:
+            async with AsyncClient(
+                http_spec.get("asyncConcurrency", DEFAULT_ASYNC_CONCURRENCY),
+                self.timeout,
+                lambda stale_token: get_access_token(
+                    self.spec["protocol"],
+                    stale_token=stale_token,
+                    metrics=self.metrics,
+                ),
+                http_spec.get("retries", DEFAULT_RETRIES),
+                self._backoff_factor(),
+                metrics=self.metrics,
+                limiter=self.limiter,
+            ) as client:
+                results = await asyncio.gather(*(func(client, item) for item in items))
+            return dict(zip(items, results))
+
+        return asyncio.run(run_all())
+
+    def _download_failed(self, file: str, status_code: int) -> bool:
+        """Log the reason a download request failed.
+
+        An object that's not found is removed from the listing index, so it's not
+        returned by the next listing.
+
+        Args:
+            file (str): The name of the object.
+            status_code (int): The status code of the response.
+
+        Returns:
+            bool: True if the request failed.
+        """
+        if status_code == 401:
+            self.logger.error(f"Unauthorized to GET file: {file}")
+            return True
+        if status_code == 403:
+            self.logger.error(f"Failed to GET file: {file}")
+            self.logger.error(f"Forbidden Status Code: {status_code}")
+            return True
+        if not 200 <= status_code < 300:
+            self.logger.error(f"Failed to GET file: {file}")
+            self.logger.error(f"Got return code: {status_code}")
+            if status_code == 404:
+                self._forget_objects([file])
+            return True
+        return False
+
+    def _download_sink(
+        self, local_file: str, headers: Mapping[str, str], remote_file: dict | None
+    ) -> "_DownloadSink":
+        """Prepare to write a download, from the headers of its response.
+
+        Args:
+            local_file (str): The path to download the object to.
+            headers (Mapping[str, str]): The response headers.
+            remote_file (dict | None): The details of the object from list_files, if
+            known.
+
+        Returns:
+            _DownloadSink: The sink to write the response body to.
+        """
+        return _DownloadSink(local_file, *self._download_checks(headers, remote_file))
+
+    def _download_checks(
+        self, headers: Mapping[str, str], remote_file: dict | None
+    ) -> tuple[dict[str, str], GzipDecoder | None]:
+        """Decide how to check and decode a download, from the headers of its response.
+
+        Args:
+            headers (Mapping[str, str]): The response headers.
+            remote_file (dict | None): The details of the object from list_files, if
+            known.
+
+        Returns:
+            tuple[dict[str, str], GzipDecoder | None]: The hashes the body must match
+            (empty if it can't or shouldn't be checked), and the decoder to decompress
+            it with, if it needs decompressing.
+        """
+        download_spec = self.spec.get("download", {})
+        stored_encoding = headers.get("x-goog-stored-content-encoding") or "identity"
+        served_encoding = headers.get("Content-Encoding") or "identity"
+        # The checksum is calculated over the bytes as they're received. The hashes
+        # from the listing are used if there are any, so an object that's been
+        # replaced since it was listed isn't accepted. If GCS has decompressed an
+        # object stored gzipped, it can't be checked
+        expected_hashes = {}
+        if download_spec.get("verify", True) and served_encoding == stored_encoding:
+            expected_hashes = object_hashes(remote_file) or parse_goog_hash(
+                headers.get("x-goog-hash")
+            )
+        if expected_hashes and not fast_hash_available(expected_hashes):
+            self.logger.warning(SLOW_CRC32C_WARNING)
+            expected_hashes = {}
+        # Gzipped objects are decompressed as they're written, unless the compressed
+        # bytes are wanted as they're stored
+        decoder = None
+        if served_encoding == "gzip" and (
+            download_spec.get("decompress", True) or stored_encoding != "gzip"
+        ):
+            decoder = GzipDecoder()
+        return expected_hashes, decoder
+
+    def _sliced_download(self, file: str, local_file: str, metadata: dict) -> int:
+        """Download an object as byte ranges in parallel, written straight into place.
+
+        The local file is preallocated, and each slice is written at its own offset as
+        it arrives. Failed slices are retried on their own. Unless download.verify is
+        false, the CRC32C of each slice is calculated as it's written, and the combined
+        checksum is compared against the object before the file is renamed into place.
+
+        Args:
+            file (str): The name of the object to download.
+            local_file (str): The path to download the object to.
+            metadata (dict): The object's metadata.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        download_spec = self.spec["download"]
+        sliced_spec = download_spec["sliced"]
+        chunk_size = download_spec.get("chunkSize", DEFAULT_DOWNLOAD_CHUNK_SIZE)
+        attempts = sliced_spec.get("attempts", DEFAULT_SLICE_ATTEMPTS)
+        size = int(metadata["size"])
+        slice_count = min(sliced_spec.get("slices", DEFAULT_SLICES), size)
+        slice_size = -(-size // slice_count)
+        slice_count = -(-size // slice_size)
+        concurrency = sliced_spec.get("concurrency", slice_count)
+        slices = [
+            (i * slice_size, min(slice_size, size - i * slice_size))
+            for i in range(slice_count)
+        ]
+        slice_checksums: dict[int, int] = {}
+        verify = download_spec.get("verify", True)
+        if verify and not fast_hash_available(object_hashes(metadata)):
+            self.logger.warning(SLOW_CRC32C_WARNING)
+            verify = False
+        # Without the C CRC32C implementation it's far quicker to MD5 the file once
+        # it's complete, if the object has an MD5 (composite objects don't)
+        use_crc32c = verify and (FAST_CRC32C or "md5Hash" not in metadata)
+        url = f"{self.storage_url}/download/storage/v1/b/{self.spec['bucket']}/o/{file.replace('/', '%2F')}"
+
+        local_directory, local_name = os.path.split(local_file)
+        fd, temp_file = tempfile.mkstemp(
+            dir=local_directory, prefix=f".{local_name}.", suffix=".part"
+        )
+
+        def download_slice(slice_: tuple[int, int]) -> int:
+            offset, length = slice_
+            for attempt in range(attempts + 1):
+                if attempt:
+                    time.sleep(self._backoff(attempt))
+                try:
+                    # Pin the generation, so every slice comes from the same version
+                    with self._request(
+                        "GET",
+                        url,
+                        retried=attempt > 0,
+                        params={"alt": "media", "generation": metadata["generation"]},
+                        headers={
+                            "Range": f"bytes={offset}-{offset + length - 1}",
+                            "Accept-Encoding": "identity",
+                        },
+                        stream=True,
+                    ) as response:
+                        if response.status_code != 206:
+                            self.logger.warning(
+                                f"Slice at {offset} of {file} got return code:"
+                                f" {response.status_code}"
+                            )
+                            if response.status_code in RETRY_STATUSES:
+                                continue
+                            return 1
+                        checksum = 0
+                        position = offset
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            os.pwrite(fd, chunk, position)
+                            position += len(chunk)
+                            if use_crc32c:
+                                checksum = crc32c_extend(checksum, chunk)
+                except requests.RequestException as e:
+                    self.logger.warning(f"Slice at {offset} of {file} failed: {e}")
+                    continue
+                if position != offset + length:
+                    self.logger.warning(f"Slice at {offset} of {file} was truncated")
+                    continue
+                slice_checksums[offset] = checksum
+                return 0
+            self.logger.error(f"Failed to download slice at {offset} of {file}")
+            return 1
+
+        self.logger.info(
+            f"Downloading {file} as {slice_count} slices of up to {slice_size} bytes"
+        )
+        try:
+            # The descriptor is closed exactly once, however the download ends
+            with os.fdopen(fd, "r+b"):
+                os.ftruncate(fd, size)
+                results = run_concurrently(download_slice, slices, concurrency)
+                if any(results.values()):
+                    raise RemoteTransferError(
+                        f"Failed to download all slices of {file}"
+                    )
+
+                if use_crc32c:
+                    actual_checksum = 0
+                    for offset, length in slices:
+                        actual_checksum = crc32c_combine(
+                            actual_checksum, slice_checksums[offset], length
+                        )
+                    matches = actual_checksum == crc32c_from_base64(metadata["crc32c"])
+                elif verify:
+                    md5 = hashlib.md5(usedforsecurity=False)
+                    position = 0
+                    while chunk := os.pread(fd, chunk_size, position):
+                        md5.update(chunk)
+                        position += len(chunk)
+                    matches = md5.digest() == base64.b64decode(metadata["md5Hash"])
+                else:
+                    matches = True
+                if not matches:
+                    raise RemoteTransferError(f"Checksum of {file} doesn't match")
+
+            os.replace(temp_file, local_file)
+        except BaseException as e:
+            os.remove(temp_file)
+            if isinstance(e, RemoteTransferError):
+                self.logger.error(e)
+                return 1
+            raise
+
+        self.logger.info(f"Successfully downloaded {file} to local Staging directory")
+        return 0
+
+    def transfer_files(
+        self,
+        files: list[str] | dict,
+        remote_spec: dict,
+        dest_remote_handler: RemoteTransferHandler,
+    ) -> int:
+        """Copy files straight from this bucket into the destination.
+
+        Objects are copied server-side into another bucket. Any other handler with an
+        upload_stream(stream, file_name) method is sent each object as a stream,
+        without it being staged on the worker.
+
+        Args:
+            files (list[str]): The objects to copy, or the dict returned by list_files.
+            remote_spec (dict): The destination spec.
+            dest_remote_handler (RemoteTransferHandler): The destination's handler,
+            which decides the name of each copy.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        if not isinstance(dest_remote_handler, BucketTransfer):
+            if callable(getattr(dest_remote_handler, "upload_stream", None)):
+                return self._stream_files(files, dest_remote_handler)
+            self.logger.error(
+                "Direct transfers are only supported between buckets, or to handlers"
+                " with upload_stream"
+            )
+            return 1
+
+        if upload_options := self._uncopyable_upload_options(remote_spec):
+            self.logger.info(
+                "Copying via the worker, as a server-side copy can't honour the"
+                f" destination's upload settings: {', '.join(upload_options)}"
+            )
+            return self._transfer_via_worker(files, dest_remote_handler)
+        return self._copy_between_buckets(
+            list(files), self.spec["bucket"], dest_remote_handler
+        )
+
+    @staticmethod
+    def _uncopyable_upload_options(destination_spec: dict) -> list[str]:
+        """Get the upload settings of a destination that a server-side copy ignores.
+
+        Args:
+            destination_spec (dict): The destination spec.
+
+        Returns:
+            list[str]: The names of the settings, empty if the objects can be copied.
+        """
+        return sorted(set(destination_spec.get("upload", {})) - REWRITE_UPLOAD_OPTIONS)
+
+    def _transfer_via_worker(
+        self, files: list[str] | dict, dest_remote_handler: "BucketTransfer"
+    ) -> int:
+        """Download objects to a temporary directory, and upload them from there.
+
+        Args:
+            files (list | dict): The objects to transfer, or the dict returned by
+            list_files.
+            dest_remote_handler (BucketTransfer): The handler for the destination
+            bucket.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        with tempfile.TemporaryDirectory() as staging_directory:
+            if self.pull_files_to_worker(files, staging_directory) != 0:
+                return 1
+            return dest_remote_handler.push_files_from_worker(staging_directory)
+
+    def _stream_files(
+        self, files: list[str] | dict, dest_remote_handler: RemoteTransferHandler
+    ) -> int:
+        """Stream objects to another handler's upload_stream, download.concurrency at once.
+
+        Args:
+            files (list | dict): The objects to send, or the dict returned by
+            list_files.
+            dest_remote_handler (RemoteTransferHandler): The handler to send them to.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        remote_files = files if isinstance(files, dict) else {}
+        upload_stream = getattr(dest_remote_handler, "upload_stream")
+
+        def send(file: str) -> int:
+            try:
+                with closing(self.iter_object(file, remote_files.get(file))) as chunks:
+                    return int(upload_stream(chunks, file.split("/")[-1]))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.logger.error(f"Failed to stream file: {file}")
+                self.logger.exception(e)
+                return 1
+
+        results = run_concurrently(
+            send, list(files), self.spec.get("download", {}).get("concurrency", 1)
+        )
+        failed_files = [file for file, result in results.items() if result != 0]
+        if failed_files:
+            self.logger.error(
+                f"Failed to stream {len(failed_files)} of {len(results)} files:"
+                f" {failed_files}"
+            )
+            return 1
+        self.logger.info(f"Streamed {len(results)} files from GCP")
+        return 0
+
+    def _copy_between_buckets(
+        self,
+        files: list[str],
+        source_bucket: str,
+        destination_handler: "BucketTransfer",
+    ) -> int:
+        """Copy objects server-side from one bucket to another.
+
+        Each copy is named the same way as an upload of the file to the destination
+        would be, with any rename and directory applied to the object's file name. The
+        copies are made in batches of up to MAX_BATCH_SIZE, using this handler's
+        credentials, which need access to both buckets.
+
+        Args:
+            files (list[str]): The objects to copy.
+            source_bucket (str): The bucket to copy from.
+            destination_handler (BucketTransfer): The handler for the destination
+            bucket.
+
+        Returns:
+            int: 0 if successful, 1 if not.
+        """
+        destination_bucket = destination_handler.spec["bucket"]
+        destinations = {
+            file: destination_handler.destination_name(file) for file in files
+        }
+        outcomes: dict[str, str | None] = {}
+        for start in range(0, len(files), MAX_BATCH_SIZE):
+            outcomes.update(
+                self._copy_objects(
+                    files[start : start + MAX_BATCH_SIZE],
+                    source_bucket,
+                    destination_bucket,
+                    destinations,
+                )
+            )
+
+        failures = {file: error for file, error in outcomes.items() if error}
+        if failures:
+            self.logger.error(
+                f"Failed to copy {len(failures)} of {len(files)} files to"
+                f" {destination_bucket}"
+            )
+            for file, error in failures.items():
+                self.logger.error(f"{file}: {error}")
+            return 1
+        for file in files:
+            self.logger.info(
+                f"Copied {source_bucket}/{file} to"
+                f" {destination_bucket}/{destinations[file]}"
+            )
+        self.logger.info(f"Copied {len(files)} files to {destination_bucket}")
+        return 0
+
+    def create_flag_files(self) -> int:
+        """Not implemented for this transfer type."""
+        raise NotImplementedError
+
+    def list_files(
+        self, directory: str | None = None, file_pattern: str | None = None
+    ) -> dict:
+        """List Files in GCP with pagination and local regex matching.
+
+        If fileWatch.pubsub is set, the file watch is driven by bucket notifications
+        instead. The first call reconciles with a normal listing, to find files that
+        arrived before the watch started, and later calls wait for notifications of
+        new matching objects. Once files have been found, listings are made as normal.
+
+        Args:
+            directory (str): A directory to list on the bucket.
+            file_pattern (str): File pattern to match files.
+
+        Returns:
+            dict: A dict of filenames if successful, an empty list if not.
+        """
+        pubsub_spec = self.spec.get("fileWatch", {}).get("pubsub")
+        if not pubsub_spec or self.watch_complete:
+            return self._list_files(directory, file_pattern)
+
+        if not self.watch_reconciled:
+            remote_files = self._list_files(directory, file_pattern)
+            self.watch_reconciled = True
+        else:
+            remote_files = self._watch_notifications(
+                directory, file_pattern, pubsub_spec
+            )
+        self.watch_complete = bool(remote_files)
+        return remote_files
+
+    def _watch_notifications(
+        self, directory: str | None, file_pattern: str | None, pubsub_spec: dict
+    ) -> dict:
+        """Wait for notifications of new objects matching the file watch.
+
+        Messages are pulled from the Pub/Sub subscription, waiting up to pullTimeout
+        seconds for them to arrive, and are all acknowledged. Matching objects are
+        checked to still exist before they are returned.
+
+        Args:
+            directory (str): The directory being watched.
+            file_pattern (str): The file pattern being watched for.
+            pubsub_spec (dict): The fileWatch pubsub settings.
+
+        Returns:
+            dict: The matching objects, in the same form as list_files.
+        """
+        prefix = directory or self.spec.get("directory", "")
+        recursive = self.spec.get("recursive", True)
+        if not recursive and prefix and not prefix.endswith("/"):
+            prefix = f"{prefix}/"
+        file_regex = re.compile(file_pattern) if file_pattern else None
+
+        found: list[str] = []
+        messages = self._pull_notifications(pubsub_spec)
+        for message in messages:
+            attributes = message.get("message", {}).get("attributes", {})
+            name = attributes.get("objectId", "")
+            if (
+                attributes.get("bucketId") != self.spec["bucket"]
+                or not name.startswith(prefix)
+                or (not recursive and "/" in name[len(prefix) :])
+                or (file_regex and not file_regex.match(name.split("/")[-1]))
+            ):
+                continue
+            if attributes.get("eventType") == "OBJECT_FINALIZE":
+                if name not in found:
+                    found.append(name)
+            elif name in found:
+                # Deleted or replaced (archived) again since it was created
+                found.remove(name)
+
+        if messages:
+            self._acknowledge_notifications(
+                pubsub_spec, [message["ackId"] for message in messages]
+            )
+
+        remote_files = {}
+        for name in found:
+            response = self._request_with_retries(
+                "GET",
+                f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o/{quote(name, safe='')}",
+            )
+            if response.ok:
+                metadata = response.json()
+                remote_files[name] = {
+                    "size": metadata["size"],
+                    "modified_time": metadata["updated"],
+                }
+        return remote_files
+
+    def _pull_notifications(self, pubsub_spec: dict) -> list[dict]:
+        """Pull messages from the fileWatch Pub/Sub subscription.
+
+        Args:
+            pubsub_spec (dict): The fileWatch pubsub settings.
+
+        Returns:
+            list[dict]: The received messages, empty if there were none, or the pull
+            failed.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        try:
+            response = self._request(
+                "POST",
+                f"{self.pubsub_url}/v1/{pubsub_spec['subscription']}:pull",
+                json={
+                    "maxMessages": pubsub_spec.get(
+                        "maxMessages", DEFAULT_PUBSUB_MAX_MESSAGES
+                    )
+                },
+                timeout=(
+                    self.timeout[0],
+                    pubsub_spec.get("pullTimeout", DEFAULT_PUBSUB_PULL_TIMEOUT),
+                ),
+            )
+        except requests.Timeout:
+            # Nothing arrived while waiting
+            return []
+        except requests.RequestException as e:
+            self.logger.warning(f"Failed to pull notifications: {e}")
+            return []
+        if response.status_code == 401:
+            self.credentials = get_access_token(
+                self.spec["protocol"],
+                stale_token=self.credentials,
+                metrics=self.metrics,
+            )
+        if not response.ok:
+            self.logger.warning(
+                f"Failed to pull notifications. Got return code: {response.status_code}"
+            )
+            return []
+        return list(response.json().get("receivedMessages", []))
+
+    def _acknowledge_notifications(self, pubsub_spec: dict, ack_ids: list[str]) -> None:
+        """Acknowledge messages pulled from the fileWatch Pub/Sub subscription.
+
+        Args:
+            pubsub_spec (dict): The fileWatch pubsub settings.
+            ack_ids (list[str]): The ackIds of the messages.
+        """
+        try:
+            response = self._request(
+                "POST",
+                f"{self.pubsub_url}/v1/{pubsub_spec['subscription']}:acknowledge",
+                json={"ackIds": ack_ids},
+            )
+            if not response.ok:
+                self.logger.warning(
+                    "Failed to acknowledge notifications. Got return code:"
+                    f" {response.status_code}"
+                )
+        except requests.RequestException as e:
+            self.logger.warning(f"Failed to acknowledge notifications: {e}")
+
+    def _list_files(self, directory: str | None, file_pattern: str | None) -> dict:
+        """List the objects in the bucket matching a directory and file pattern.
+
+        Args:
+            directory (str): A directory to list on the bucket.
+            file_pattern (str): File pattern to match files.
+
+        Returns:
+            dict: A dict of filenames if successful, an empty list if not.
+        """
+        self.logger.info("Listing Files in Bucket.")
+        try:
+            return {
+                info.name: info.listing()
+                for info in self.iter_files(directory, file_pattern)
+            }
+        except Exception as e:
+            self.logger.error(
+                "Error listing files in directory"
+                f" {self.spec['bucket']}/{directory or self.spec.get('directory', '')}"
+            )
+            self.logger.exception(e)
+            return {}
+
+    def iter_files(
+        self, directory: str | None = None, file_pattern: str | None = None
+    ) -> Iterator[ObjectInfo]:
+        """List the objects matching a directory and file pattern, as they arrive.
+
+        Objects are yielded page by page, so the first can be used (e.g. passed
+        straight to pull_files_to_worker) while later pages are still being listed,
+        and memory use doesn't grow with the size of the listing. Unlike list_files,
+        errors are raised rather than logged.
+
+        Args:
+            directory (str, optional): A directory to list on the bucket. Defaults to
+            the directory of the spec.
+            file_pattern (str, optional): A regex the file names must match. Defaults
+            to None.
+
+        Yields:
+            ObjectInfo: The details of each matching object.
+        """
+        self.validate_or_refresh_creds()  # refresh creds
+        directory = directory or self.spec.get("directory", "")
+
+        base_url = f"{self.storage_url}/storage/v1/b/{self.spec['bucket']}/o"
+        params = {
+            "prefix": directory,
+            "maxResults": MAX_OBJECTS_PER_QUERY,
+            # Only fetch the fields that are actually used
+            "fields": f"nextPageToken,items({','.join(LIST_FIELDS)})",
+        }
+        if not self.spec.get("recursive", True):
+            # Only list objects directly within the directory
+            if directory and not directory.endswith("/"):
+                params["prefix"] = f"{directory}/"
+            params["delimiter"] = "/"
+
+        # Let GCS do as much of the filtering as possible
+        match_glob = regex_to_match_glob(file_pattern)
+        if match_glob:
+            params["matchGlob"] = match_glob
+        file_regex = re.compile(file_pattern) if file_pattern else None
+
+        index_spec = self.spec.get("fileWatch", {}).get("index")
+        if index_spec:
+            items = self._indexed_listing(base_url, params, index_spec)
+        else:
+            items = self._iter_listing(base_url, params)
+
+        for item in items:
+            file_name = item["name"].split("/")[-1]
+            if not file_regex or file_regex.match(file_name):
+                yield ObjectInfo.from_resource(item)
+
+    def _iter_listing(self, base_url: str, params: dict) -> Iterator[dict]:
+        """List objects, one page at a time.
+
+        Args:
+            base_url (str): The URL of the objects collection.
+            params (dict): The query parameters for the listing.
+
+        Yields:
+            dict: The metadata of each object.
+        """
+        params = dict(params)
+        while True:
+            data = self._list_page(base_url, params)
+            yield from data.get("items", [])
+
+            if "nextPageToken" in data:
+                # Set the nextPageToken for the next request
+                params["pageToken"] = data["nextPageToken"]
+            else:
+                break
+
+    def _indexed_listing(
+        self, base_url: str, params: dict, index_spec: dict
+    ) -> Iterator[dict]:
+        """List objects using the local listing index.
+
+        The whole listing is fetched the first time, and again every rescanInterval
+        seconds, to pick up objects that have been deleted, overwritten or created with
+        a name that sorts before the last one seen. Other listings only fetch objects
+        whose names sort at or after the last name seen, and add them to the index.
+
+        Args:
+            base_url (str): The URL of the objects collection.
+            params (dict): The query parameters for the listing.
+            index_spec (dict): The fileWatch index settings.
+
+        Returns:
+            Iterator[dict]: The metadata of each object in the index.
+        """
+        index = get_listing_index(index_spec["path"])
+        key = listing_key(
+            self.spec["bucket"],
+            params["prefix"],
+            params.get("delimiter"),
+            params.get("matchGlob"),
+        )
+        params = {
+            **params,
+            "fields": f"nextPageToken,items({','.join([*LIST_FIELDS, 'generation'])})",
+        }
+
+        state = index.state(key)
+        now = time.time()
+        rescan_interval = index_spec.get("rescanInterval", DEFAULT_RESCAN_INTERVAL)
+        if state is None or now - state.last_full_scan >= rescan_interval:
+            self.logger.info("Rescanning the whole listing into the index")
+            index.full_scan(key, self._iter_listing(base_url, params), now)
+        else:
+            self.logger.info(f"Listing objects from {state.high_water} onwards")
+            index.update(
+                key,
+                self._iter_listing(
+                    base_url, {**params, "startOffset": state.high_water}
+                ),
+            )
+        return index.objects(key)
+
+    def _list_page(self, base_url: str, params: dict) -> dict:
+        """Fetch a single page of a listing, retrying if it fails.
+
+        Throttling (429), server errors and connection errors are retried with
+        exponential backoff and jitter, honouring any Retry-After header, up to
+        DEFAULT_LIST_ATTEMPTS times. A 401 refreshes the access token once before the
+        page is requested again.
+
+        Args:
+            base_url (str): The URL of the objects collection.
+            params (dict): The query parameters for the page.
+
+        Returns:
+            dict: The decoded response.
+
+        Raises:
+            RemoteTransferError: If the page can't be listed.
+        """
+        refreshed = False
+        attempt = 0
+        while True:
+            response: requests.Response | None = None
+            try:
+                response = self._request(
+                    "GET", base_url, retried=attempt > 0, params=params
+                )
+            except requests.RequestException as e:
+                self.logger.warning(f"List files failed: {e}")
+
+            if response is not None and response.status_code == 200:
+                return dict(response.json())
+
+            if response is not None and response.status_code == 401 and not refreshed:
+                # The token may have been revoked or expired early, so get a new one
+                self.logger.warning("List files returned 401, refreshing access token")
+                self.credentials = get_access_token(
+                    self.spec["protocol"],
+                    stale_token=self.credentials,
+                    metrics=self.metrics,
+                )
+                refreshed = True
+                continue
+
+            attempt += 1
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                raise RemoteTransferError(
+                    f"List files returned {response.status_code}: {response.text}"
+                )
+            if attempt >= DEFAULT_LIST_ATTEMPTS:
+                raise RemoteTransferError(f"List files failed after {attempt} attempts")
+
+            delay = backoff_delay(attempt - 1, self._backoff_factor(), response)
+            self.logger.warning(
+                f"List files returned {getattr(response, 'status_code', None)}, retrying"
+                f" in {delay:.1f}s (attempt {attempt} of {DEFAULT_LIST_ATTEMPTS})"
+            )
+            time.sleep(delay)
+
+    def tidy(self) -> None:
+        """Log a summary of the requests made during the task."""
+        if not self.spec["protocol"].get("metrics", {}).get("summary", True):
+            return
+        if self.limiter is not None:
+            self.logger.info(
+                f"Metrics: adaptive concurrency limit for {self.spec['bucket']} is"
+                f" {self.limiter.concurrency}, after {self.limiter.throttle_count}"
+                " throttled requests in this process"
+            )
+        for line in self.metrics.summary():
+            self.logger.info(f"Metrics: {line}")
+
+
+class _FileSlice:
+    """A read-only view of a byte range of an open file.
+
+    Used as a request body, so a part of a file can be streamed without reading it all
+    into memory. The data is added to the checksum, if there is one, as it's read.
+    """
+
+    def __init__(
+        self,
+        file_data: IO[bytes],
+        offset: int,
+        length: int,
+        checksum: StreamingHash | None = None,
+    ):
+        self._file_data = file_data
+        self._file_data.seek(offset)
+        self._length = length
+        self._remaining = length
+        self.checksum = checksum
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes from the slice."""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file_data.read(size)
+        self._remaining -= len(data)
+        if self.checksum is not None:
+            self.checksum.update(data)
+        return data
+
+
+class _ChunkReader(io.RawIOBase):
+    """A readable, unseekable raw file over an iterator of chunks.
+
+    Only the current chunk is held in memory. Closing the file closes the iterator.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        super().__init__()
+        self._chunks = chunks
+        self._chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed and hasattr(self._chunks, "close"):
+            self._chunks.close()
+        super().close()
+
+
+class _DownloadSink:
+    """Writes a download to a hidden temporary file, then renames it into place.
+
+    The temporary file is in the same directory, so the final rename is atomic and the
+    partial file isn't picked up by a later glob. The checksum is calculated, and any
+    decompression done, as each chunk is written.
+    """
+
+    def __init__(
+        self,
+        local_file: str,
+        expected_hashes: dict[str, str],
+        decoder: GzipDecoder | None,
+    ):
+        self.local_file = local_file
+        self.expected_hashes = expected_hashes
+        self.checksum = StreamingHash.for_expected(expected_hashes)
+        self.decoder = decoder
+        directory, name = os.path.split(local_file)
+        fd, self.temp_file = tempfile.mkstemp(
+            dir=directory, prefix=f".{name}.", suffix=".part"
+        )
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        """Write the next chunk of the response body."""
+        self._file.write(self.decoder.decompress(chunk) if self.decoder else chunk)
+        if self.checksum:
+            self.checksum.update(chunk)
+
+    def commit(self) -> str | None:
+        """Finish the download, and rename it into place if its checksum matches.
+
+        Returns:
+            str | None: The reason the download was rejected, or None if it wasn't.
+        """
+        self._file.close()
+        if self.decoder:
+            self.decoder.finish()
+        if self.checksum and not self.checksum.matches(self.expected_hashes):
+            error = (
+                "Checksum of downloaded file doesn't match. Expected"
+                f" {self.checksum.algorithm}"
+                f" {self.expected_hashes[self.checksum.algorithm]}, got"
+                f" {self.checksum.digest()}"
+            )
+            self.discard()
+            return error
+        os.replace(self.temp_file, self.local_file)
+        return None
+
+    def discard(self) -> None:
+        """Remove the temporary file."""
+        self._file.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+
+def _listed_names(objects: Iterable[ObjectInfo], listing: dict) -> Iterator[str]:
+    """Get the name of each object as it's listed, and add its details to listing."""
+    for info in objects:
+        listing[info.name] = info.listing()
+        yield info.name
+
+
+def _body_size(data: Any) -> int:
+    """Get the number of bytes a request body will send, if it's known up front."""
+    if isinstance(data, (bytes, _FileSlice)):
+        return len(data)
+    if hasattr(data, "fileno"):
+        return int(os.fstat(data.fileno()).st_size - data.tell())
+    return 0
+
+
+def _committed_offset(response: requests.Response) -> int:
+    """Get the offset of the next byte GCS expects from a resumable upload response.
+
+    Args:
+        response (requests.Response): A 308 response to a resumable upload request.
+
+    Returns:
+        int: The number of bytes GCS has committed.
+    """
+    # Range is in the form "bytes=0-1234", and is absent if nothing is committed yet
+    committed_range = response.headers.get("Range")
+    if not committed_range:
+        return 0
+    return int(committed_range.split("-")[-1]) + 1
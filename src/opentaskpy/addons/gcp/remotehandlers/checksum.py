@@ -0,0 +1,221 @@
+"""CRC32C checksums, as used by GCS to verify object content.
+
+The C implementation from google-crc32c is used when it's installed, otherwise this
+falls back to a (much slower) pure Python implementation.
+"""
+
+import base64
+import hashlib
+
+try:
+    import google_crc32c
+
+    FAST_CRC32C = google_crc32c.implementation == "c"
+except ImportError:  # pragma: no cover
+    google_crc32c = None
+    FAST_CRC32C = False
+
+# Reversed CRC-32C (Castagnoli) polynomial
+CRC32C_POLY = 0x82F63B78
+
+
+def _make_table() -> list[int]:
+    table = []
+    for n in range(256):
+        crc = n
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC32C_POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_TABLE = _make_table()
+
+
+def crc32c_extend(crc: int, data: bytes) -> int:
+    """Extend a CRC32C checksum with more data.
+
+    Args:
+        crc (int): The checksum of the data so far (0 to start).
+        data (bytes): The data to add.
+
+    Returns:
+        int: The checksum including the new data.
+    """
+    if google_crc32c is not None:
+        return int(google_crc32c.extend(crc, data))
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc = _TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def _gf2_matrix_times(matrix: list[int], vector: int) -> int:
+    total = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return total
+
+
+def _gf2_matrix_square(matrix: list[int]) -> list[int]:
+    return [_gf2_matrix_times(matrix, matrix[n]) for n in range(32)]
+
+
+def crc32c_combine(crc1: int, crc2: int, length2: int) -> int:
+    """Combine the checksums of two consecutive blocks of data.
+
+    This is the same algorithm as zlib's crc32_combine, and gives the checksum GCS
+    calculates for a composed object from the checksums of its components.
+
+    Args:
+        crc1 (int): The checksum of the first block.
+        crc2 (int): The checksum of the second block.
+        length2 (int): The length of the second block in bytes.
+
+    Returns:
+        int: The checksum of the two blocks concatenated.
+    """
+    if length2 <= 0:
+        return crc1
+
+    # Operator for a single zero bit, then 2 and 4 zero bits
+    odd = [CRC32C_POLY] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+
+    # Apply length2 zero bytes to crc1, squaring the operator for each bit of length2
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+def crc32c_to_base64(crc: int) -> str:
+    """Encode a checksum in the big-endian base64 form used by the GCS API."""
+    return base64.b64encode(crc.to_bytes(4, "big")).decode()
+
+
+def crc32c_from_base64(value: str) -> int:
+    """Decode a checksum from the big-endian base64 form used by the GCS API."""
+    return int.from_bytes(base64.b64decode(value), "big")
+
+
+class StreamingHash:
+    """A CRC32C or MD5 hash of data, calculated as it's streamed.
+
+    CRC32C is used if the C implementation is available, otherwise MD5 (which hashlib
+    always implements in C) is used instead.
+    """
+
+    def __init__(self, algorithm: str | None = None):
+        """Start a new hash.
+
+        Args:
+            algorithm (str, optional): Either "crc32c" or "md5". Defaults to the
+            fastest available.
+        """
+        self.algorithm = algorithm or ("crc32c" if FAST_CRC32C else "md5")
+        self._crc = 0
+        self._md5 = (
+            hashlib.md5(usedforsecurity=False) if self.algorithm == "md5" else None
+        )
+
+    @classmethod
+    def for_expected(cls, expected: dict[str, str]) -> "StreamingHash | None":
+        """Start a hash that can be compared against one of the expected hashes.
+
+        Args:
+            expected (dict[str, str]): The expected hashes, as returned by
+            object_hashes or parse_goog_hash.
+
+        Returns:
+            StreamingHash | None: The hash, or None if there's nothing to compare with.
+        """
+        if "crc32c" in expected and (FAST_CRC32C or "md5" not in expected):
+            return cls("crc32c")
+        if "md5" in expected:
+            return cls("md5")
+        return None
+
+    def update(self, data: bytes) -> None:
+        """Add more data to the hash."""
+        if self._md5 is not None:
+            self._md5.update(data)
+        else:
+            self._crc = crc32c_extend(self._crc, data)
+
+    def digest(self) -> str:
+        """Return the hash in the base64 form used by the GCS API."""
+        if self._md5 is not None:
+            return base64.b64encode(self._md5.digest()).decode()
+        return crc32c_to_base64(self._crc)
+
+    def header(self) -> str:
+        """Return the hash as an X-Goog-Hash header value."""
+        return f"{self.algorithm}={self.digest()}"
+
+    def matches(self, expected: dict[str, str]) -> bool:
+        """Check the hash against the expected hash for the same algorithm."""
+        return expected.get(self.algorithm) == self.digest()
+
+
+def object_hashes(metadata: dict | None) -> dict[str, str]:
+    """Get the hashes from an object's metadata.
+
+    Args:
+        metadata (dict | None): The object resource, or the details from list_files.
+
+    Returns:
+        dict[str, str]: The base64 hashes, keyed on "crc32c" and "md5".
+    """
+    metadata = metadata or {}
+    hashes = {"crc32c": metadata.get("crc32c"), "md5": metadata.get("md5Hash")}
+    return {algorithm: value for algorithm, value in hashes.items() if value}
+
+
+def fast_hash_available(expected: dict[str, str]) -> bool:
+    """Check whether one of the expected hashes can be calculated quickly.
+
+    MD5 always can. CRC32C only can with the C implementation, so an object that only
+    has a CRC32C (e.g. a composite object) can't without it.
+
+    Args:
+        expected (dict[str, str]): The expected hashes, as returned by object_hashes
+        or parse_goog_hash.
+
+    Returns:
+        bool: True if there's a hash that can be calculated quickly.
+    """
+    return "md5" in expected or ("crc32c" in expected and FAST_CRC32C)
+
+
+def parse_goog_hash(header: str | None) -> dict[str, str]:
+    """Parse an X-Goog-Hash header, e.g. "crc32c=n03x6A==,md5=Ojk9c3dhfxgoKVVHYwFbHQ==".
+
+    Args:
+        header (str | None): The header value.
+
+    Returns:
+        dict[str, str]: The base64 hashes, keyed on "crc32c" and "md5".
+    """
+    hashes = {}
+    for value in (header or "").split(","):
+        algorithm, _, digest = value.strip().partition("=")
+        if digest:
+            hashes[algorithm] = digest
+    return hashes
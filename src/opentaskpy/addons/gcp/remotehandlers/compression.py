@@ -0,0 +1,94 @@
+"""Streaming gzip compression, for objects stored with Content-Encoding: gzip.
+
+Compression is deterministic (the gzip header has no file name or modification time),
+so compressing the same file with the same level always gives the same bytes, and the
+same checksum.
+"""
+
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import IO
+
+DEFAULT_COMPRESSION_LEVEL = 6
+# Tells zlib to read and write a gzip header and trailer
+GZIP_WBITS = 31
+
+
+def gzip_chunks(
+    file_data: IO[bytes], chunk_size: int, level: int = DEFAULT_COMPRESSION_LEVEL
+) -> Iterator[bytes]:
+    """Gzip a file as it's read.
+
+    Args:
+        file_data (IO[bytes]): The file to compress.
+        chunk_size (int): The size of each read from the file.
+        level (int, optional): The compression level, from 1 (fastest) to 9 (smallest).
+        Defaults to DEFAULT_COMPRESSION_LEVEL.
+
+    Returns:
+        Iterator[bytes]: The compressed data, in chunks.
+    """
+    return gzip_stream(iter(lambda: file_data.read(chunk_size), b""), level)
+
+
+def gzip_stream(
+    chunks: Iterable[bytes], level: int = DEFAULT_COMPRESSION_LEVEL
+) -> Iterator[bytes]:
+    """Gzip a stream of chunks as they arrive.
+
+    Args:
+        chunks (Iterable[bytes]): The data to compress.
+        level (int, optional): The compression level, from 1 (fastest) to 9 (smallest).
+        Defaults to DEFAULT_COMPRESSION_LEVEL.
+
+    Yields:
+        bytes: The compressed data, in chunks.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
+
+
+class GzipDecoder:
+    """Decompress a gzip stream in chunks.
+
+    Streams with several gzip members one after the other (as produced by composing
+    gzipped objects) are decompressed as one.
+    """
+
+    def __init__(self) -> None:
+        """Start a new stream."""
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        self._in_member = False
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress the next chunk of the stream.
+
+        Args:
+            data (bytes): The compressed chunk.
+
+        Returns:
+            bytes: The decompressed data available so far.
+        """
+        output = []
+        while data:
+            self._in_member = True
+            output.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            # The rest of the chunk is the start of the next member
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(GZIP_WBITS)
+            self._in_member = False
+        return b"".join(output)
+
+    def finish(self) -> None:
+        """Check the stream is complete.
+
+        Raises:
+            ValueError: If the stream ended part way through a member.
+        """
+        if self._in_member:
+            raise ValueError("gzip stream is truncated")
@@ -0,0 +1,58 @@
+"""Helpers for running bucket operations concurrently."""
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def run_concurrently(
+    func: Callable[[T], int],
+    items: Iterable[T],
+    concurrency: int,
+    stop_on_error: bool = False,
+) -> dict[T, int]:
+    """Call func for each item using a bounded pool of worker threads.
+
+    Items are consumed lazily, and no more than twice the concurrency are queued at any
+    one time, so a long (or lazily generated) list of items doesn't build up a large
+    backlog of pending work.
+
+    Args:
+        func (Callable): The function to call for each item. It should handle its own
+        errors and return 0 if successful, 1 if not.
+        items (Iterable): The items to process.
+        concurrency (int): The maximum number of items to process at once.
+        stop_on_error (bool): Stop submitting new items once one has failed. Items
+        already in flight are allowed to finish. Defaults to False.
+
+    Returns:
+        dict: The result for each item that was processed, in the order they completed.
+    """
+    results: dict[T, int] = {}
+
+    if concurrency <= 1:
+        for item in items:
+            results[item] = func(item)
+            if stop_on_error and results[item] != 0:
+                break
+        return results
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight: dict[Future[int], T] = {}
+        failed = False
+        for item in items:
+            if len(in_flight) >= concurrency * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[in_flight.pop(future)] = future.result()
+                    failed = failed or future.result() != 0
+            if stop_on_error and failed:
+                break
+            in_flight[executor.submit(func, item)] = item
+
+        for future in wait(in_flight).done:
+            results[in_flight[future]] = future.result()
+
+    return results
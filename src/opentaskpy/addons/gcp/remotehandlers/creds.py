@@ -1,42 +1,120 @@
 """GCP helper functions."""
 
-from datetime import datetime, timedelta
+import hashlib
+import threading
+import time
+from datetime import UTC, datetime, timedelta
 
 import opentaskpy.otflogging
 from google.auth.transport.requests import Request
-from google.oauth2 import credentials, service_account
+from google.oauth2 import service_account
 from opentaskpy.exceptions import RemoteTransferError
 
+from .metrics import MetricEvent, Metrics
 
-def get_access_token(credentials_: dict) -> credentials:
+DEFAULT_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+# Tokens are refreshed once they are within this margin of expiring
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class _CachedCredentials:
+    """Service account credentials shared by every caller using the same identity."""
+
+    def __init__(self, auth_creds: service_account.Credentials):
+        self.auth_creds = auth_creds
+        # Held while refreshing, so concurrent callers wait for a single refresh
+        self.lock = threading.Lock()
+
+    def needs_refresh(self) -> bool:
+        """Return True if there is no token, or it is about to expire."""
+        if not self.auth_creds.token or self.auth_creds.expiry is None:
+            return True
+        # google-auth stores the expiry as a naive UTC datetime
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return bool(self.auth_creds.expiry - TOKEN_REFRESH_MARGIN <= now)
+
+
+_token_cache: dict[tuple, _CachedCredentials] = {}
+_token_cache_lock = threading.Lock()
+
+
+def _cache_key(credentials_: dict, scopes: tuple[str, ...]) -> tuple:
+    """Build the token cache key for a set of service account credentials."""
+    creds = credentials_["credentials"]
+    private_key_hash = hashlib.sha256(
+        str(creds.get("private_key", "")).encode()
+    ).hexdigest()
+    return (
+        creds.get("client_email"),
+        creds.get("token_uri"),
+        private_key_hash,
+        scopes,
+    )
+
+
+def _get_cached_credentials(
+    credentials_: dict, scopes: tuple[str, ...]
+) -> _CachedCredentials:
+    """Return the process-wide cache entry for these credentials, creating it if needed."""
+    key = _cache_key(credentials_, scopes)
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is None:
+            auth_creds = service_account.Credentials.from_service_account_info(
+                credentials_["credentials"], scopes=list(scopes)
+            )
+            cached = _CachedCredentials(auth_creds)
+            _token_cache[key] = cached
+        return cached
+
+
+def get_access_token(
+    credentials_: dict,
+    scopes: tuple[str, ...] = DEFAULT_SCOPES,
+    stale_token: str | None = None,
+    metrics: Metrics | None = None,
+) -> str | None:
     """Get an access token for GCP using the provided credentials.
 
+    Tokens are cached for the lifetime of the process, keyed on the service account
+    identity and scopes, and are only refreshed when they are close to expiring.
+
     Args:
         credentials_: The credentials Service Account object to use
+        scopes: The OAuth scopes to request the token for
+        stale_token: A token that was rejected by GCP. If it's still the cached token,
+        it is refreshed regardless of its expiry. If another caller has already
+        replaced it, the new token is returned without refreshing again.
+        metrics: Records how long the token took to refresh, if it was refreshed
     """
     logger = opentaskpy.otflogging.init_logging(__name__, None, None)
     try:
-        # Get an Access Token
-        logger.info("Retrieving credentials")
-        auth_creds = service_account.Credentials.from_service_account_info(
-            credentials_["credentials"],
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        # Check if the token needs to be refreshed
-        if (
-            auth_creds.expiry is None
-            or auth_creds.expired
-            or auth_creds.expiry > datetime.now() - timedelta(minutes=5)
-        ):
-            logger.info("Refreshing access token")
-            auth_creds.refresh(Request())  # Refreshing access token
-
-        if not auth_creds.token:  # Handle exception
+        cached = _get_cached_credentials(credentials_, scopes)
+        with cached.lock:
+            # Check if the token needs to be refreshed
+            if cached.needs_refresh() or (
+                stale_token is not None and cached.auth_creds.token == stale_token
+            ):
+                logger.info("Refreshing access token")
+                start = time.perf_counter()
+                cached.auth_creds.refresh(Request())  # Refreshing access token
+                if metrics:
+                    metrics.record(
+                        MetricEvent(
+                            "token_refresh", "token", time.perf_counter() - start
+                        )
+                    )
+            else:
+                logger.debug("Using cached access token")
+
+            token = cached.auth_creds.token
+
+        if not token:  # Handle exception
             logger.error("Error Retrieving credentials.")
             raise RemoteTransferError("Could not acquire token from GCP")
-        logger.info("Successfully generated access token")
-        return auth_creds.token  # Return the credentials (token).
+        return str(token)  # Return the credentials (token).
 
     except Exception as e:
         logger.error("Error generating access token")
         logger.exception(e)
+        return None
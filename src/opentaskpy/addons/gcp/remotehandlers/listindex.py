@@ -0,0 +1,203 @@
+"""A persistent local index of bucket listings, used to make repeated listings cheap.
+
+Each listing (the bucket, prefix, delimiter and matchGlob) is indexed separately. The
+first listing, and one every rescan interval after that, lists everything and replaces
+the index. In between, only objects whose names sort at or after the last name seen
+are listed (using startOffset), and added to the index. Objects this process moves,
+deletes or fails to find are removed from every listing of their bucket straight away.
+"""
+
+import json
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+_indexes: dict[str, "ListingIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def listing_key(
+    bucket: str, prefix: str, delimiter: str | None, match_glob: str | None
+) -> str:
+    """Get the key that a listing is indexed under.
+
+    Args:
+        bucket (str): The name of the bucket.
+        prefix (str): The prefix of the listing.
+        delimiter (str | None): The delimiter of the listing, if any.
+        match_glob (str | None): The matchGlob of the listing, if any.
+
+    Returns:
+        str: The listing key.
+    """
+    return json.dumps([bucket, prefix, delimiter, match_glob])
+
+
+class ListingState(NamedTuple):
+    """When a listing was last fully scanned, and the last name seen since."""
+
+    high_water: str
+    last_full_scan: float
+
+
+class ListingIndex:
+    """An SQLite database of the objects in each indexed listing."""
+
+    def __init__(self, path: str):
+        """Open (or create) the index.
+
+        Args:
+            path (str): The path of the SQLite database file.
+        """
+        self.lock = threading.Lock()
+        # Several processes may share the same file, so wait for their writes
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS listings (key TEXT PRIMARY KEY,"
+                " high_water TEXT NOT NULL, last_full_scan REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS objects (key TEXT NOT NULL,"
+                " name TEXT NOT NULL, size TEXT NOT NULL, updated TEXT NOT NULL,"
+                " generation TEXT, crc32c TEXT, md5_hash TEXT,"
+                " PRIMARY KEY (key, name))"
+            )
+            # Indexes created before the hashes were stored don't have their columns
+            columns = {
+                row[1] for row in self.connection.execute("PRAGMA table_info(objects)")
+            }
+            for column in ("crc32c", "md5_hash"):
+                if column not in columns:
+                    self.connection.execute(
+                        f"ALTER TABLE objects ADD COLUMN {column} TEXT"
+                    )
+
+    def state(self, key: str) -> ListingState | None:
+        """Get the state of a listing.
+
+        Args:
+            key (str): The listing key.
+
+        Returns:
+            ListingState | None: The state, or None if the listing isn't indexed yet.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT high_water, last_full_scan FROM listings WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return ListingState(*row) if row else None
+
+    def _store(
+        self, key: str, items: Iterable[dict], high_water: str, last_full_scan: float
+    ) -> None:
+        for item in items:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO objects (key, name, size, updated, generation,"
+                " crc32c, md5_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    item["name"],
+                    item["size"],
+                    item["updated"],
+                    item.get("generation"),
+                    item.get("crc32c"),
+                    item.get("md5Hash"),
+                ),
+            )
+            high_water = max(high_water, item["name"])
+        self.connection.execute(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+            (key, high_water, last_full_scan),
+        )
+
+    def full_scan(self, key: str, items: Iterable[dict], now: float) -> None:
+        """Replace the index of a listing with a complete listing.
+
+        Every item is consumed before the index is written, so a listing that fails
+        part way through leaves the index unchanged, and the database is only locked
+        for one short transaction, not while the listing is fetched.
+
+        Args:
+            key (str): The listing key.
+            items (Iterable[dict]): Every object in the listing.
+            now (float): The time of the scan.
+        """
+        items = list(items)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM objects WHERE key = ?", (key,))
+            self._store(key, items, "", now)
+
+    def update(self, key: str, items: Iterable[dict]) -> None:
+        """Add new or updated objects to the index of a listing.
+
+        Like full_scan, every item is consumed before the index is written.
+
+        Args:
+            key (str): The listing key.
+            items (Iterable[dict]): The objects listed since the last update.
+        """
+        items = list(items)
+        state = self.state(key)
+        if state is None:
+            raise ValueError(f"Listing {key} hasn't been scanned")
+        with self.lock, self.connection:
+            self._store(key, items, state.high_water, state.last_full_scan)
+
+    def remove(self, bucket: str, names: Iterable[str]) -> None:
+        """Remove objects that no longer exist from every listing of a bucket.
+
+        Args:
+            bucket (str): The name of the bucket.
+            names (Iterable[str]): The names of the objects.
+        """
+        # Every key of the bucket starts with its name, as the first item of the list
+        key_prefix = f"{json.dumps([bucket])[:-1]},"
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM objects WHERE name = ? AND substr(key, 1, ?) = ?",
+                ((name, len(key_prefix), key_prefix) for name in names),
+            )
+
+    def objects(self, key: str) -> Iterator[dict]:
+        """Get every object in the index of a listing.
+
+        Args:
+            key (str): The listing key.
+
+        Yields:
+            dict: The name, size, updated time and hashes of each object, as they were
+            listed. Hashes the object doesn't have are left out.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT name, size, updated, crc32c, md5_hash FROM objects"
+                " WHERE key = ? ORDER BY name",
+                (key,),
+            ).fetchall()
+        for name, size, updated, crc32c, md5_hash in rows:
+            item = {"name": name, "size": size, "updated": updated}
+            if crc32c is not None:
+                item["crc32c"] = crc32c
+            if md5_hash is not None:
+                item["md5Hash"] = md5_hash
+            yield item
+
+
+def get_listing_index(path: str) -> ListingIndex:
+    """Get the index stored at path, shared by every handler in the process.
+
+    Args:
+        path (str): The path of the SQLite database file.
+
+    Returns:
+        ListingIndex: The index.
+    """
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = ListingIndex(path)
+            _indexes[path] = index
+        return index
@@ -0,0 +1,155 @@
+r"""Translate fileRegex patterns into GCS matchGlob expressions.
+
+The glob only needs to match a superset of the names the regex matches, since results
+are still matched against the regex locally. Anything that can't be translated safely
+returns None, and the listing falls back to filtering by prefix alone.
+
+Without re.ASCII, \d also matches non-ASCII digits, so it's only translated into
+[0-9] for patterns that start with the (?a) flag.
+"""
+
+import re
+
+# Characters with a special meaning in a matchGlob, that can't be used as literals
+GLOB_SPECIAL_CHARACTERS = set("*?[]{}\\,!/")
+QUANTIFIERS = set("*+?{")
+ASCII_FLAG = "(?a)"
+
+
+def _translate_class(pattern: str, start: int) -> tuple[str, int] | None:
+    """Translate a character class starting at pattern[start] == "[".
+
+    Returns:
+        tuple[str, int] | None: The glob class, and the index after the class.
+    """
+    end = pattern.find("]", start + 2)
+    if end == -1:
+        return None
+    body = pattern[start + 1 : end]
+    if any(char in body for char in "\\[") or body.startswith(("]", "!")):
+        return None
+    if body.startswith("^"):
+        body = f"!{body[1:]}"
+    return f"[{body}]", end + 1
+
+
+def _translate_escape(
+    pattern: str, start: int, ascii_only: bool
+) -> tuple[str, int] | None:
+    r"""Translate an escape sequence starting at pattern[start] == "\".
+
+    Args:
+        pattern (str): The regular expression.
+        start (int): The index of the backslash.
+        ascii_only (bool): The regex is matched with re.ASCII, so \d only matches
+        0-9.
+
+    Returns:
+        tuple[str, int] | None: The glob equivalent, and the index after the escape.
+    """
+    if start + 1 >= len(pattern):
+        return None
+    escaped = pattern[start + 1]
+    if escaped == "d" and ascii_only:
+        return "[0-9]", start + 2
+    # Other letters and digits are character classes, anchors or backreferences
+    if escaped.isalnum() or escaped in GLOB_SPECIAL_CHARACTERS:
+        return None
+    return escaped, start + 2
+
+
+def _skip_quantifier(pattern: str, start: int) -> int | None:
+    """Return the index after a quantifier starting at pattern[start]."""
+    if pattern[start] == "{":
+        end = pattern.find("}", start)
+        if end == -1:
+            return None
+        start = end
+    start += 1
+    # Lazy or possessive modifier
+    if start < len(pattern) and pattern[start] in "?+":
+        start += 1
+    return start
+
+
+def regex_to_basename_glob(pattern: str) -> str | None:
+    """Translate a regex, as used with re.match on a file name, into a glob.
+
+    Args:
+        pattern (str): The regular expression.
+
+    Returns:
+        str | None: A glob matching at least every name the regex does, or None if the
+        regex can't be translated.
+    """
+    try:
+        ascii_only = bool(re.compile(pattern).flags & re.ASCII)
+    except re.error:
+        return None
+    glob: list[str] = []
+    anchored = False
+    i = len(ASCII_FLAG) if pattern.startswith(ASCII_FLAG) else 0
+    if pattern.startswith("^", i):
+        i += 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "$" and i == len(pattern) - 1:
+            anchored = True
+            break
+
+        if char == ".":
+            atom = "?"
+            i += 1
+        elif char == "\\":
+            result = _translate_escape(pattern, i, ascii_only)
+            if result is None:
+                return None
+            atom, i = result
+        elif char == "[":
+            result = _translate_class(pattern, i)
+            if result is None:
+                return None
+            atom, i = result
+        elif char in "()|^$" or char in QUANTIFIERS:
+            return None
+        elif char in GLOB_SPECIAL_CHARACTERS:
+            return None
+        else:
+            atom = char
+            i += 1
+
+        if i < len(pattern) and pattern[i] in QUANTIFIERS:
+            skipped = _skip_quantifier(pattern, i)
+            if skipped is None:
+                return None
+            i = skipped
+            # Any repetition of a single character is covered by a wildcard
+            atom = "*"
+
+        if atom == "*" and glob and glob[-1] == "*":
+            continue
+        glob.append(atom)
+
+    # re.match only anchors the start of the name
+    if not anchored and (not glob or glob[-1] != "*"):
+        glob.append("*")
+    return "".join(glob)
+
+
+def regex_to_match_glob(pattern: str | None) -> str | None:
+    """Build a matchGlob for listing objects whose file name matches a regex.
+
+    Args:
+        pattern (str | None): The regular expression matched against the file name
+        (the part of the object name after the last /).
+
+    Returns:
+        str | None: The matchGlob, or None if one can't be used.
+    """
+    if not pattern:
+        return None
+    glob = regex_to_basename_glob(pattern)
+    if glob is None or glob == "*":
+        return None
+    # Match the file name either at the root of the bucket, or in any directory
+    return f"{{{glob},**/{glob}}}"
@@ -0,0 +1,208 @@
+"""Timings, byte counts, retries and status codes of the requests made by a handler.
+
+Every measurement is a MetricEvent. Events are aggregated per operation (e.g. download,
+list or rewrite) for a summary at the end of a task, and passed to any hooks, which can
+forward them to Prometheus, OpenTelemetry or anything else. A hook is any callable
+that takes a MetricEvent, and should return quickly, since it's called on the thread
+making the request.
+"""
+
+import importlib
+import math
+import threading
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency histogram buckets in seconds, as used by Prometheus
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+
+@dataclass(frozen=True)
+class MetricEvent:
+    """A single measurement.
+
+    Attributes:
+        kind: "request" for an HTTP request, "token_refresh" for an access token
+        being refreshed, or "transfer" for a whole download or upload of files.
+        operation: What the request or transfer was for, e.g. "download" or "list".
+        duration: How long it took, in seconds. For a request, this is the time until
+        the response headers arrived.
+        status: The HTTP status code of a request, if it got a response.
+        bytes: The number of bytes sent or received.
+        retries: The number of times the request was retried, by the HTTP transport
+        (connection errors) or the handler.
+        bucket: The bucket the handler is for.
+    """
+
+    kind: str
+    operation: str
+    duration: float
+    status: int | None = None
+    bytes: int = 0
+    retries: int = 0
+    bucket: str = ""
+
+
+MetricsHook = Callable[[MetricEvent], None]
+
+
+def classify_request(method: str, url: str) -> str:
+    """Name the operation an API request is for, from its method and URL.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL of the request.
+
+    Returns:
+        str: The operation.
+    """
+    path = urlsplit(url).path
+    if ":pull" in path or ":acknowledge" in path:
+        return "pubsub"
+    if path.startswith("/batch/"):
+        return "batch"
+    if path.startswith("/download/"):
+        return "download"
+    if path.startswith("/upload/"):
+        return "upload"
+    if "/rewriteTo/" in path:
+        return "rewrite"
+    if path.endswith("/compose"):
+        return "compose"
+    if method == "DELETE":
+        return "delete"
+    if path.endswith("/o"):
+        return "list"
+    return "metadata"
+
+
+def load_hook(path: str) -> MetricsHook:
+    """Import a hook from its dotted path, e.g. "mypackage.metrics.record".
+
+    Args:
+        path (str): The module and name of the callable.
+
+    Returns:
+        MetricsHook: The hook.
+    """
+    module_name, _, name = path.rpartition(".")
+    hook: MetricsHook = getattr(importlib.import_module(module_name), name)
+    return hook
+
+
+@dataclass
+class _OperationStats:
+    count: int = 0
+    duration: float = 0.0
+    bytes: int = 0
+    retries: int = 0
+    statuses: Counter = field(default_factory=Counter)
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    def add(self, event: MetricEvent) -> None:
+        self.count += 1
+        self.duration += event.duration
+        self.bytes += event.bytes
+        self.retries += event.retries
+        if event.status is not None:
+            self.statuses[event.status] += 1
+        for index, upper_bound in enumerate(LATENCY_BUCKETS):
+            if event.duration <= upper_bound:
+                self.buckets[index] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Get the upper bound of the histogram bucket holding the q quantile."""
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS[index]
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """Collects the measurements of one handler, and passes them on to hooks."""
+
+    def __init__(self, hooks: list[MetricsHook] | None = None, bucket: str = ""):
+        """Create the collector.
+
+        Args:
+            hooks (list[MetricsHook], optional): Called with every event. Defaults to
+            None.
+            bucket (str, optional): The bucket added to every event. Defaults to "".
+        """
+        self.hooks = hooks or []
+        self.bucket = bucket
+        self.lock = threading.Lock()
+        self.stats: dict[tuple[str, str], _OperationStats] = {}
+        self.hook_errors = 0
+
+    def record(self, event: MetricEvent) -> None:
+        """Record an event.
+
+        Args:
+            event (MetricEvent): The measurement. Its bucket is filled in if it's
+            empty.
+        """
+        if not event.bucket and self.bucket:
+            event = MetricEvent(**{**event.__dict__, "bucket": self.bucket})
+        with self.lock:
+            key = (event.kind, event.operation)
+            self.stats.setdefault(key, _OperationStats()).add(event)
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # A broken hook must never fail a transfer
+                with self.lock:
+                    self.hook_errors += 1
+
+    def summary(self) -> list[str]:
+        """Summarise everything recorded so far.
+
+        Returns:
+            list[str]: One line for each kind of event and operation.
+        """
+        lines = []
+        with self.lock:
+            for (kind, operation), stats in sorted(self.stats.items()):
+                line = (
+                    f"{kind} {operation}: {stats.count} in {stats.duration:.3f}s"
+                    f" (p50 <= {stats.quantile(0.5)}s, p99 <= {stats.quantile(0.99)}s)"
+                )
+                if stats.bytes:
+                    line += f", {stats.bytes} bytes"
+                    if kind == "transfer" and stats.duration:
+                        megabytes_per_second = stats.bytes / stats.duration / 1e6
+                        line += f" at {megabytes_per_second:.2f} MB/s"
+                if stats.retries:
+                    line += f", {stats.retries} retries"
+                if stats.statuses:
+                    statuses = ", ".join(
+                        f"{status}: {count}"
+                        for status, count in sorted(stats.statuses.items())
+                    )
+                    line += f", statuses {{{statuses}}}"
+                lines.append(line)
+            if self.hook_errors:
+                lines.append(f"{self.hook_errors} events failed to be sent to hooks")
+        return lines
@@ -0,0 +1,216 @@
+"""Adaptive concurrency and request pacing for Cloud Storage.
+
+An AdaptiveLimiter caps the number of requests in flight to a bucket, and adjusts the
+cap the way TCP adjusts its congestion window (additive increase, multiplicative
+decrease). While responses are healthy and fast, the limit grows by about one for
+every limit requests. A throttling (429) or unavailable (5xx) response, a connection
+error, or a request that the session had to retry, cuts it by the decrease factor, at
+most once per round trip, and a Retry-After header pauses new requests until it
+expires. Limiters are shared by every handler in the process that uses the same
+bucket, so tasks running side by side share the bucket's request rate between them.
+
+GCS also limits writes to a single object name to about one a second. Writes that
+could repeat a name in quick succession (e.g. moving many files to the same name)
+reserve a slot with reserve_object_write first.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+
+from .session import MAX_BACKOFF, RETRY_STATUSES
+
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 256
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_TOLERANCE = 2.0
+# Latencies below this are treated as equal, so very fast responses (e.g. a 404, or a
+# local emulator) don't set a baseline that nothing else can meet
+MIN_BASELINE_LATENCY = 0.05
+# How often a coroutine waiting for a slot checks again
+ASYNC_POLL_INTERVAL = 0.01
+OBJECT_MUTATION_INTERVAL = 1.0
+# Past writes are forgotten once this many objects have been written
+MAX_TRACKED_WRITES = 10000
+
+_limiters: dict[str, "AdaptiveLimiter"] = {}
+_limiters_lock = threading.Lock()
+_object_writes: dict[tuple[str, str], float] = {}
+_object_writes_lock = threading.Lock()
+
+
+class AdaptiveLimiter:  # pylint: disable=too-many-instance-attributes
+    """Limit the number of requests in flight, adapting the limit to the responses."""
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_INITIAL_CONCURRENCY,
+        minimum: int = DEFAULT_MIN_CONCURRENCY,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Create the limiter.
+
+        Args:
+            initial (int): The limit to start with. Defaults to 8.
+            minimum (int): The lowest the limit is cut to. Defaults to 1.
+            maximum (int): The highest the limit grows to. Defaults to 256.
+            decrease_factor (float): What the limit is multiplied by when requests
+            are throttled. Defaults to 0.5.
+            latency_tolerance (float): The limit only grows while latency is within
+            this multiple of the lowest latency seen. Defaults to 2.0.
+            clock (Callable, optional): Returns the current time in seconds. Defaults
+            to time.monotonic.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.min_latency = float(MAX_BACKOFF)
+        self.last_decrease = -float(MAX_BACKOFF)
+        self.throttle_count = 0
+        self._condition = threading.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        """The number of requests currently allowed in flight."""
+        return max(int(self.limit), 1)
+
+    def _wait_time(self) -> float | None:
+        """Take a slot if one is free. Must be called holding the condition.
+
+        Returns:
+            float | None: None if a slot was taken, otherwise how long the limiter is
+            paused for, or 0 if it's only full.
+        """
+        remaining = self.paused_until - self.clock()
+        if remaining > 0:
+            return remaining
+        if self.in_flight < self.concurrency:
+            self.in_flight += 1
+            return None
+        return 0.0
+
+    def acquire(self) -> None:
+        """Wait for a slot to send a request."""
+        with self._condition:
+            while (wait := self._wait_time()) is not None:
+                self._condition.wait(wait or None)
+
+    async def acquire_async(self) -> None:
+        """Wait for a slot to send a request, without blocking the event loop."""
+        while True:
+            with self._condition:
+                wait = self._wait_time()
+            if wait is None:
+                return
+            await asyncio.sleep(max(wait, ASYNC_POLL_INTERVAL))
+
+    def discard(self) -> None:
+        """Free the slot taken for a request that was abandoned, leaving the limit."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def release(
+        self,
+        status: int | None,
+        latency: float,
+        retry_after: float | None = None,
+        throttled: bool = False,
+    ) -> None:
+        """Free the slot taken for a request, and adjust the limit from its outcome.
+
+        Args:
+            status (int | None): The status code of the response, or None if the
+            request failed without one.
+            latency (float): The time the request took, in seconds.
+            retry_after (float, optional): The delay requested by the response's
+            Retry-After header. Defaults to None.
+            throttled (bool): The request was throttled, even if its final status
+            doesn't show it (e.g. it was retried by the session). Defaults to False.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = self.clock()
+            if throttled or status is None or status in RETRY_STATUSES:
+                self.throttle_count += 1
+                # Requests sent before the last decrease were sent at the old limit,
+                # so their throttling has already been reacted to
+                if now - latency >= self.last_decrease:
+                    self.limit = max(self.limit * self.decrease_factor, self.minimum)
+                    self.last_decrease = now
+                if retry_after is not None:
+                    self.paused_until = max(
+                        self.paused_until, now + min(retry_after, MAX_BACKOFF)
+                    )
+            else:
+                self.min_latency = min(self.min_latency, latency)
+                baseline = max(self.min_latency, MIN_BASELINE_LATENCY)
+                if latency <= baseline * self.latency_tolerance:
+                    self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            self._condition.notify_all()
+
+
+def get_limiter(bucket: str, settings: dict) -> AdaptiveLimiter:
+    """Get the limiter shared by every handler in the process using the bucket.
+
+    Args:
+        bucket (str): The name of the bucket.
+        settings (dict): The protocol's http.adaptive settings. Only those of the
+        first handler to use the bucket are applied.
+
+    Returns:
+        AdaptiveLimiter: The shared limiter.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(bucket)
+        if limiter is None:
+            limiter = AdaptiveLimiter(
+                settings.get("initialConcurrency", DEFAULT_INITIAL_CONCURRENCY),
+                settings.get("minConcurrency", DEFAULT_MIN_CONCURRENCY),
+                settings.get("maxConcurrency", DEFAULT_MAX_CONCURRENCY),
+                settings.get("decreaseFactor", DEFAULT_DECREASE_FACTOR),
+                settings.get("latencyTolerance", DEFAULT_LATENCY_TOLERANCE),
+            )
+            _limiters[bucket] = limiter
+        return limiter
+
+
+def reserve_object_write(
+    bucket: str,
+    name: str,
+    interval: float = OBJECT_MUTATION_INTERVAL,
+    clock: Callable[[], float] = time.monotonic,
+) -> float:
+    """Reserve the next slot to write an object, spacing writes to it by interval.
+
+    Args:
+        bucket (str): The bucket the object is in.
+        name (str): The name of the object.
+        interval (float): The minimum time between writes to the object, in seconds.
+        Defaults to OBJECT_MUTATION_INTERVAL.
+        clock (Callable, optional): Returns the current time in seconds. Defaults to
+        time.monotonic.
+
+    Returns:
+        float: How long to wait before writing, in seconds.
+    """
+    with _object_writes_lock:
+        now = clock()
+        if len(_object_writes) > MAX_TRACKED_WRITES:
+            for key, slot in list(_object_writes.items()):
+                if slot + interval <= now:
+                    del _object_writes[key]
+        slot = max(now, _object_writes.get((bucket, name), now - interval) + interval)
+        _object_writes[(bucket, name)] = slot
+        return slot - now
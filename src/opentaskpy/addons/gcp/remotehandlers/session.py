@@ -0,0 +1,146 @@
+"""Pooled HTTP sessions for talking to GCP."""
+
+import random
+import threading
+import time
+from collections.abc import Mapping
+from email.utils import parsedate_to_datetime
+from typing import Protocol
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_CONNECT_TIMEOUT = 30
+DEFAULT_TIMEOUT = 1800
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_BACKOFF = 60
+
+
+class HTTPResponse(Protocol):
+    """Any response with headers, from requests or aiohttp."""
+
+    @property
+    def headers(self) -> Mapping[str, str]:
+        """The response headers."""
+
+
+_sessions: dict[tuple, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _http_spec(protocol: dict) -> dict:
+    return dict(protocol.get("http", {}))
+
+
+def get_session(protocol: dict, min_pool_size: int = 1) -> requests.Session:
+    """Get a pooled HTTP session for the given protocol spec.
+
+    Sessions are shared by every handler in the process that uses the same pool and
+    retry settings, so connections (and their TLS handshakes) are reused across
+    requests, files and tasks.
+
+    Args:
+        protocol (dict): The protocol section of the transfer spec.
+        min_pool_size (int): The minimum number of pooled connections, used to make sure
+        there is a connection available to every concurrent worker. Defaults to 1.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    http_spec = _http_spec(protocol)
+    pool_size = max(http_spec.get("poolSize", DEFAULT_POOL_SIZE), min_pool_size)
+    retries = http_spec.get("retries", DEFAULT_RETRIES)
+    backoff_factor = http_spec.get("backoffFactor", DEFAULT_BACKOFF_FACTOR)
+
+    key = (pool_size, retries, backoff_factor)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # The transport only retries connection errors, and only for idempotent
+            # methods, so uploads and rewrites are never replayed automatically.
+            # Throttled and unavailable responses are retried by the handler, so
+            # they're only retried in one place, with its attempt limits and jitter
+            retry = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def get_timeout(protocol: dict) -> tuple[float, float]:
+    """Get the (connect, read) timeout for requests using the given protocol spec.
+
+    Args:
+        protocol (dict): The protocol section of the transfer spec.
+
+    Returns:
+        tuple[float, float]: The connect and read timeouts in seconds.
+    """
+    http_spec = _http_spec(protocol)
+    return (
+        http_spec.get("connectTimeout", DEFAULT_CONNECT_TIMEOUT),
+        http_spec.get("timeout", DEFAULT_TIMEOUT),
+    )
+
+
+def retry_after(response: HTTPResponse) -> float | None:
+    """Get the delay requested by a response's Retry-After header.
+
+    Args:
+        response (HTTPResponse): The response.
+
+    Returns:
+        float | None: The number of seconds to wait, or None if there's no (valid)
+        Retry-After header.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    attempt: int,
+    backoff_factor: float,
+    response: HTTPResponse | None = None,
+) -> float:
+    """Get the delay before retrying a request, using exponential backoff with jitter.
+
+    The delay is chosen at random between 0 and backoff_factor * 2**attempt (capped at
+    MAX_BACKOFF), so that workers throttled at the same time don't all retry together.
+    A Retry-After header on the response is treated as the minimum delay.
+
+    Args:
+        attempt (int): The number of attempts that have failed so far.
+        backoff_factor (float): The backoff factor in seconds.
+        response (HTTPResponse, optional): The failed response, if there was one.
+        Defaults to None.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = random.uniform(0, min(backoff_factor * 2**attempt, MAX_BACKOFF))
+    requested = retry_after(response) if response is not None else None
+    if requested is not None:
+        delay = max(delay, min(requested, MAX_BACKOFF))
+    return delay
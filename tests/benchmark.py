@@ -0,0 +1,396 @@
+# pylint: skip-file
+# mypy: ignore-errors
+"""Benchmarks of BucketTransfer against the in-process fake GCS server.
+
+Each scenario (list, pull, push or post_copy) runs in a fresh process, against a
+fake server in another process, so that the peak RSS measured is the handler's alone,
+and one scenario can't warm up or slow down another. Profiles set the number and size
+of the objects, the latency and error rate of the server, and the number of requests
+it handles at once before throttling the rest with 429s.
+
+    python tests/benchmark.py --profile small-objects --output results.json
+    python tests/benchmark.py --profile smoke --baseline base.json --threshold 0.25
+    python tests/benchmark.py --profile smoke --latency 0.02 --scaling 1,4,16
+
+With --baseline, the exit code is 1 if throughput has fallen, or p50/p99 latency or
+peak RSS has risen, by more than the threshold. Baselines are only comparable when
+recorded on the same machine, so CI runs the base branch first to record one. With
+--scaling, only pull is run, at each concurrency given, and the exit code is 1 unless
+throughput rises by at least half as much as the concurrency each time.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+
+SCENARIOS = ("list", "pull", "push", "post_copy")
+BUCKET = "bucket-bench"
+DIRECTORY = "bench"
+# Latencies closer than this to the baseline aren't regressions, whatever the ratio
+MIN_LATENCY_DELTA = 0.001
+
+logger = logging.getLogger("benchmark")
+
+
+@dataclass(frozen=True)
+class Profile:
+    """The objects to transfer, the behaviour of the fake server, and handler settings."""
+
+    count: int
+    size: int
+    latency: float = 0.0
+    error_rate: float = 0.0
+    concurrency: int = 16
+    backoff_factor: float = 0.05
+    transport: str = "requests"
+    max_in_flight: int = 0
+    adaptive: bool = False
+
+
+PROFILES = {
+    "smoke": Profile(count=200, size=1024),
+    "small-objects": Profile(count=10000, size=1024, latency=0.005),
+    "large-objects": Profile(count=3, size=2 * 1024**3, latency=0.005, concurrency=3),
+    "flaky": Profile(count=1000, size=4096, latency=0.02, error_rate=0.02),
+    "throttled": Profile(
+        count=1000, size=4096, latency=0.02, concurrency=64, max_in_flight=16
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Result:
+    """The outcome, throughput and resource use of one scenario."""
+
+    scenario: str
+    result: int
+    objects: int
+    bytes: int
+    seconds: float
+    objects_per_second: float
+    megabytes_per_second: float
+    p50: float
+    p99: float
+    requests: int
+    errors: int
+    retries: int
+    peak_rss_mb: float
+
+
+def percentile(values, q):
+    """Get the q quantile of values, by the nearest rank."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def object_data(size):
+    """Get the content of every object. It's shared, so only one copy is in memory."""
+    return (b"0123456789abcdef" * (size // 16 + 1))[:size]
+
+
+def _serve(conn, profile, seed):
+    """Run the fake server until told to stop, in its own process."""
+    from fake_gcs import FakeGCSServer
+
+    server = FakeGCSServer(
+        latency=profile.latency,
+        error_rate=profile.error_rate,
+        max_in_flight=profile.max_in_flight,
+    )
+    if seed:
+        data = object_data(profile.size)
+        for i in range(profile.count):
+            server.put(BUCKET, f"{DIRECTORY}/object{i:06}.bin", data)
+    server.start()
+    conn.send(server.url)
+    conn.recv()
+    server.stop()
+
+
+def _run_scenario(scenario, profile, url, work_dir, queue):
+    """Time a single scenario, in its own process."""
+    os.environ["STORAGE_EMULATOR_HOST"] = url
+    # Keep the task logs with the rest of the scenario's files, not in the tree
+    os.environ["OTF_LOG_DIRECTORY"] = os.path.join(work_dir, "logs")
+    from opentaskpy.addons.gcp.remotehandlers import bucket
+
+    # The fake server doesn't check tokens
+    bucket.get_access_token = lambda *args, **kwargs: "token"
+
+    spec = {
+        "task_id": f"benchmark-{scenario}",
+        "bucket": BUCKET,
+        "directory": DIRECTORY,
+        "fileRegex": ".*",
+        "protocol": {
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {
+                "backoffFactor": profile.backoff_factor,
+                "transport": profile.transport,
+            },
+            "metrics": {"summary": False},
+        },
+        "download": {"concurrency": profile.concurrency},
+        "upload": {"concurrency": profile.concurrency},
+        "postCopyAction": {
+            "action": "move",
+            "destination": "archive",
+            "concurrency": profile.concurrency,
+        },
+    }
+    if profile.adaptive:
+        spec["protocol"]["http"]["adaptive"] = {}
+    handler = bucket.BucketTransfer(spec)
+    events = []
+    handler.metrics.hooks.append(events.append)
+
+    upload_dir = os.path.join(work_dir, "upload")
+    files = {}
+    if scenario == "push":
+        os.mkdir(upload_dir)
+        data = object_data(profile.size)
+        for i in range(profile.count):
+            with open(os.path.join(upload_dir, f"object{i:06}.bin"), "wb") as f:
+                f.write(data)
+    elif scenario != "list":
+        files = handler.list_files()
+        events.clear()
+
+    start = time.perf_counter()
+    if scenario == "list":
+        listed = handler.list_files()
+        result = 0 if len(listed) == profile.count else 1
+    elif scenario == "pull":
+        result = handler.pull_files_to_worker(files, work_dir)
+    elif scenario == "push":
+        result = handler.push_files_from_worker(upload_dir)
+    else:
+        result = handler.handle_post_copy_action(list(files))
+    seconds = time.perf_counter() - start
+
+    requests = [event for event in events if event.kind == "request"]
+    durations = [event.duration for event in requests]
+    transferred = 0 if scenario in ("list", "post_copy") else profile.count
+    queue.put(
+        Result(
+            scenario=scenario,
+            result=result,
+            objects=profile.count,
+            bytes=transferred * profile.size,
+            seconds=seconds,
+            objects_per_second=profile.count / seconds,
+            megabytes_per_second=transferred * profile.size / seconds / 1e6,
+            p50=percentile(durations, 0.5),
+            p99=percentile(durations, 0.99),
+            requests=len(requests),
+            errors=sum(
+                1 for event in requests if event.status is None or event.status >= 400
+            ),
+            retries=sum(event.retries for event in requests),
+            # Kilobytes on Linux, bytes on macOS
+            peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            / (1024**2 if sys.platform == "darwin" else 1024),
+        )
+    )
+
+
+def run_benchmark(profile, scenarios=SCENARIOS):
+    """Run each scenario against a freshly seeded fake server.
+
+    Returns:
+        list[Result]: The result of each scenario.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for scenario in scenarios:
+        parent_conn, child_conn = context.Pipe()
+        server = context.Process(
+            target=_serve, args=(child_conn, profile, scenario != "push"), daemon=True
+        )
+        server.start()
+        try:
+            url = parent_conn.recv()
+            queue = context.Queue()
+            with tempfile.TemporaryDirectory() as work_dir:
+                client = context.Process(
+                    target=_run_scenario,
+                    args=(scenario, profile, url, work_dir, queue),
+                )
+                client.start()
+                results.append(queue.get())
+                client.join()
+        finally:
+            parent_conn.send("stop")
+            server.join()
+    return results
+
+
+def run_scaling(profile, levels):
+    """Run the pull scenario at each download concurrency.
+
+    Returns:
+        list[Result]: The result at each concurrency, with a scenario of
+        pull@{concurrency}.
+    """
+    return [
+        replace(result, scenario=f"pull@{concurrency}")
+        for concurrency in levels
+        for result in run_benchmark(replace(profile, concurrency=concurrency), ["pull"])
+    ]
+
+
+def scaling_failures(levels, results):
+    """Find the concurrency levels where throughput didn't rise by enough.
+
+    Throughput should rise by at least half as much as the concurrency does, e.g.
+    double when the concurrency goes from 4 to 16.
+
+    Returns:
+        list[str]: A description of each failure.
+    """
+    failures = []
+    for (lower, low), (higher, high) in zip(
+        zip(levels, results), zip(levels[1:], results[1:])
+    ):
+        expected = low.objects_per_second * higher / lower / 2
+        if high.objects_per_second < expected:
+            failures.append(
+                f"{high.scenario}: throughput {high.objects_per_second:.1f} objects/s"
+                f" is below {expected:.1f}, half the ideal speedup from {low.scenario}"
+            )
+    return failures
+
+
+def compare(results, baseline, threshold):
+    """Find the metrics that have regressed from the baseline by more than threshold.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    baseline_results = {result["scenario"]: result for result in baseline}
+    for result in results:
+        base = baseline_results.get(result.scenario)
+        if base is None:
+            continue
+        if result.objects_per_second < base["objects_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{result.scenario}: throughput {result.objects_per_second:.1f} objects/s"
+                f" is below {base['objects_per_second']:.1f}"
+            )
+        for name in ("p50", "p99"):
+            value = getattr(result, name)
+            if (
+                value > base[name] * (1 + threshold)
+                and value - base[name] > MIN_LATENCY_DELTA
+            ):
+                regressions.append(
+                    f"{result.scenario}: {name} latency {value * 1000:.1f}ms is above"
+                    f" {base[name] * 1000:.1f}ms"
+                )
+        if result.peak_rss_mb > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append(
+                f"{result.scenario}: peak RSS {result.peak_rss_mb:.1f}MB is above"
+                f" {base['peak_rss_mb']:.1f}MB"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=PROFILES, default="smoke")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--count", type=int, help="Number of objects")
+    parser.add_argument("--size", type=int, help="Size of each object in bytes")
+    parser.add_argument("--latency", type=float, help="Server latency in seconds")
+    parser.add_argument("--error-rate", type=float, help="Fraction of requests to fail")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--transport", choices=["requests", "aiohttp"])
+    parser.add_argument(
+        "--max-in-flight", type=int, help="Requests the server handles at once"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        default=None,
+        help="Enable adaptive concurrency",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results from this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--scaling", help="Comma separated download concurrencies to compare"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(format="%(message)s", stream=sys.stdout)
+    logger.setLevel(logging.INFO)
+
+    overrides = {
+        name: getattr(args, name)
+        for name in (
+            "count",
+            "size",
+            "latency",
+            "error_rate",
+            "concurrency",
+            "transport",
+            "max_in_flight",
+            "adaptive",
+        )
+        if getattr(args, name) is not None
+    }
+    profile = replace(PROFILES[args.profile], **overrides)
+    logger.info(f"Profile: {profile}")
+    levels = [int(level) for level in args.scaling.split(",")] if args.scaling else []
+    if levels:
+        results = run_scaling(profile, levels)
+    else:
+        results = run_benchmark(profile, args.scenario or SCENARIOS)
+
+    for result in results:
+        logger.info(
+            f"{result.scenario:>9}: {result.objects_per_second:9.1f} objects/s"
+            f" {result.megabytes_per_second:8.2f} MB/s"
+            f"  p50 {result.p50 * 1000:7.1f}ms  p99 {result.p99 * 1000:7.1f}ms"
+            f"  {result.requests} requests, {result.errors} errors,"
+            f" {result.retries} retries  peak RSS {result.peak_rss_mb:.1f}MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+
+    failed = [result.scenario for result in results if result.result != 0]
+    if failed:
+        logger.error(f"Failed scenarios: {failed}")
+        return 1
+
+    if levels:
+        failures = scaling_failures(levels, results)
+        for failure in failures:
+            logger.error(f"Scaling: {failure}")
+        if failures:
+            return 1
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
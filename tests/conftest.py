@@ -0,0 +1,41 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import pytest
+from fake_gcs import FakeGCSServer
+
+from opentaskpy.addons.gcp.remotehandlers import bucket, ratecontrol
+
+BUCKET = "bucket-test"
+
+
+@pytest.fixture
+def fake_gcs(monkeypatch):
+    """Run a local fake GCS (and Pub/Sub) server, and point BucketTransfer at it."""
+    server = FakeGCSServer().start()
+    monkeypatch.setenv("STORAGE_EMULATOR_HOST", server.url)
+    monkeypatch.setenv("PUBSUB_EMULATOR_HOST", server.url.removeprefix("http://"))
+    monkeypatch.setattr(bucket, "get_access_token", lambda *args, **kwargs: "token")
+    # Each test starts without any shared rate limits
+    monkeypatch.setattr(ratecontrol, "_limiters", {})
+    monkeypatch.setattr(ratecontrol, "_object_writes", {})
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def bucket_spec():
+    """Return a function that builds a bucket spec for the fake server."""
+
+    def _bucket_spec(**kwargs):
+        return {
+            "task_id": "fake-gcs",
+            "bucket": BUCKET,
+            "directory": "",
+            "protocol": {
+                "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+                "credentials": {},
+            },
+            **kwargs,
+        }
+
+    return _bucket_spec
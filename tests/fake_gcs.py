@@ -0,0 +1,654 @@
+# pylint: skip-file
+# mypy: ignore-errors
+"""In-process fake of the parts of the GCS JSON API used by BucketTransfer."""
+
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email import policy
+from email.parser import BytesParser
+from http.client import responses as reasons
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import requests
+
+from opentaskpy.addons.gcp.remotehandlers.checksum import (
+    crc32c_extend,
+    crc32c_to_base64,
+)
+
+
+@dataclass
+class FakeObject:
+    """An object's content, generation and any other metadata set on it."""
+
+    data: bytes
+    generation: int
+    updated: str = field(
+        default_factory=lambda: datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    )
+    metadata: dict = field(default_factory=dict)
+
+    def resource(self, bucket, name):
+        """Get the object resource, as returned by the JSON API."""
+        resource = {
+            "kind": "storage#object",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(self.data)),
+            "generation": str(self.generation),
+            "updated": self.updated,
+            "crc32c": crc32c_to_base64(crc32c_extend(0, self.data)),
+            "md5Hash": base64.b64encode(hashlib.md5(self.data).digest()).decode(),
+            **self.metadata,
+        }
+        # Like GCS, composite objects have no MD5
+        if "componentCount" in resource:
+            del resource["md5Hash"]
+        return resource
+
+
+class FakeGCSServer:
+    """A threaded HTTP server holding objects in memory.
+
+    latency adds a fixed delay to every request, to simulate the round trip to GCS.
+    error_rate is the fraction of requests that fail with a 503, chosen at random.
+    max_in_flight simulates a rate limit, failing requests with a 429 while more than
+    that many are being handled at once.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, max_in_flight=0):
+        """Create the server. It isn't listening until it's started."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+        self.random = random.Random(seed)
+        self.objects: dict[tuple[str, str], FakeObject] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.lock = threading.Lock()
+        self.errors: list[list] = []
+        self.truncations: list[list] = []
+        self.uploads: dict[str, dict] = {}
+        # X-Goog-Hash headers sent with uploads
+        self.hashes: list[str] = []
+        # Pub/Sub messages waiting to be pulled, and pulled but not acknowledged
+        self.messages: list[dict] = []
+        self.unacked: dict[str, dict] = {}
+        self.messages_available = threading.Condition(self.lock)
+        self._message_id = 0
+        self._generation = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """The base URL of the running server."""
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving requests on a random local port, in a background thread."""
+        # Accept many simultaneous connections, like GCS, rather than the default
+        # listen backlog of 5
+        server_class = type(
+            "FakeHTTPServer", (ThreadingHTTPServer,), {"request_queue_size": 1024}
+        )
+        self._httpd = server_class(("127.0.0.1", 0), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving, and close the listening socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def inject_error(self, match, status, count=1, headers=None):
+        """Fail the next count requests whose decoded path contains match."""
+        with self.lock:
+            self.errors.append([match, status, count, headers or {}])
+
+    def inject_truncation(self, match, length, count=1):
+        """Cut off the body of the next count responses to requests matching match.
+
+        Only the first length bytes are sent, then the connection is closed, like a
+        connection dropped partway through a download.
+        """
+        with self.lock:
+            self.truncations.append([match, length, count])
+
+    def _take_truncation(self, method, path):
+        with self.lock:
+            for truncation in self.truncations:
+                match, length, count = truncation
+                if count and match in f"{method} {unquote(path)}":
+                    truncation[2] -= 1
+                    return length
+        return None
+
+    def _take_error(self, method, path):
+        with self.lock:
+            for error in self.errors:
+                match, status, count, headers = error
+                if count and match in f"{method} {unquote(path)}":
+                    error[2] -= 1
+                    return status, headers
+        return None
+
+    def put(self, bucket, name, data, **metadata):
+        """Create or replace an object, with a new generation."""
+        with self.lock:
+            self._generation += 1
+            self.objects[(bucket, name)] = FakeObject(
+                data, self._generation, metadata=metadata
+            )
+            return self.objects[(bucket, name)]
+
+    def notify(self, bucket, name, event_type="OBJECT_FINALIZE"):
+        """Publish a bucket notification, as GCS does for a configured topic."""
+        with self.lock:
+            self._message_id += 1
+            obj = self.objects.get((bucket, name))
+            self.messages.append(
+                {
+                    "ackId": f"ack-{self._message_id}",
+                    "message": {
+                        "messageId": str(self._message_id),
+                        "attributes": {
+                            "bucketId": bucket,
+                            "objectId": name,
+                            "eventType": event_type,
+                            "payloadFormat": "JSON_API_V1",
+                        },
+                        "data": base64.b64encode(
+                            json.dumps(
+                                obj.resource(bucket, name) if obj else {}
+                            ).encode()
+                        ).decode(),
+                    },
+                }
+            )
+            self.messages_available.notify_all()
+
+    def get(self, bucket, name):
+        """Get an object, or None if it doesn't exist."""
+        with self.lock:
+            return self.objects.get((bucket, name))
+
+    def names(self, bucket):
+        """Get the sorted names of every object in the bucket."""
+        with self.lock:
+            return sorted(name for b, name in self.objects if b == bucket)
+
+
+class _Request(NamedTuple):
+    """A request to the fake server, with its path split and query parsed."""
+
+    method: str
+    parts: list[str]
+    params: dict[str, str]
+    body: bytes
+
+    @property
+    def bucket(self):
+        """The bucket in the path of a JSON API or upload request."""
+        return (
+            self.parts[5] if self.parts[1] in ("download", "upload") else self.parts[4]
+        )
+
+
+def _endpoint(request):
+    """Name the endpoint a request is for, from its path."""
+    # /v1/projects/{project}/subscriptions/{subscription}:{pull,acknowledge}
+    # /batch/storage/v1
+    # /download/storage/v1/b/{bucket}/o/{name}
+    # /upload/storage/v1/b/{bucket}/o
+    # /storage/v1/b/{bucket}/o[/{name}[/rewriteTo/b/{bucket}/o/{name}|/compose]]
+    parts = request.parts
+    if parts[1] in ("v1", "batch", "download"):
+        return "pubsub" if parts[1] == "v1" else parts[1]
+    if parts[1] == "upload":
+        return (
+            "resumable" if request.params.get("uploadType") == "resumable" else "upload"
+        )
+    if len(parts) == 6:
+        return "list"
+    if len(parts) == 12 and parts[7] == "rewriteTo":
+        return "rewrite"
+    if len(parts) == 8 and parts[7] == "compose":
+        return "compose"
+    return "object"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve requests from the FakeGCSServer set as fake, on a subclass."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake: "FakeGCSServer"
+
+    # The method handling each endpoint, for each HTTP method it accepts
+    routes = {
+        ("pubsub", "POST"): "_pubsub",
+        ("batch", "POST"): "_batch",
+        ("download", "GET"): "_download",
+        ("upload", "POST"): "_upload",
+        ("resumable", "POST"): "_start_resumable",
+        ("resumable", "PUT"): "_resumable",
+        ("list", "GET"): "_list_objects",
+        ("rewrite", "POST"): "_rewrite",
+        ("compose", "POST"): "_compose",
+        ("object", "GET"): "_get_object",
+        ("object", "DELETE"): "_delete_object",
+    }
+
+    def log_message(self, format, *args):
+        """Don't log requests."""
+
+    def _dispatch(self, method):
+        server = self.fake
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            self._handle(method)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _handle(self, method):
+        server = self.fake
+        with server.lock:
+            throttled = 0 < server.max_in_flight < server.in_flight
+            server.throttled += throttled
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlsplit(self.path)
+        # Keep %2F encoded separators intact until the path has been split
+        parts = [unquote(part) for part in url.path.split("/")]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        with server.lock:
+            server.requests.append((method, self.path))
+        body = self._read_body()
+        error = server._take_error(method, self.path)
+        if error is None and throttled:
+            error = 429, {}
+        if error is None and server.error_rate:
+            with server.lock:
+                if server.random.random() < server.error_rate:
+                    error = 503, {}
+        if error:
+            status, headers = error
+            return self._send(
+                status,
+                json.dumps({"error": {"code": status}}).encode(),
+                {"Content-Type": "application/json", **headers},
+            )
+        request = _Request(method, parts, params, body)
+        handler = self.routes.get((_endpoint(request), method))
+        if handler is None:
+            return self._send_json(400, {"error": {"code": 400}})
+        try:
+            getattr(self, handler)(request)
+        except KeyError:
+            self._send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        length = self.fake._take_truncation(self.command, self.path)
+        if length is not None:
+            body = body[:length]
+            self.close_connection = True
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(
+            status,
+            json.dumps(data).encode(),
+            {"Content-Type": "application/json"},
+        )
+
+    def _lookup(self, bucket, name):
+        obj = self.fake.get(bucket, name)
+        if obj is None:
+            raise KeyError(name)
+        return obj
+
+    def _download(self, request):
+        bucket, name = request.bucket, request.parts[7]
+        obj = self._lookup(bucket, name)
+        generation = request.params.get("generation")
+        if generation is not None and int(generation) != obj.generation:
+            raise KeyError(name)
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            start, end = byte_range.split("=")[1].split("-")
+            start, end = int(start), min(int(end), len(obj.data) - 1)
+            return self._send(
+                206,
+                obj.data[start : end + 1],
+                {"Content-Range": f"bytes {start}-{end}/{len(obj.data)}"},
+            )
+        resource = obj.resource(bucket, name)
+        hashes = [f"crc32c={resource['crc32c']}"]
+        if "md5Hash" in resource:
+            hashes.append(f"md5={resource['md5Hash']}")
+        headers = {"x-goog-hash": ",".join(hashes)}
+        data = obj.data
+        if resource.get("contentEncoding") == "gzip":
+            headers["x-goog-stored-content-encoding"] = "gzip"
+            # Like GCS, decompressive transcoding unless gzip is accepted
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+            else:
+                data = gzip.decompress(data)
+        return self._send(200, data, headers)
+
+    def _upload(self, request):
+        bucket, params = request.bucket, request.params
+        if not self._precondition_matches(bucket, params["name"], params):
+            return self._send_json(412, {"error": {"code": 412}})
+        if not self._hash_matches(request.body):
+            return self._send_json(400, {"error": {"code": 400}})
+        obj = self.fake.put(bucket, params["name"], request.body, **_metadata(params))
+        return self._send_json(200, obj.resource(bucket, params["name"]))
+
+    def _list_objects(self, request):
+        return self._send_json(200, self._list(request.bucket, request.params))
+
+    def _rewrite(self, request):
+        parts, params = request.parts, request.params
+        source = self._lookup(request.bucket, parts[6])
+        # Large rewrites take several calls, each continuing from the last
+        done = int(params.get("rewriteToken", 0))
+        max_bytes = int(params.get("maxBytesRewrittenPerCall", 0))
+        if max_bytes and len(source.data) - done > max_bytes:
+            done += max_bytes
+            return self._send_json(
+                200,
+                {
+                    "kind": "storage#rewriteResponse",
+                    "done": False,
+                    "objectSize": str(len(source.data)),
+                    "totalBytesRewritten": str(done),
+                    "rewriteToken": str(done),
+                },
+            )
+        dest = self.fake.put(parts[9], parts[11], source.data)
+        return self._send_json(
+            200,
+            {
+                "kind": "storage#rewriteResponse",
+                "done": True,
+                "objectSize": str(len(source.data)),
+                "totalBytesRewritten": str(len(source.data)),
+                "resource": dest.resource(parts[9], parts[11]),
+            },
+        )
+
+    def _compose(self, request):
+        bucket, name = request.bucket, request.parts[6]
+        body = json.loads(request.body)
+        sources = body["sourceObjects"]
+        if len(sources) > 32:
+            return self._send_json(400, {"error": {"code": 400}})
+        if not self._precondition_matches(bucket, name, request.params):
+            return self._send_json(412, {"error": {"code": 412}})
+        data = b"".join(self._lookup(bucket, source["name"]).data for source in sources)
+        dest = self.fake.put(
+            bucket,
+            name,
+            data,
+            componentCount=len(sources),
+            **_metadata(body.get("destination", {})),
+        )
+        return self._send_json(200, dest.resource(bucket, name))
+
+    def _get_object(self, request):
+        bucket, name = request.bucket, request.parts[6]
+        return self._send_json(200, self._lookup(bucket, name).resource(bucket, name))
+
+    def _delete_object(self, request):
+        with self.fake.lock:
+            del self.fake.objects[(request.bucket, request.parts[6])]
+        return self._send(204)
+
+    def _precondition_matches(self, bucket, name, params):
+        """Check an ifGenerationMatch precondition, where 0 means no object."""
+        if "ifGenerationMatch" not in params:
+            return True
+        obj = self.fake.get(bucket, name)
+        generation = obj.generation if obj else 0
+        return int(params["ifGenerationMatch"]) == generation
+
+    def _hash_matches(self, data):
+        """Check an X-Goog-Hash header against the uploaded data, as GCS does."""
+        header = self.headers.get("X-Goog-Hash")
+        if not header:
+            return True
+        with self.fake.lock:
+            self.fake.hashes.append(header)
+        actual = FakeObject(data, 0).resource("", "")
+        for value in header.split(","):
+            algorithm, _, digest = value.partition("=")
+            key = "md5Hash" if algorithm == "md5" else algorithm
+            if actual[key] != digest:
+                return False
+        return True
+
+    def _start_resumable(self, request):
+        server, bucket, params = self.fake, request.bucket, request.params
+        if not self._precondition_matches(bucket, params["name"], params):
+            return self._send_json(412, {"error": {"code": 412}})
+        with server.lock:
+            upload_id = str(len(server.uploads))
+            server.uploads[upload_id] = {
+                "bucket": bucket,
+                "name": params["name"],
+                "data": bytearray(),
+                "params": params,
+            }
+        return self._send(
+            200,
+            headers={
+                "Location": f"{server.url}/upload/storage/v1/b/{bucket}/o"
+                f"?uploadType=resumable&upload_id={upload_id}"
+            },
+        )
+
+    def _resumable(self, request):
+        upload = self.fake.uploads.get(request.params["upload_id"])
+        if upload is None:
+            raise KeyError(request.params["upload_id"])
+        data = upload["data"]
+        content_range = self.headers["Content-Range"].split(" ")[1]
+        byte_range, total = content_range.split("/")
+        if byte_range != "*":
+            start = int(byte_range.split("-")[0])
+            if start != len(data):
+                return self._send_json(400, {"error": {"code": 400}})
+            data.extend(request.body)
+        if total != "*" and len(data) == int(total):
+            if not self._precondition_matches(
+                upload["bucket"], upload["name"], upload["params"]
+            ):
+                return self._send_json(412, {"error": {"code": 412}})
+            if not self._hash_matches(bytes(data)):
+                return self._send_json(400, {"error": {"code": 400}})
+            obj = self.fake.put(
+                upload["bucket"],
+                upload["name"],
+                bytes(data),
+                **_metadata(upload["params"]),
+            )
+            return self._send_json(200, obj.resource(upload["bucket"], upload["name"]))
+        headers = {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+        return self._send(308, headers=headers)
+
+    def _pubsub(self, request):
+        server = self.fake
+        action = request.parts[-1].split(":")[-1]
+        body = json.loads(request.body)
+        # The response is sent after releasing the lock, which sending needs
+        with server.messages_available:
+            if action == "pull":
+                # Long poll, like Pub/Sub does
+                server.messages_available.wait_for(lambda: server.messages, 2)
+                count = body.get("maxMessages", 1000)
+                pulled = server.messages[:count]
+                del server.messages[:count]
+                for message in pulled:
+                    server.unacked[message["ackId"]] = message
+                response = {"receivedMessages": pulled}
+            else:
+                for ack_id in body["ackIds"]:
+                    server.unacked.pop(ack_id, None)
+                response = {}
+        return self._send_json(200, response)
+
+    def _batch(self, request):
+        """Run each call in a batch against this server, and combine the results."""
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            + request.body
+        )
+        boundary = "batch_response"
+        lines = []
+        for part in message.iter_parts():
+            request_line = part.get_payload(decode=True).split(b"\r\n")[0]
+            method, path, _ = request_line.decode().split(" ")
+            response = requests.request(method, f"{self.fake.url}{path}")
+            lines.extend(
+                [
+                    f"--{boundary}",
+                    "Content-Type: application/http",
+                    f"Content-ID: <response-{part['Content-ID'].strip('<>')}>",
+                    "",
+                    f"HTTP/1.1 {response.status_code}"
+                    f" {reasons.get(response.status_code, '')}",
+                    "Content-Type: application/json",
+                    "",
+                    response.text,
+                ]
+            )
+        lines.append(f"--{boundary}--")
+        return self._send(
+            200,
+            "\r\n".join(lines).encode(),
+            {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+        )
+
+    def _list(self, bucket, params):
+        prefix = params.get("prefix", "")
+        max_results = int(params.get("maxResults", 1000))
+        start = int(params.get("pageToken", 0))
+        names = [name for name in self.fake.names(bucket) if name.startswith(prefix)]
+        if "startOffset" in params:
+            names = [name for name in names if name >= params["startOffset"]]
+        if "delimiter" in params:
+            names = [
+                name for name in names if params["delimiter"] not in name[len(prefix) :]
+            ]
+        if "matchGlob" in params:
+            glob_regex = _glob_to_regex(params["matchGlob"])
+            names = [name for name in names if glob_regex.fullmatch(name)]
+        page = names[start : start + max_results]
+        data = {
+            "kind": "storage#objects",
+            "items": [
+                self._lookup(bucket, name).resource(bucket, name) for name in page
+            ],
+        }
+        if "fields" in params:
+            fields = re.search(r"items\((.*)\)", params["fields"]).group(1)
+            data = {
+                "items": [
+                    {key: item[key] for key in fields.split(",") if key in item}
+                    for item in data["items"]
+                ]
+            }
+        if start + max_results < len(names):
+            data["nextPageToken"] = str(start + max_results)
+        return data
+
+    def do_GET(self):
+        """Handle a GET request."""
+        self._dispatch("GET")
+
+    def do_POST(self):
+        """Handle a POST request."""
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        """Handle a PUT request."""
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        """Handle a DELETE request."""
+        self._dispatch("DELETE")
+
+
+def _make_handler(server):
+    """Create a request handler class for the server."""
+    return type("Handler", (_Handler,), {"fake": server})
+
+
+def _metadata(fields):
+    """Pick the object metadata set by an upload or compose."""
+    return {key: fields[key] for key in ("contentEncoding",) if key in fields}
+
+
+def _glob_to_regex(glob):
+    """Translate a GCS matchGlob into a regex."""
+    regex = ""
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = glob.index("]", i + 2)
+            body = glob[i + 1 : end]
+            regex += f"[^{body[1:]}]" if body.startswith("!") else f"[{body}]"
+            i = end
+        elif char == "{":
+            end = glob.index("}", i)
+            alternatives = glob[i + 1 : end].split(",")
+            regex += f"(?:{'|'.join(_glob_to_regex(a).pattern for a in alternatives)})"
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex)
@@ -0,0 +1,252 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import asyncio
+import gzip
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers import bucket
+from opentaskpy.addons.gcp.remotehandlers.aio import AsyncClient
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+aiohttp = pytest.importorskip("aiohttp")
+
+
+def async_spec(bucket_spec, **kwargs):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {
+                "transport": "aiohttp",
+                "asyncConcurrency": 64,
+                "backoffFactor": 0,
+            },
+        },
+        **kwargs,
+    )
+
+
+def test_pull_files_async(fake_gcs, bucket_spec, tmp_path):
+    files = [f"dir/file{i:03}.txt" for i in range(200)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, file.encode())
+    data = b"a,b,c\n" * 10000
+    fake_gcs.put(BUCKET, "dir/data.csv", gzip.compress(data), contentEncoding="gzip")
+
+    handler = BucketTransfer(async_spec(bucket_spec, directory="dir"))
+    assert handler.pull_files_to_worker(handler.list_files(), tmp_path) == 0
+
+    assert len(os.listdir(tmp_path)) == 201
+    assert (tmp_path / "file123.txt").read_bytes() == b"dir/file123.txt"
+    assert (tmp_path / "data.csv").read_bytes() == data
+
+
+def test_pull_files_async_failures(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "file1.txt", b"hello")
+    fake_gcs.put(BUCKET, "file2.txt", b"world", crc32c="AAAAAA==", md5Hash="AAAA")
+    fake_gcs.inject_error("GET /download", 503)
+    fake_gcs.inject_error("GET /download", 401)
+
+    handler = BucketTransfer(async_spec(bucket_spec))
+    files = ["file1.txt", "file2.txt", "missing.txt"]
+    assert handler.pull_files_to_worker(files, tmp_path) == 1
+    # Throttling and an expired token are retried, checksums are still verified
+    assert os.listdir(tmp_path) == ["file1.txt"]
+
+
+def test_pull_files_async_leaves_sliced_objects_to_threads(
+    fake_gcs, bucket_spec, tmp_path
+):
+    large = os.urandom(100000)
+    fake_gcs.put(BUCKET, "large.bin", large)
+    fake_gcs.put(BUCKET, "small.txt", b"hello")
+
+    handler = BucketTransfer(
+        async_spec(bucket_spec, download={"sliced": {"threshold": 1024, "slices": 4}})
+    )
+    assert handler.pull_files_to_worker(handler.list_files(), tmp_path) == 0
+    assert (tmp_path / "large.bin").read_bytes() == large
+    ranges = [path for method, path in fake_gcs.requests if "generation=" in path]
+    assert len(ranges) == 4
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_push_files_async(fake_gcs, bucket_spec, tmp_path, compress):
+    for i in range(100):
+        (tmp_path / f"part-{i:03}.csv").write_bytes(f"{i},value\n".encode() * 100)
+    large = os.urandom(5000)
+    (tmp_path / "large.bin").write_bytes(large)
+
+    handler = BucketTransfer(
+        async_spec(
+            bucket_spec,
+            directory="landing",
+            upload={
+                "resumableThreshold": 4096,
+                "chunkSize": 262144,
+                "compress": compress,
+            },
+        )
+    )
+    assert handler.push_files_from_worker(str(tmp_path)) == 0
+
+    assert len(fake_gcs.names(BUCKET)) == 101
+    obj = fake_gcs.get(BUCKET, "landing/part-042.csv")
+    expected = b"42,value\n" * 100
+    assert (gzip.decompress(obj.data) if compress else obj.data) == expected
+    # The large file still goes through a resumable upload
+    large_obj = fake_gcs.get(BUCKET, "landing/large.bin")
+    assert (gzip.decompress(large_obj.data) if compress else large_obj.data) == large
+    assert any("uploadType=resumable" in path for _, path in fake_gcs.requests)
+
+
+def test_push_files_async_sync(fake_gcs, bucket_spec, tmp_path):
+    (tmp_path / "same.txt").write_bytes(b"same")
+    (tmp_path / "new.txt").write_bytes(b"new")
+    fake_gcs.put(BUCKET, "same.txt", b"same")
+
+    handler = BucketTransfer(async_spec(bucket_spec, upload={"sync": True}))
+    assert handler.push_files_from_worker(str(tmp_path)) == 0
+    uploads = [path for _, path in fake_gcs.requests if path.startswith("/upload")]
+    assert len(uploads) == 1
+    assert "ifGenerationMatch=0" in uploads[0]
+
+    # Something else creates the object first
+    (tmp_path / "race.txt").write_bytes(b"mine")
+    existing = handler._existing_objects()
+    fake_gcs.put(BUCKET, "race.txt", b"theirs")
+    handler._existing_objects = lambda: existing
+    assert handler.push_files_from_worker(str(tmp_path)) == 1
+    assert fake_gcs.get(BUCKET, "race.txt").data == b"theirs"
+
+
+def test_async_transport_concurrency(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.latency = 0.1
+    files = [f"small/file{i:03}.txt" for i in range(256)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, os.urandom(4096))
+
+    handler = BucketTransfer(
+        bucket_spec(
+            protocol={
+                "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+                "credentials": {},
+                "http": {"transport": "aiohttp", "asyncConcurrency": 128},
+            }
+        )
+    )
+    assert handler.pull_files_to_worker(files, tmp_path) == 0
+
+    assert len(os.listdir(tmp_path)) == 256
+    # Far more downloads are in flight at once than there would be threads
+    assert fake_gcs.peak_in_flight == 128
+
+
+@pytest.mark.parametrize("resume_attempts, result", [(2, 0), (1, 1)])
+def test_push_files_async_retries(
+    fake_gcs, bucket_spec, tmp_path, resume_attempts, result
+):
+    (tmp_path / "file.txt").write_bytes(b"data")
+    fake_gcs.inject_error("POST /upload", 503, count=2)
+
+    handler = BucketTransfer(
+        async_spec(bucket_spec, upload={"resumeAttempts": resume_attempts})
+    )
+    assert handler.push_files_from_worker(str(tmp_path)) == result
+
+    uploads = [path for _, path in fake_gcs.requests if path.startswith("/upload")]
+    assert len(uploads) == resume_attempts + 1
+    if result == 0:
+        assert fake_gcs.get(BUCKET, "file.txt").data == b"data"
+
+
+def test_push_files_async_retries_keep_preconditions(fake_gcs, bucket_spec, tmp_path):
+    (tmp_path / "file.txt").write_bytes(b"data")
+    fake_gcs.inject_error("POST /upload", 503)
+
+    handler = BucketTransfer(async_spec(bucket_spec, upload={"sync": True}))
+    assert handler.push_files_from_worker(str(tmp_path)) == 0
+    uploads = [path for _, path in fake_gcs.requests if path.startswith("/upload")]
+    assert len(uploads) == 2
+    assert all("ifGenerationMatch=0" in path for path in uploads)
+
+
+class FailingSession:
+    """A session whose requests fail with each of the given errors in turn."""
+
+    def __init__(self, errors):
+        """Start with the errors to raise."""
+        self.errors = list(errors)
+        self.requests = 0
+
+    async def request(self, method, url, **kwargs):
+        """Raise the next error."""
+        self.requests += 1
+        raise self.errors.pop(0)
+
+
+def connect_error():
+    return aiohttp.ClientConnectorError(
+        SimpleNamespace(host="localhost", port=1, ssl=None), OSError(111, "refused")
+    )
+
+
+@pytest.mark.parametrize(
+    "method, errors, requests",
+    [
+        # Nothing was sent, so it's safe to send again
+        ("POST", [connect_error(), connect_error()], 2),
+        # The upload may have been applied before the connection was lost
+        ("POST", [aiohttp.ServerDisconnectedError()], 1),
+        ("GET", [aiohttp.ServerDisconnectedError()] * 2, 2),
+    ],
+)
+def test_async_client_only_resends_unsent_requests(method, errors, requests):
+    client = AsyncClient(1, (1, 1), lambda token: "token", 0, 0)
+    client.session = FailingSession(errors)
+
+    async def send():
+        await client.request(method, "http://localhost/", retries=1)
+
+    with pytest.raises(aiohttp.ClientError):
+        asyncio.run(send())
+    assert client.session.requests == requests
+
+
+def test_pull_files_async_writes_off_the_event_loop(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    fake_gcs.put(BUCKET, "file.txt", b"hello")
+    threads = []
+    write = bucket._DownloadSink.write
+
+    def record_thread(self, chunk):
+        threads.append(threading.current_thread())
+        write(self, chunk)
+
+    monkeypatch.setattr(bucket._DownloadSink, "write", record_thread)
+    handler = BucketTransfer(async_spec(bucket_spec))
+    assert handler.pull_files_to_worker(["file.txt"], tmp_path) == 0
+    assert (tmp_path / "file.txt").read_bytes() == b"hello"
+    assert threads and threading.main_thread() not in threads
+
+
+def test_pull_files_async_records_metrics(fake_gcs, bucket_spec, tmp_path):
+    for i in range(10):
+        fake_gcs.put(BUCKET, f"file{i}.txt", b"hello")
+    fake_gcs.inject_error("GET /download", 503)
+
+    handler = BucketTransfer(async_spec(bucket_spec))
+    files = [f"file{i}.txt" for i in range(10)]
+    assert handler.pull_files_to_worker(files, tmp_path) == 0
+
+    stats = handler.metrics.stats[("request", "download")]
+    assert stats.count == 10
+    assert stats.retries == 1
+    assert stats.statuses == {200: 10}
+    assert handler.metrics.stats[("transfer", "download")].bytes == 50
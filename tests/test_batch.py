@@ -0,0 +1,46 @@
+# pylint: skip-file
+# mypy: ignore-errors
+from opentaskpy.addons.gcp.remotehandlers.batch import (
+    build_batch_body,
+    parse_batch_response,
+)
+
+
+def test_build_batch_body():
+    body, content_type = build_batch_body(
+        [("DELETE", "/storage/v1/b/bucket/o/a"), ("DELETE", "/storage/v1/b/bucket/o/b")]
+    )
+    boundary = content_type.split("boundary=")[1]
+    assert content_type.startswith("multipart/mixed")
+    assert body.count(f"--{boundary}\r\n".encode()) == 2
+    assert b"Content-ID: <1>\r\n\r\nDELETE /storage/v1/b/bucket/o/b HTTP/1.1" in body
+    assert body.endswith(f"--{boundary}--\r\n".encode())
+
+
+def test_parse_batch_response():
+    content = (
+        b"--batch_abc\r\n"
+        b"Content-Type: application/http\r\n"
+        b"Content-ID: <response-1>\r\n"
+        b"\r\n"
+        b"HTTP/1.1 404 Not Found\r\n"
+        b"Content-Type: application/json; charset=UTF-8\r\n"
+        b"\r\n"
+        b'{"error": {"code": 404, "message": "No such object"}}\r\n'
+        b"--batch_abc\r\n"
+        b"Content-Type: application/http\r\n"
+        b"Content-ID: <response-0>\r\n"
+        b"\r\n"
+        b"HTTP/1.1 204 No Content\r\n"
+        b"Content-Length: 0\r\n"
+        b"\r\n"
+        b"\r\n"
+        b"--batch_abc--\r\n"
+    )
+    responses = parse_batch_response("multipart/mixed; boundary=batch_abc", content)
+    assert responses[0].status_code == 204
+    assert responses[0].ok
+    assert responses[0].data == {}
+    assert responses[1].status_code == 404
+    assert not responses[1].ok
+    assert responses[1].data["error"]["message"] == "No such object"
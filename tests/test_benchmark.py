@@ -0,0 +1,131 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import json
+from dataclasses import asdict, replace
+
+from benchmark import (
+    PROFILES,
+    SCENARIOS,
+    Result,
+    compare,
+    main,
+    run_benchmark,
+    run_scaling,
+    scaling_failures,
+)
+
+
+def make_result(**kwargs):
+    return Result(
+        **{
+            "scenario": "pull",
+            "result": 0,
+            "objects": 100,
+            "bytes": 102400,
+            "seconds": 1.0,
+            "objects_per_second": 100.0,
+            "megabytes_per_second": 0.1,
+            "p50": 0.01,
+            "p99": 0.05,
+            "requests": 100,
+            "errors": 0,
+            "retries": 0,
+            "peak_rss_mb": 50.0,
+            **kwargs,
+        }
+    )
+
+
+def test_run_benchmark():
+    results = run_benchmark(replace(PROFILES["smoke"], count=20, concurrency=4))
+
+    assert [result.scenario for result in results] == list(SCENARIOS)
+    for result in results:
+        assert result.result == 0
+        assert result.objects_per_second > 0
+        assert result.p50 <= result.p99
+        assert result.peak_rss_mb > 0
+    results = {result.scenario: result for result in results}
+    assert results["list"].requests == 1
+    assert results["pull"].requests == 20
+    assert results["pull"].bytes == 20 * 1024
+    assert results["push"].requests == 20
+
+
+def test_run_benchmark_with_errors():
+    profile = replace(PROFILES["flaky"], count=50, latency=0, error_rate=0.1)
+    results = run_benchmark(profile, ["pull", "push"])
+
+    # Unavailable responses to downloads and uploads are retried
+    for result in results:
+        assert result.result == 0
+        assert result.retries > 0
+
+
+def test_run_benchmark_throttled():
+    profile = replace(PROFILES["throttled"], count=50, adaptive=True)
+    results = run_benchmark(profile, ["pull", "push"])
+
+    assert [result.result for result in results] == [0, 0]
+
+
+def test_compare():
+    baseline = [asdict(make_result())]
+
+    assert compare([make_result(objects_per_second=85.0)], baseline, 0.2) == []
+    assert compare([make_result(objects_per_second=75.0)], baseline, 0.2) == [
+        "pull: throughput 75.0 objects/s is below 100.0"
+    ]
+    assert compare([make_result(p99=0.07, peak_rss_mb=70.0)], baseline, 0.2) == [
+        "pull: p99 latency 70.0ms is above 50.0ms",
+        "pull: peak RSS 70.0MB is above 50.0MB",
+    ]
+    # Tiny absolute differences in latency are noise
+    assert compare([make_result(p50=0.0105)], [asdict(make_result(p50=0.0001))], 0.2)
+    assert (
+        compare([make_result(p50=0.0005)], [asdict(make_result(p50=0.0001))], 0.2) == []
+    )
+    # Scenarios missing from the baseline are skipped
+    assert compare([make_result(scenario="push")], baseline, 0.2) == []
+
+
+def test_run_scaling():
+    profile = replace(PROFILES["smoke"], count=20)
+    results = run_scaling(profile, [1, 4])
+
+    assert [result.scenario for result in results] == ["pull@1", "pull@4"]
+    assert [result.result for result in results] == [0, 0]
+
+
+def test_scaling_failures():
+    results = [
+        make_result(scenario="pull@1", objects_per_second=50.0),
+        make_result(scenario="pull@4", objects_per_second=150.0),
+        make_result(scenario="pull@16", objects_per_second=250.0),
+    ]
+    # 16 is 4 times the concurrency of 4, so at least twice the throughput is needed
+    assert scaling_failures([1, 4, 16], results) == [
+        "pull@16: throughput 250.0 objects/s is below 300.0, half the ideal speedup"
+        " from pull@4"
+    ]
+    assert scaling_failures([1, 4], results[:2]) == []
+
+
+def test_main_fails_on_regression(tmp_path, caplog):
+    baseline = tmp_path / "baseline.json"
+    output = tmp_path / "results.json"
+    args = ["--scenario", "list", "--count", "20", "--output", str(output)]
+    assert main(args) == 0
+    assert json.loads(output.read_text())[0]["scenario"] == "list"
+
+    # Impossible to miss
+    slow = make_result(
+        scenario="list", objects_per_second=0, p50=1e9, p99=1e9, peak_rss_mb=1e9
+    )
+    baseline.write_text(json.dumps([asdict(slow)]))
+    assert main(args + ["--baseline", str(baseline)]) == 0
+    baseline.write_text(
+        json.dumps([asdict(make_result(scenario="list", objects_per_second=1e9))])
+    )
+    assert main(args + ["--baseline", str(baseline)]) == 1
+    assert "Regression: list: throughput" in caplog.text
@@ -0,0 +1,82 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import base64
+import hashlib
+import os
+
+import pytest
+
+from opentaskpy.addons.gcp.remotehandlers import checksum
+
+
+def test_crc32c_check_value():
+    assert checksum.crc32c_extend(0, b"123456789") == 0xE3069283
+
+
+def test_crc32c_pure_python_matches(monkeypatch):
+    data = os.urandom(5000)
+    expected = checksum.crc32c_extend(0, data)
+    monkeypatch.setattr(checksum, "google_crc32c", None)
+    assert checksum.crc32c_extend(0, data) == expected
+    # Extending in pieces gives the same result
+    assert checksum.crc32c_extend(
+        checksum.crc32c_extend(0, data[:123]), data[123:]
+    ) == (expected)
+
+
+@pytest.mark.parametrize("split", [0, 1, 1000, 4999, 5000])
+def test_crc32c_combine(split):
+    data = os.urandom(5000)
+    first, second = data[:split], data[split:]
+    assert checksum.crc32c_combine(
+        checksum.crc32c_extend(0, first),
+        checksum.crc32c_extend(0, second),
+        len(second),
+    ) == checksum.crc32c_extend(0, data)
+
+
+def test_crc32c_base64_round_trip():
+    crc = checksum.crc32c_extend(0, b"hello")
+    assert checksum.crc32c_from_base64(checksum.crc32c_to_base64(crc)) == crc
+
+
+def test_streaming_hash(monkeypatch):
+    data = os.urandom(5000)
+    expected = checksum.object_hashes(
+        {
+            "crc32c": checksum.crc32c_to_base64(checksum.crc32c_extend(0, data)),
+            "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+        }
+    )
+    for algorithm in ("crc32c", "md5"):
+        streaming_hash = checksum.StreamingHash(algorithm)
+        streaming_hash.update(data[:1000])
+        streaming_hash.update(data[1000:])
+        assert streaming_hash.matches(expected)
+        assert streaming_hash.header() == f"{algorithm}={expected[algorithm]}"
+
+    monkeypatch.setattr(checksum, "FAST_CRC32C", False)
+    assert checksum.StreamingHash.for_expected(expected).algorithm == "md5"
+    assert (
+        checksum.StreamingHash.for_expected({"crc32c": expected["crc32c"]}).algorithm
+        == "crc32c"
+    )
+    assert checksum.StreamingHash.for_expected({}) is None
+
+
+def test_fast_hash_available(monkeypatch):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", True)
+    assert checksum.fast_hash_available({"crc32c": "n03x6A=="})
+    assert not checksum.fast_hash_available({})
+
+    monkeypatch.setattr(checksum, "FAST_CRC32C", False)
+    assert checksum.fast_hash_available({"crc32c": "n03x6A==", "md5": "AAAA"})
+    assert not checksum.fast_hash_available({"crc32c": "n03x6A=="})
+
+
+def test_parse_goog_hash():
+    assert checksum.parse_goog_hash("crc32c=n03x6A==,md5=Ojk9c3dhfxgoKVVHYwFbHQ==") == {
+        "crc32c": "n03x6A==",
+        "md5": "Ojk9c3dhfxgoKVVHYwFbHQ==",
+    }
+    assert checksum.parse_goog_hash(None) == {}
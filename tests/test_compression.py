@@ -0,0 +1,44 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import gzip
+import io
+import os
+
+import pytest
+
+from opentaskpy.addons.gcp.remotehandlers.compression import GzipDecoder, gzip_chunks
+
+
+def test_gzip_chunks_round_trip():
+    data = os.urandom(1000) + b"a,b,c\n" * 100000
+    compressed = b"".join(gzip_chunks(io.BytesIO(data), 65536))
+    assert gzip.decompress(compressed) == data
+    assert len(compressed) < len(data) / 10
+
+
+def test_gzip_chunks_is_deterministic():
+    data = b"a,b,c\n" * 10000
+    first = b"".join(gzip_chunks(io.BytesIO(data), 4096))
+    second = b"".join(gzip_chunks(io.BytesIO(data), 1000))
+    assert first == second
+    assert b"".join(gzip_chunks(io.BytesIO(data), 4096, level=1)) != first
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_gzip_decoder_multiple_members(chunk_size):
+    # Composing gzipped objects concatenates their members
+    data = gzip.compress(b"hello " * 1000) + gzip.compress(b"world")
+    decoder = GzipDecoder()
+    output = b"".join(
+        decoder.decompress(data[i : i + chunk_size])
+        for i in range(0, len(data), chunk_size)
+    )
+    decoder.finish()
+    assert output == b"hello " * 1000 + b"world"
+
+
+def test_gzip_decoder_truncated():
+    decoder = GzipDecoder()
+    decoder.decompress(gzip.compress(b"hello" * 1000)[:-10])
+    with pytest.raises(ValueError):
+        decoder.finish()
@@ -0,0 +1,114 @@
+# pylint: skip-file
+# mypy: allow-untyped-defs
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from opentaskpy.addons.gcp.remotehandlers import creds
+from opentaskpy.addons.gcp.remotehandlers.metrics import Metrics
+
+service_account_info = {
+    "client_email": "file.upload@project.iam.gserviceaccount.com",
+    "private_key": "xxx",
+    "token_uri": "https://oauth2.googleapis.com/token",
+}
+
+
+class FakeCredentials:
+    """Service account credentials that count their refreshes."""
+
+    refresh_count = 0
+    lifetime = timedelta(hours=1)
+
+    def __init__(self):
+        """Start without a token, like real credentials."""
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        """Issue a new token, valid for lifetime."""
+        # Slow refresh, so concurrent callers overlap
+        time.sleep(0.05)
+        FakeCredentials.refresh_count += 1
+        self.token = f"token-{FakeCredentials.refresh_count}"
+        self.expiry = datetime.now(UTC).replace(tzinfo=None) + self.lifetime
+
+
+@pytest.fixture(autouse=True)
+def fake_credentials(monkeypatch):
+    FakeCredentials.refresh_count = 0
+    FakeCredentials.lifetime = timedelta(hours=1)
+    creds._token_cache.clear()
+    monkeypatch.setattr(
+        creds.service_account.Credentials,
+        "from_service_account_info",
+        lambda info, scopes: FakeCredentials(),
+    )
+    yield
+    creds._token_cache.clear()
+
+
+def test_token_is_cached():
+    protocol = {"credentials": service_account_info}
+    assert creds.get_access_token(protocol) == "token-1"
+    assert creds.get_access_token(protocol) == "token-1"
+    assert FakeCredentials.refresh_count == 1
+
+
+def test_token_cache_keyed_by_identity_and_scopes():
+    protocol = {"credentials": service_account_info}
+    other_protocol = {
+        "credentials": {**service_account_info, "client_email": "other@project"}
+    }
+    creds.get_access_token(protocol)
+    creds.get_access_token(other_protocol)
+    creds.get_access_token(protocol, scopes=("scope-a",))
+    assert FakeCredentials.refresh_count == 3
+
+
+def test_token_refreshed_near_expiry():
+    FakeCredentials.lifetime = timedelta(minutes=2)
+    protocol = {"credentials": service_account_info}
+    assert creds.get_access_token(protocol) == "token-1"
+    # Within the refresh margin, so must be refreshed again
+    assert creds.get_access_token(protocol) == "token-2"
+
+
+def test_concurrent_callers_share_one_refresh():
+    protocol = {"credentials": service_account_info}
+    results = []
+
+    def worker():
+        results.append(creds.get_access_token(protocol))
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert FakeCredentials.refresh_count == 1
+    assert results == ["token-1"] * 20
+
+
+def test_stale_token_is_refreshed_once():
+    protocol = {"credentials": service_account_info}
+    assert creds.get_access_token(protocol) == "token-1"
+    assert creds.get_access_token(protocol, stale_token="token-1") == "token-2"
+    # Another caller that saw the same rejected token gets the new one
+    assert creds.get_access_token(protocol, stale_token="token-1") == "token-2"
+    assert FakeCredentials.refresh_count == 2
+
+
+def test_token_refresh_is_recorded():
+    protocol = {"credentials": service_account_info}
+    metrics = Metrics()
+    creds.get_access_token(protocol, metrics=metrics)
+    creds.get_access_token(protocol, metrics=metrics)
+    creds.get_access_token(protocol, stale_token="token-1", metrics=metrics)
+
+    # Only the two refreshes are recorded, not the use of the cached token
+    assert metrics.stats[("token_refresh", "token")].count == 2
+    assert metrics.stats[("token_refresh", "token")].duration >= 0.1
@@ -0,0 +1,240 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import gzip
+import os
+
+import pytest
+from conftest import BUCKET
+from opentaskpy.taskhandlers import transfer
+
+from opentaskpy.addons.gcp.remotehandlers import bucket
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+DEST_BUCKET = "bucket-dest"
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(bucket.time, "sleep", lambda delay: None)
+
+
+def object_requests(fake_gcs):
+    # Anything other than listing, copying or deleting would go via the worker
+    return [
+        path
+        for method, path in fake_gcs.requests
+        if path.startswith(("/download", "/upload"))
+    ]
+
+
+def test_transfer_files_between_buckets(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_BATCH_SIZE", 10)
+    files = [f"dir/nested/part-{i:02}.csv" for i in range(25)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, file.encode())
+
+    source = BucketTransfer(bucket_spec(directTransfer=True))
+    destination_spec = bucket_spec(
+        bucket=DEST_BUCKET,
+        directory="landing",
+        rename={"pattern": "^part-", "sub": "renamed-"},
+    )
+    destination = BucketTransfer(destination_spec)
+    assert source.supports_direct_transfer()
+    assert source.transfer_files(files, destination_spec, destination) == 0
+
+    assert fake_gcs.names(DEST_BUCKET) == [
+        f"landing/renamed-{i:02}.csv" for i in range(25)
+    ]
+    assert fake_gcs.get(DEST_BUCKET, "landing/renamed-07.csv").data == (
+        b"dir/nested/part-07.csv"
+    )
+    # The source objects are left alone
+    assert fake_gcs.names(BUCKET) == files
+    assert object_requests(fake_gcs) == []
+
+
+def test_transfer_files_large_objects(fake_gcs, bucket_spec, monkeypatch):
+    # Copies that don't finish in the batch are carried on from the rewriteToken
+    data = os.urandom(3 * 1048576)
+    fake_gcs.put(BUCKET, "large.bin", data)
+    original_copy = BucketTransfer._copy_objects
+
+    def partial_copy(self, *args, **kwargs):
+        return original_copy(self, *args[:4], 1048576)
+
+    monkeypatch.setattr(BucketTransfer, "_copy_objects", partial_copy)
+    source = BucketTransfer(bucket_spec())
+    destination = BucketTransfer(bucket_spec(bucket=DEST_BUCKET))
+    assert source.transfer_files(["large.bin"], destination.spec, destination) == 0
+    assert fake_gcs.get(DEST_BUCKET, "large.bin").data == data
+    rewrites = [path for method, path in fake_gcs.requests if "/rewriteTo/" in path]
+    # The first call is in the batch, the other two are made individually
+    assert len(rewrites) == 3
+
+
+def test_transfer_files_reports_failures(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file1.txt", b"hello")
+
+    source = BucketTransfer(bucket_spec())
+    destination = BucketTransfer(bucket_spec(bucket=DEST_BUCKET))
+    files = {"file1.txt": {}, "missing.txt": {}}
+    assert source.transfer_files(files, destination.spec, destination) == 1
+    # Every other file is still copied
+    assert fake_gcs.names(DEST_BUCKET) == ["file1.txt"]
+
+
+def test_pull_files_from_source_bucket(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"hello")
+
+    source_spec = bucket_spec(directory="dir")
+    destination = BucketTransfer(bucket_spec(bucket=DEST_BUCKET, directory="in"))
+    assert destination.pull_files(["dir/file1.txt"], source_spec) == 0
+    assert fake_gcs.get(DEST_BUCKET, "in/file1.txt").data == b"hello"
+
+
+def test_pull_files_from_source_bucket_via_worker(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"hello")
+
+    source_spec = bucket_spec(directory="dir")
+    destination = BucketTransfer(
+        bucket_spec(bucket=DEST_BUCKET, upload={"compress": True})
+    )
+    assert destination.pull_files(["dir/file1.txt"], source_spec) == 0
+    obj = fake_gcs.get(DEST_BUCKET, "file1.txt")
+    assert obj.metadata["contentEncoding"] == "gzip"
+    assert gzip.decompress(obj.data) == b"hello"
+
+
+def test_transfer_task_copies_directly(fake_gcs, bucket_spec, tmp_path, monkeypatch):
+    monkeypatch.setenv("OTF_STAGING_DIR", str(tmp_path))
+    for i in range(3):
+        fake_gcs.put(BUCKET, f"dir/file{i}.txt", f"data{i}".encode())
+
+    task = transfer.Transfer(
+        None,
+        "gcp-to-gcp",
+        {
+            "type": "transfer",
+            "source": bucket_spec(
+                directory="dir", fileRegex=r"file\d\.txt", directTransfer=True
+            ),
+            "destination": [bucket_spec(bucket=DEST_BUCKET, directory="copied")],
+        },
+    )
+    assert task.run()
+
+    assert fake_gcs.names(DEST_BUCKET) == [f"copied/file{i}.txt" for i in range(3)]
+    assert object_requests(fake_gcs) == []
+
+
+def test_transfer_task_goes_via_worker_by_default(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("OTF_STAGING_DIR", str(tmp_path))
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"data")
+
+    task = transfer.Transfer(
+        None,
+        "gcp-to-gcp-via-worker",
+        {
+            "type": "transfer",
+            "source": bucket_spec(directory="dir", fileRegex=r"file\d\.txt"),
+            "destination": [bucket_spec(bucket=DEST_BUCKET, directory="copied")],
+        },
+    )
+    assert task.run()
+
+    assert fake_gcs.get(DEST_BUCKET, "copied/file1.txt").data == b"data"
+    assert object_requests(fake_gcs)
+    assert not [path for method, path in fake_gcs.requests if "/rewriteTo/" in path]
+
+
+def test_supports_direct_transfer(bucket_spec):
+    # Only when opted in
+    assert not BucketTransfer(bucket_spec()).supports_direct_transfer()
+    assert BucketTransfer(bucket_spec(directTransfer=True)).supports_direct_transfer()
+    assert BucketTransfer(
+        bucket_spec(directTransfer=True, encryption={"decrypt": False})
+    ).supports_direct_transfer()
+    # Decryption has to be done on the worker
+    assert not BucketTransfer(
+        bucket_spec(
+            directTransfer=True, encryption={"decrypt": True, "private_key": "key"}
+        )
+    ).supports_direct_transfer()
+
+
+@pytest.mark.parametrize(
+    "upload",
+    [
+        {"sync": True},
+        {"compress": True},
+        {"chunkSize": 262144, "resumableThreshold": 1024},
+        {"composite": {"threshold": 1024, "parts": 2}},
+    ],
+)
+def test_transfer_files_via_worker(fake_gcs, bucket_spec, upload):
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"hello" * 1000)
+
+    source = BucketTransfer(bucket_spec())
+    destination = BucketTransfer(bucket_spec(bucket=DEST_BUCKET, upload=upload))
+    assert source.transfer_files(["dir/file1.txt"], destination.spec, destination) == 0
+
+    obj = fake_gcs.get(DEST_BUCKET, "file1.txt")
+    if upload.get("compress"):
+        assert obj.metadata["contentEncoding"] == "gzip"
+        assert gzip.decompress(obj.data) == b"hello" * 1000
+    else:
+        assert obj.data == b"hello" * 1000
+    # The upload settings are applied by uploading from the worker
+    assert object_requests(fake_gcs)
+    assert not [path for method, path in fake_gcs.requests if "/rewriteTo/" in path]
+
+
+def test_transfer_files_via_worker_sync_skips_unchanged(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file1.txt", b"hello")
+    fake_gcs.put(DEST_BUCKET, "file1.txt", b"hello")
+
+    source = BucketTransfer(bucket_spec())
+    destination = BucketTransfer(bucket_spec(bucket=DEST_BUCKET, upload={"sync": True}))
+    assert source.transfer_files(["file1.txt"], destination.spec, destination) == 0
+    assert not [
+        path for method, path in fake_gcs.requests if path.startswith("/upload")
+    ]
+
+
+def test_transfer_files_rewrites_with_supported_upload_settings(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file1.txt", b"hello")
+
+    source = BucketTransfer(bucket_spec())
+    destination = BucketTransfer(
+        bucket_spec(bucket=DEST_BUCKET, upload={"concurrency": 4, "verify": False})
+    )
+    assert source.transfer_files(["file1.txt"], destination.spec, destination) == 0
+    assert fake_gcs.get(DEST_BUCKET, "file1.txt").data == b"hello"
+    assert object_requests(fake_gcs) == []
+
+
+def test_transfer_task_compressed_destination(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("OTF_STAGING_DIR", str(tmp_path))
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"data" * 1000)
+
+    task = transfer.Transfer(
+        None,
+        "gcp-to-gcp-compressed",
+        {
+            "type": "transfer",
+            "source": bucket_spec(
+                directory="dir", fileRegex=r"file\d\.txt", directTransfer=True
+            ),
+            "destination": [bucket_spec(bucket=DEST_BUCKET, upload={"compress": True})],
+        },
+    )
+    assert task.run()
+
+    obj = fake_gcs.get(DEST_BUCKET, "file1.txt")
+    assert obj.metadata["contentEncoding"] == "gzip"
+    assert gzip.decompress(obj.data) == b"data" * 1000
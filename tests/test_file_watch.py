@@ -0,0 +1,70 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import threading
+import time
+
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+SUBSCRIPTION = "projects/test/subscriptions/bucket-test-notifications"
+
+
+def pubsub_spec(bucket_spec, **kwargs):
+    return bucket_spec(
+        directory="landing",
+        fileWatch={"pubsub": {"subscription": SUBSCRIPTION, "pullTimeout": 5}},
+        **kwargs,
+    )
+
+
+def pulls(fake_gcs):
+    return [path for method, path in fake_gcs.requests if path.endswith(":pull")]
+
+
+def test_file_watch_reconciles_with_listing(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "landing/file.txt", b"data")
+
+    handler = BucketTransfer(pubsub_spec(bucket_spec))
+    assert list(handler.list_files(file_pattern=r".*\.txt")) == ["landing/file.txt"]
+    # Once the watch has found files, listings are made as normal
+    assert list(handler.list_files(file_pattern=r".*\.txt")) == ["landing/file.txt"]
+    assert pulls(fake_gcs) == []
+
+
+def test_file_watch_uses_notifications(fake_gcs, bucket_spec):
+    handler = BucketTransfer(pubsub_spec(bucket_spec))
+    assert handler.list_files(file_pattern=r".*\.txt") == {}
+
+    # Notifications that don't match are ignored, but still acknowledged
+    fake_gcs.put(BUCKET, "landing/file.csv", b"data")
+    fake_gcs.notify(BUCKET, "landing/file.csv")
+    fake_gcs.notify("other-bucket", "landing/file.txt")
+    fake_gcs.put(BUCKET, "landing/deleted.txt", b"data")
+    fake_gcs.notify(BUCKET, "landing/deleted.txt")
+    fake_gcs.notify(BUCKET, "landing/deleted.txt", "OBJECT_DELETE")
+    assert handler.list_files(file_pattern=r".*\.txt") == {}
+    assert not fake_gcs.messages and not fake_gcs.unacked
+
+    def arrive():
+        time.sleep(0.2)
+        fake_gcs.put(BUCKET, "landing/file.txt", b"data")
+        fake_gcs.notify(BUCKET, "landing/file.txt")
+
+    threading.Thread(target=arrive).start()
+    start = time.perf_counter()
+    files = handler.list_files(file_pattern=r".*\.txt")
+    # The pull returns as soon as the notification is published
+    assert time.perf_counter() - start < 1
+    assert list(files) == ["landing/file.txt"]
+    assert files["landing/file.txt"]["size"] == "4"
+    assert len(pulls(fake_gcs)) == 2
+
+
+def test_file_watch_ignores_notifications_for_missing_objects(fake_gcs, bucket_spec):
+    handler = BucketTransfer(pubsub_spec(bucket_spec))
+    assert handler.list_files() == {}
+
+    # Deleted before the notification was processed
+    fake_gcs.notify(BUCKET, "landing/gone.txt")
+    assert handler.list_files() == {}
@@ -0,0 +1,349 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from conftest import BUCKET
+from opentaskpy.exceptions import RemoteTransferError
+
+from opentaskpy.addons.gcp.remotehandlers import bucket
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+from opentaskpy.addons.gcp.remotehandlers.listindex import ListingIndex
+
+
+def list_params(fake_gcs):
+    return [
+        {k: v[-1] for k, v in parse_qs(urlsplit(path).query).items()}
+        for method, path in fake_gcs.requests
+        if method == "GET" and urlsplit(path).path.endswith(f"/b/{BUCKET}/o")
+    ]
+
+
+def put_files(fake_gcs):
+    for name in [
+        "dir/a.txt",
+        "dir/b.txt",
+        "dir/c.csv",
+        "dir/nested/d.txt",
+        "other/e.txt",
+    ]:
+        fake_gcs.put(BUCKET, name, b"data")
+
+
+def test_list_files_uses_match_glob(fake_gcs, bucket_spec):
+    put_files(fake_gcs)
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+
+    files = handler.list_files(file_pattern=r".*\.txt$")
+    assert sorted(files) == ["dir/a.txt", "dir/b.txt", "dir/nested/d.txt"]
+    assert files["dir/a.txt"]["size"] == "4"
+    assert files["dir/a.txt"]["modified_time"]
+
+    params = list_params(fake_gcs)
+    assert len(params) == 1
+    assert params[0]["matchGlob"] == "{*.txt,**/*.txt}"
+    assert params[0]["maxResults"] == "1000"
+    assert (
+        params[0]["fields"] == "nextPageToken,items(name,size,updated,crc32c,md5Hash)"
+    )
+
+
+def test_list_files_filters_untranslatable_regex_locally(fake_gcs, bucket_spec):
+    put_files(fake_gcs)
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+
+    files = handler.list_files(file_pattern=r"(a|c)\.")
+    assert sorted(files) == ["dir/a.txt", "dir/c.csv"]
+    assert "matchGlob" not in list_params(fake_gcs)[0]
+
+
+def test_list_files_non_recursive(fake_gcs, bucket_spec):
+    put_files(fake_gcs)
+    handler = BucketTransfer(bucket_spec(directory="dir", recursive=False))
+
+    files = handler.list_files(file_pattern=r".*\.txt")
+    assert sorted(files) == ["dir/a.txt", "dir/b.txt"]
+    params = list_params(fake_gcs)[0]
+    assert params["prefix"] == "dir/"
+    assert params["delimiter"] == "/"
+
+
+def test_list_files_pages(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_OBJECTS_PER_QUERY", 10)
+    for i in range(25):
+        fake_gcs.put(BUCKET, f"dir/file{i:02}.txt", b"data")
+        fake_gcs.put(BUCKET, f"dir/file{i:02}.log", b"data")
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+
+    files = handler.list_files(file_pattern=r"(?a)file1\d\.txt")
+    assert sorted(files) == [f"dir/file{i}.txt" for i in range(10, 20)]
+    assert len(list_params(fake_gcs)) == 1
+
+    assert len(handler.list_files()) == 50
+    assert len(list_params(fake_gcs)) == 1 + 5
+
+
+def no_retry_spec(bucket_spec, **kwargs):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"retries": 0, "backoffFactor": 0.01},
+        },
+        **kwargs,
+    )
+
+
+def test_list_files_retries_throttled_page(fake_gcs, bucket_spec, monkeypatch):
+    delays = []
+    monkeypatch.setattr(bucket.time, "sleep", delays.append)
+    put_files(fake_gcs)
+    fake_gcs.inject_error(
+        f"GET /storage/v1/b/{BUCKET}/o", 429, headers={"Retry-After": "2"}
+    )
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 503)
+    handler = BucketTransfer(no_retry_spec(bucket_spec, directory="dir"))
+
+    assert len(handler.list_files(file_pattern=r".*\.txt")) == 3
+    assert len(list_params(fake_gcs)) == 3
+    # Retry-After is honoured, and other delays use jittered backoff
+    assert delays[0] == 2
+    assert 0 <= delays[1] <= 0.02
+
+
+def test_list_files_gives_up_after_max_attempts(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket.time, "sleep", lambda delay: None)
+    put_files(fake_gcs)
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 503, count=100)
+    handler = BucketTransfer(no_retry_spec(bucket_spec, directory="dir"))
+
+    assert handler.list_files() == {}
+    assert len(list_params(fake_gcs)) == bucket.DEFAULT_LIST_ATTEMPTS
+
+
+def test_list_files_does_not_retry_client_errors(fake_gcs, bucket_spec):
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 403, count=100)
+    handler = BucketTransfer(no_retry_spec(bucket_spec))
+
+    assert handler.list_files() == {}
+    assert len(list_params(fake_gcs)) == 1
+
+
+def test_list_files_refreshes_token_on_401(fake_gcs, bucket_spec, monkeypatch):
+    stale_tokens = []
+
+    def get_access_token(protocol, stale_token=None, metrics=None):
+        stale_tokens.append(stale_token)
+        return "token" if stale_token is None else "new-token"
+
+    monkeypatch.setattr(bucket, "get_access_token", get_access_token)
+    put_files(fake_gcs)
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 401)
+    handler = BucketTransfer(no_retry_spec(bucket_spec, directory="dir"))
+
+    assert len(handler.list_files()) == 4
+    assert "token" in stale_tokens
+    assert handler.credentials == "new-token"
+
+
+def index_spec(bucket_spec, tmp_path, **index):
+    return bucket_spec(
+        directory="landing",
+        fileWatch={"index": {"path": str(tmp_path / "index.db"), **index}},
+    )
+
+
+def test_list_files_index_is_incremental(fake_gcs, bucket_spec, tmp_path, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_OBJECTS_PER_QUERY", 100)
+    for i in range(2000):
+        fake_gcs.put(BUCKET, f"landing/file{i:05}.csv", b"data")
+
+    handler = BucketTransfer(index_spec(bucket_spec, tmp_path))
+    assert len(handler.list_files(file_pattern=r".*\.csv")) == 2000
+    # The first listing is a full scan
+    assert len(list_params(fake_gcs)) == 20
+    assert "generation" in list_params(fake_gcs)[0]["fields"]
+
+    fake_gcs.put(BUCKET, "landing/file02000.csv", b"data")
+    fake_gcs.put(BUCKET, "landing/file02001.txt", b"data")
+    files = handler.list_files(file_pattern=r".*\.csv")
+    assert len(files) == 2001
+    assert "landing/file02000.csv" in files
+    # Listings from the index keep the hashes, so downloads are still verified
+    for name in ("landing/file00000.csv", "landing/file02000.csv"):
+        assert files[name]["crc32c"] and files[name]["md5Hash"]
+
+    # Later polls only list new objects, in a single request
+    params = list_params(fake_gcs)[20:]
+    assert len(params) == 1
+    assert params[0]["startOffset"] == "landing/file01999.csv"
+
+
+def test_list_files_index_rescans(fake_gcs, bucket_spec, tmp_path, monkeypatch):
+    fake_gcs.put(BUCKET, "landing/b.txt", b"data")
+    handler = BucketTransfer(index_spec(bucket_spec, tmp_path, rescanInterval=60))
+    assert list(handler.list_files()) == ["landing/b.txt"]
+
+    # A name that sorts before the last one seen isn't picked up incrementally
+    fake_gcs.put(BUCKET, "landing/a.txt", b"data")
+    assert list(handler.list_files()) == ["landing/b.txt"]
+
+    # But is by the next full scan
+    now = time.time()
+    monkeypatch.setattr(bucket.time, "time", lambda: now + 60)
+    assert list(handler.list_files()) == ["landing/a.txt", "landing/b.txt"]
+    assert "startOffset" not in list_params(fake_gcs)[-1]
+
+
+def test_list_files_index_unchanged_by_failed_scan(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(bucket.time, "sleep", lambda delay: None)
+    monkeypatch.setattr(bucket, "MAX_OBJECTS_PER_QUERY", 1)
+    fake_gcs.put(BUCKET, "landing/a.txt", b"data")
+    fake_gcs.put(BUCKET, "landing/b.txt", b"data")
+    handler = BucketTransfer(index_spec(bucket_spec, tmp_path, rescanInterval=0))
+    assert len(handler.list_files()) == 2
+
+    # The second page of the next scan fails
+    fake_gcs.inject_error("pageToken=1", 403)
+    fake_gcs.put(BUCKET, "landing/c.txt", b"data")
+    assert handler.list_files() == {}
+    assert len(handler.list_files()) == 3
+
+
+def test_index_not_locked_while_listing(tmp_path):
+    path = str(tmp_path / "index.db")
+    index = ListingIndex(path)
+    other = sqlite3.connect(path, timeout=0)
+
+    def items():
+        yield {"name": "landing/a.txt", "size": "4", "updated": "then"}
+        # Another task sharing the index can write while this one is still listing
+        with other:
+            other.execute("INSERT INTO listings VALUES ('other', '', 0)")
+        yield {"name": "landing/b.txt", "size": "4", "updated": "then"}
+
+    index.full_scan("key", items(), 1.0)
+    assert [item["name"] for item in index.objects("key")] == [
+        "landing/a.txt",
+        "landing/b.txt",
+    ]
+    other.close()
+
+
+def test_index_adds_hash_columns(tmp_path):
+    path = str(tmp_path / "index.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE objects (key TEXT NOT NULL, name TEXT NOT NULL,"
+            " size TEXT NOT NULL, updated TEXT NOT NULL, generation TEXT,"
+            " PRIMARY KEY (key, name))"
+        )
+        connection.execute("INSERT INTO objects VALUES ('key', 'a', '4', 'then', '1')")
+    connection.close()
+
+    index = ListingIndex(path)
+    assert list(index.objects("key")) == [{"name": "a", "size": "4", "updated": "then"}]
+    index.full_scan(
+        "key",
+        [{"name": "a", "size": "4", "updated": "now", "crc32c": "c", "md5Hash": "m"}],
+        1.0,
+    )
+    assert list(index.objects("key")) == [
+        {"name": "a", "size": "4", "updated": "now", "crc32c": "c", "md5Hash": "m"}
+    ]
+
+
+def test_list_files_index_forgets_moved_objects(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "landing/a.txt", b"data")
+    fake_gcs.put(BUCKET, "landing/b.txt", b"data")
+    spec = index_spec(bucket_spec, tmp_path, rescanInterval=3600) | {
+        "postCopyAction": {"action": "move", "destination": "archive"}
+    }
+    handler = BucketTransfer(spec)
+    assert len(handler.list_files()) == 2
+    assert handler.handle_post_copy_action(["landing/a.txt"]) == 0
+
+    # The next poll doesn't find the moved object in the index
+    assert list(BucketTransfer(spec).list_files()) == ["landing/b.txt"]
+    assert "startOffset" in list_params(fake_gcs)[-1]
+
+
+def test_move_succeeds_when_index_fails(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, caplog
+):
+    fake_gcs.put(BUCKET, "landing/a.txt", b"data")
+    spec = index_spec(bucket_spec, tmp_path) | {
+        "postCopyAction": {"action": "move", "destination": "archive"}
+    }
+    handler = BucketTransfer(spec)
+    assert len(handler.list_files()) == 1
+
+    def locked(self, bucket, names):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(ListingIndex, "remove", locked)
+    assert handler.handle_post_copy_action(["landing/a.txt"]) == 0
+    assert fake_gcs.names(BUCKET) == ["archive/a.txt"]
+    assert "Failed to remove objects from the listing index" in caplog.text
+
+
+def test_list_files_index_forgets_missing_objects(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "landing/a.txt", b"data")
+    fake_gcs.put(BUCKET, "landing/b.txt", b"data")
+    handler = BucketTransfer(index_spec(bucket_spec, tmp_path, rescanInterval=3600))
+    assert len(handler.list_files()) == 2
+
+    # Deleted by something else
+    del fake_gcs.objects[(BUCKET, "landing/a.txt")]
+    assert handler.pull_files_to_worker(["landing/a.txt"], tmp_path) == 1
+    assert list(handler.list_files()) == ["landing/b.txt"]
+
+    # Deleting objects removes them too
+    handler._delete_objects(["landing/b.txt"])
+    assert handler.list_files() == {}
+
+
+def test_iter_files_yields_page_by_page(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_OBJECTS_PER_QUERY", 2)
+    put_files(fake_gcs)
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+
+    files = handler.iter_files(file_pattern=r".*\.txt$")
+    first = next(files)
+    # Only the first page has been listed
+    assert len(list_params(fake_gcs)) == 1
+    assert first.name == "dir/a.txt"
+    assert first.size == 4
+    assert first.crc32c and first.md5_hash
+
+    assert [info.name for info in files] == ["dir/b.txt", "dir/nested/d.txt"]
+    assert len(list_params(fake_gcs)) == 2
+
+
+def test_iter_files_raises_errors(fake_gcs, bucket_spec):
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 403)
+    handler = BucketTransfer(no_retry_spec(bucket_spec, directory="dir"))
+
+    with pytest.raises(RemoteTransferError):
+        list(handler.iter_files())
+    # list_files logs the error instead
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 403)
+    assert handler.list_files() == {}
+
+
+def test_pull_files_from_iter_files(fake_gcs, bucket_spec, tmp_path, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_OBJECTS_PER_QUERY", 2)
+    put_files(fake_gcs)
+    handler = BucketTransfer(bucket_spec(directory="dir", download={"concurrency": 2}))
+
+    assert handler.pull_files_to_worker(handler.iter_files(), tmp_path) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.txt",
+        "b.txt",
+        "c.csv",
+        "d.txt",
+    ]
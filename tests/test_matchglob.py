@@ -0,0 +1,78 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import re
+
+import pytest
+
+from opentaskpy.addons.gcp.remotehandlers.matchglob import (
+    regex_to_basename_glob,
+    regex_to_match_glob,
+)
+
+
+@pytest.mark.parametrize(
+    "pattern, glob",
+    [
+        ("file.txt", "file?txt*"),
+        (r"file\.txt$", "file.txt"),
+        (r"(?a)^data_\d{8}\.csv$", "data_*.csv"),
+        (r"report[0-9]+\.json", "report*.json*"),
+        (r"[^_]test.*", "[!_]test*"),
+        (".*\\.txt", "*.txt*"),
+        ("", "*"),
+    ],
+)
+def test_regex_to_basename_glob(pattern, glob):
+    assert regex_to_basename_glob(pattern) == glob
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"(a|b)\.txt",
+        r"file\w+",
+        r"a\.txt|b\.txt",
+        "file*[!]",
+        "a/b",
+        r"(?a)\d\1",
+        # \d also matches non-ASCII digits, which [0-9] wouldn't
+        r"^data_\d{8}\.csv$",
+        "(?i)file",
+        "file(",
+    ],
+)
+def test_regex_to_basename_glob_untranslatable(pattern):
+    assert regex_to_basename_glob(pattern) is None
+
+
+def test_regex_to_match_glob():
+    assert regex_to_match_glob(r"file\.txt$") == "{file.txt,**/file.txt}"
+    # No filtering to push to the server
+    assert regex_to_match_glob(None) is None
+    assert regex_to_match_glob(".*") is None
+    assert regex_to_match_glob("(a|b)") is None
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [r"file\.txt$", r"(?a)^data_\d{8}\.csv$", r"[^_]test.*", ".*\\.txt"],
+)
+def test_glob_matches_everything_the_regex_does(pattern):
+    glob = regex_to_basename_glob(pattern)
+    glob_regex = re.compile(
+        glob.replace(".", r"\.")
+        .replace("*", ".*")
+        .replace("?", ".")
+        .replace("[!", "[^")
+    )
+    for name in [
+        "file.txt",
+        "data_20240101.csv",
+        "data_\u0662\u0660\u0662\u0664\u0660\u0661\u0660\u0661.csv",
+        "xtest.log",
+        "_test.log",
+        "a.txt",
+        "a.txt.bak",
+    ]:
+        if re.match(pattern, name):
+            assert glob_regex.fullmatch(name)
@@ -0,0 +1,141 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import logging
+
+import pytest
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+from opentaskpy.addons.gcp.remotehandlers.metrics import (
+    MetricEvent,
+    Metrics,
+    classify_request,
+)
+
+events = []
+
+
+def record_event(event):
+    events.append(event)
+
+
+def broken_hook(event):
+    raise RuntimeError("Metrics backend is down")
+
+
+@pytest.fixture(autouse=True)
+def clear_events():
+    events.clear()
+
+
+def metrics_spec(bucket_spec, metrics, **kwargs):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"backoffFactor": 0},
+            "metrics": metrics,
+        },
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "method, url, operation",
+    [
+        ("GET", "http://gcs/download/storage/v1/b/bucket/o/a%2Fb", "download"),
+        ("POST", "http://gcs/upload/storage/v1/b/bucket/o", "upload"),
+        ("PUT", "http://gcs/upload/storage/v1/b/bucket/o?upload_id=1", "upload"),
+        ("GET", "http://gcs/storage/v1/b/bucket/o", "list"),
+        ("GET", "http://gcs/storage/v1/b/bucket/o/a%2Fb", "metadata"),
+        ("DELETE", "http://gcs/storage/v1/b/bucket/o/a%2Fb", "delete"),
+        ("POST", "http://gcs/storage/v1/b/bucket/o/a/compose", "compose"),
+        ("POST", "http://gcs/storage/v1/b/a/o/b/rewriteTo/b/c/o/d", "rewrite"),
+        ("POST", "http://gcs/batch/storage/v1", "batch"),
+        ("POST", "http://pubsub/v1/projects/p/subscriptions/s:pull", "pubsub"),
+    ],
+)
+def test_classify_request(method, url, operation):
+    assert classify_request(method, url) == operation
+
+
+def test_metrics_summary():
+    metrics = Metrics(bucket=BUCKET)
+    for duration in [0.001] * 98 + [0.2, 3.0]:
+        metrics.record(MetricEvent("request", "download", duration, status=200))
+    metrics.record(MetricEvent("request", "download", 0.001, status=404, retries=2))
+    metrics.record(MetricEvent("transfer", "download", 2.0, bytes=10_000_000))
+
+    assert metrics.summary() == [
+        "request download: 101 in 3.299s (p50 <= 0.005s, p99 <= 0.25s), 2 retries,"
+        " statuses {200: 100, 404: 1}",
+        "transfer download: 1 in 2.000s (p50 <= 2.5s, p99 <= 2.5s), 10000000 bytes"
+        " at 5.00 MB/s",
+    ]
+
+
+def test_metrics_hook_errors_are_counted():
+    received = []
+    metrics = Metrics([broken_hook, received.append], bucket=BUCKET)
+    metrics.record(MetricEvent("request", "list", 0.1, status=200))
+
+    # Later hooks still get the event, with the bucket filled in
+    assert received == [MetricEvent("request", "list", 0.1, 200, bucket=BUCKET)]
+    assert metrics.summary()[-1] == "1 events failed to be sent to hooks"
+
+
+def test_pull_files_records_metrics(fake_gcs, bucket_spec, tmp_path, caplog):
+    fake_gcs.put(BUCKET, "file1.txt", b"hello")
+    fake_gcs.put(BUCKET, "file2.txt", b"world!")
+    fake_gcs.inject_error("GET /download", 503)
+
+    handler = BucketTransfer(
+        metrics_spec(bucket_spec, {"hooks": ["test_metrics.record_event"]})
+    )
+    assert (
+        handler.pull_files_to_worker(
+            ["file1.txt", "file2.txt", "missing.txt"], tmp_path
+        )
+        == 1
+    )
+
+    downloads = [event for event in events if event.operation == "download"]
+    requests = [event for event in downloads if event.kind == "request"]
+    assert sorted(event.status for event in requests) == [200, 200, 404, 503]
+    # The unavailable response was retried once
+    assert sum(event.retries for event in requests) == 1
+    assert [(event.kind, event.bytes) for event in downloads][-1] == ("transfer", 11)
+    assert all(event.bucket == BUCKET for event in events)
+
+    with caplog.at_level(logging.INFO, logger=handler.logger.name):
+        handler.tidy()
+    assert "Metrics: request download: 4 in" in caplog.text
+    assert "statuses {200: 2, 404: 1, 503: 1}" in caplog.text
+    assert "Metrics: transfer download: 1 in" in caplog.text
+
+
+def test_push_files_records_metrics(fake_gcs, bucket_spec, tmp_path):
+    (tmp_path / "file1.txt").write_bytes(b"hello")
+    (tmp_path / "file2.txt").write_bytes(b"world!")
+
+    handler = BucketTransfer(
+        metrics_spec(bucket_spec, {"hooks": ["test_metrics.record_event"]})
+    )
+    assert handler.push_files_from_worker(str(tmp_path)) == 0
+
+    uploads = [event for event in events if event.kind == "request"]
+    assert sorted((event.operation, event.bytes > 5) for event in uploads) == [
+        ("upload", True),
+        ("upload", True),
+    ]
+    assert [event for event in events if event.kind == "transfer"][0].bytes == 11
+
+
+def test_summary_disabled(fake_gcs, bucket_spec, tmp_path, caplog):
+    fake_gcs.put(BUCKET, "file.txt", b"hello")
+    handler = BucketTransfer(metrics_spec(bucket_spec, {"summary": False}))
+    assert handler.pull_files_to_worker(["file.txt"], tmp_path) == 0
+
+    with caplog.at_level(logging.INFO, logger=handler.logger.name):
+        handler.tidy()
+    assert "Metrics:" not in caplog.text
@@ -0,0 +1,160 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import pytest
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers import bucket
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(bucket.time, "sleep", lambda delay: None)
+
+
+def batch_requests(fake_gcs):
+    return [path for method, path in fake_gcs.requests if path.startswith("/batch")]
+
+
+def move_spec(bucket_spec, **post_copy_action):
+    return bucket_spec(
+        postCopyAction={"action": "move", "destination": "archive", **post_copy_action}
+    )
+
+
+def test_post_copy_action_move_batches(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_BATCH_SIZE", 10)
+    files = [f"dir/file{i:02}.txt" for i in range(25)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, file.encode())
+
+    handler = BucketTransfer(move_spec(bucket_spec))
+    assert handler.handle_post_copy_action(files) == 0
+
+    assert fake_gcs.names(BUCKET) == [f"archive/file{i:02}.txt" for i in range(25)]
+    assert fake_gcs.get(BUCKET, "archive/file07.txt").data == b"dir/file07.txt"
+    # 3 batches of copies, then 3 of deletes
+    assert len(batch_requests(fake_gcs)) == 6
+
+
+def test_post_copy_action_rename(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "dir/file 1.txt", b"data")
+
+    handler = BucketTransfer(
+        bucket_spec(
+            postCopyAction={
+                "action": "rename",
+                "destination": "archive/done",
+                "pattern": r"\.txt$",
+                "sub": ".done",
+            }
+        )
+    )
+    assert handler.handle_post_copy_action(["dir/file 1.txt"]) == 0
+    assert fake_gcs.names(BUCKET) == ["archive/done/file 1.done"]
+
+
+def test_post_copy_action_only_retries_failed_items(fake_gcs, bucket_spec):
+    files = [f"file{i}.txt" for i in range(5)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, b"data")
+    fake_gcs.inject_error("POST /storage/v1/b/bucket-test/o/file3.txt/rewriteTo", 503)
+
+    handler = BucketTransfer(move_spec(bucket_spec))
+    assert handler.handle_post_copy_action(files) == 0
+    assert fake_gcs.names(BUCKET) == [f"archive/file{i}.txt" for i in range(5)]
+
+    rewrites = [
+        path
+        for method, path in fake_gcs.requests
+        if method == "POST" and "rewriteTo" in path
+    ]
+    assert len(rewrites) == 6
+    assert sum("file3.txt" in path for path in rewrites) == 2
+
+
+def test_post_copy_action_retries_failed_batch(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file.txt", b"data")
+    fake_gcs.inject_error("POST /batch", 503)
+
+    handler = BucketTransfer(move_spec(bucket_spec))
+    assert handler.handle_post_copy_action(["file.txt"]) == 0
+    assert fake_gcs.names(BUCKET) == ["archive/file.txt"]
+
+
+def test_post_copy_action_reports_failures(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file1.txt", b"data")
+
+    handler = BucketTransfer(move_spec(bucket_spec))
+    assert handler.handle_post_copy_action(["file1.txt", "missing.txt"]) == 1
+    # Files that can be moved still are
+    assert fake_gcs.names(BUCKET) == ["archive/file1.txt"]
+
+
+def test_post_copy_action_finishes_large_rewrites(fake_gcs, bucket_spec):
+    data = b"x" * (3 * 1024 * 1024 + 100)
+    fake_gcs.put(BUCKET, "large1.bin", data)
+    fake_gcs.put(BUCKET, "large2.bin", data)
+    fake_gcs.put(BUCKET, "small.txt", b"data")
+    fake_gcs.inject_error("rewriteTo/b/bucket-test/o/archive/large2.bin", 503)
+
+    handler = BucketTransfer(move_spec(bucket_spec, maxBytesRewrittenPerCall=1048576))
+    assert (
+        handler.handle_post_copy_action(["large1.bin", "large2.bin", "small.txt"]) == 0
+    )
+    assert fake_gcs.names(BUCKET) == [
+        "archive/large1.bin",
+        "archive/large2.bin",
+        "archive/small.txt",
+    ]
+    assert fake_gcs.get(BUCKET, "archive/large1.bin").data == data
+
+    rewrites = [
+        path
+        for method, path in fake_gcs.requests
+        if method == "POST" and "rewriteTo" in path
+    ]
+    # One call in the batch, then one for each remaining MiB, plus a retry
+    assert sum("large1.bin" in path for path in rewrites) == 4
+    assert sum("large2.bin" in path for path in rewrites) == 5
+    assert sum("small.txt" in path for path in rewrites) == 1
+
+
+@pytest.mark.parametrize("continue_on_error", [False, True])
+def test_post_copy_action_continue_on_error(
+    fake_gcs, bucket_spec, monkeypatch, continue_on_error
+):
+    monkeypatch.setattr(bucket, "MAX_BATCH_SIZE", 2)
+    files = ["a.txt", "missing.txt", "b.txt", "c.txt", "d.txt", "e.txt"]
+    for file in files:
+        if file != "missing.txt":
+            fake_gcs.put(BUCKET, file, b"data")
+
+    handler = BucketTransfer(move_spec(bucket_spec, continueOnError=continue_on_error))
+    assert handler.handle_post_copy_action(files) == 1
+
+    archived = [name for name in fake_gcs.names(BUCKET) if name.startswith("archive")]
+    if continue_on_error:
+        # Every other file is still moved
+        assert archived == [
+            f"archive/{file}" for file in sorted(files) if file != "missing.txt"
+        ]
+    else:
+        # No more batches are started after the first failure
+        assert archived == ["archive/a.txt"]
+
+
+def test_post_copy_action_concurrency(fake_gcs, bucket_spec, monkeypatch):
+    monkeypatch.setattr(bucket, "MAX_BATCH_SIZE", 5)
+    fake_gcs.latency = 0.05
+    files = [f"file{i:02}.txt" for i in range(40)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, b"data")
+
+    concurrency = 8
+    handler = BucketTransfer(move_spec(bucket_spec, concurrency=concurrency))
+    assert handler.handle_post_copy_action(files) == 0
+
+    assert fake_gcs.names(BUCKET) == [f"archive/{file}" for file in files]
+    # The 8 batches of copies (then deletes) were all in flight at once
+    assert fake_gcs.peak_in_flight >= concurrency
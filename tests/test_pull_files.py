@@ -0,0 +1,331 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import gzip
+import os
+
+import pytest
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers import bucket, checksum
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+
+def test_pull_files_streams_to_staging_directory(fake_gcs, bucket_spec, tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    fake_gcs.put(BUCKET, "nested/dir/large.bin", data)
+    fake_gcs.put(BUCKET, "small.txt", b"hello")
+
+    handler = BucketTransfer(bucket_spec(download={"chunkSize": 65536}))
+    assert (
+        handler.pull_files_to_worker(["nested/dir/large.bin", "small.txt"], tmp_path)
+        == 0
+    )
+
+    assert (tmp_path / "large.bin").read_bytes() == data
+    assert (tmp_path / "small.txt").read_bytes() == b"hello"
+    # No temporary files left behind
+    assert sorted(os.listdir(tmp_path)) == ["large.bin", "small.txt"]
+
+
+def test_pull_files_reassembles_chunks(fake_gcs, bucket_spec, tmp_path, monkeypatch):
+    data = os.urandom(10 * 4096 + 123)
+    fake_gcs.put(BUCKET, "file.bin", data)
+    writes = []
+    write = bucket._DownloadSink.write
+    monkeypatch.setattr(
+        bucket._DownloadSink,
+        "write",
+        lambda self, chunk: writes.append(len(chunk)) or write(self, chunk),
+    )
+
+    handler = BucketTransfer(bucket_spec(download={"chunkSize": 4096}))
+    assert handler.pull_files_to_worker(["file.bin"], tmp_path) == 0
+
+    assert (tmp_path / "file.bin").read_bytes() == data
+    assert len(writes) == 11
+    assert max(writes) == 4096
+
+
+def test_pull_files_interrupted_download(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "file.bin", os.urandom(100000))
+    (tmp_path / "file.bin").write_bytes(b"previous")
+    # The connection drops partway through the body
+    fake_gcs.inject_truncation("GET /download", 50000)
+
+    handler = BucketTransfer(
+        bucket_spec(
+            protocol={
+                "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+                "credentials": {},
+                "http": {"retries": 0},
+            },
+            download={"chunkSize": 4096},
+        )
+    )
+    assert handler.pull_files_to_worker(["file.bin"], tmp_path) == 1
+
+    # The existing file is untouched, and no partial download is left behind
+    assert os.listdir(tmp_path) == ["file.bin"]
+    assert (tmp_path / "file.bin").read_bytes() == b"previous"
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_pull_files_fails_if_any_file_fails(
+    fake_gcs, bucket_spec, tmp_path, concurrency
+):
+    for i in range(10):
+        fake_gcs.put(BUCKET, f"file{i}.txt", f"data{i}".encode())
+
+    handler = BucketTransfer(bucket_spec(download={"concurrency": concurrency}))
+    files = [f"file{i}.txt" for i in range(10)] + ["missing.txt"]
+    assert handler.pull_files_to_worker(files, tmp_path) == 1
+
+    # Every file that does exist is still downloaded
+    for i in range(10):
+        assert (tmp_path / f"file{i}.txt").read_bytes() == f"data{i}".encode()
+    assert not (tmp_path / "missing.txt").exists()
+
+
+@pytest.mark.parametrize("status, attempts", [(503, 3), (429, 3), (404, 1)])
+def test_pull_files_retries_once_per_attempt(
+    fake_gcs, bucket_spec, tmp_path, status, attempts
+):
+    fake_gcs.put(BUCKET, "file.txt", b"data")
+    fake_gcs.inject_error("GET /download", status, count=10)
+
+    handler = BucketTransfer(
+        bucket_spec(
+            protocol={
+                "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+                "credentials": {},
+                "http": {"retries": 2, "backoffFactor": 0.01},
+            }
+        )
+    )
+    assert handler.pull_files_to_worker(["file.txt"], tmp_path) == 1
+
+    # Only the handler retries, the session doesn't retry each attempt again
+    assert len(fake_gcs.requests) == attempts
+
+
+@pytest.mark.parametrize("concurrency", [1, 4, 16])
+def test_pull_files_concurrency(fake_gcs, bucket_spec, tmp_path, concurrency):
+    # Slow responses, so every worker has a request in flight at once
+    fake_gcs.latency = 0.1
+    files = [f"small/file{i:03}.txt" for i in range(2 * concurrency)]
+    for file in files:
+        fake_gcs.put(BUCKET, file, os.urandom(4096))
+
+    handler = BucketTransfer(bucket_spec(download={"concurrency": concurrency}))
+    assert handler.pull_files_to_worker(files, tmp_path) == 0
+
+    assert len(os.listdir(tmp_path)) == len(files)
+    assert fake_gcs.peak_in_flight == concurrency
+
+
+def sliced_spec(bucket_spec, **sliced):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"retries": 0, "backoffFactor": 0},
+        },
+        download={
+            "chunkSize": 4096,
+            "sliced": {"threshold": 1024, "slices": 6, **sliced},
+        },
+    )
+
+
+def range_requests(fake_gcs):
+    return [
+        path
+        for method, path in fake_gcs.requests
+        if method == "GET" and path.startswith("/download")
+    ]
+
+
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_pull_files_sliced_download(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, fast_crc32c
+):
+    monkeypatch.setattr(bucket, "FAST_CRC32C", fast_crc32c)
+    data = os.urandom(100000)
+    fake_gcs.put(BUCKET, "dir/large.bin", data)
+
+    handler = BucketTransfer(sliced_spec(bucket_spec))
+    assert handler.pull_files_to_worker(["dir/large.bin"], tmp_path) == 0
+
+    assert (tmp_path / "large.bin").read_bytes() == data
+    assert os.listdir(tmp_path) == ["large.bin"]
+    assert len(range_requests(fake_gcs)) == 6
+
+
+def test_pull_files_sliced_download_small_file_not_sliced(
+    fake_gcs, bucket_spec, tmp_path
+):
+    fake_gcs.put(BUCKET, "small.txt", b"hello")
+
+    handler = BucketTransfer(sliced_spec(bucket_spec))
+    # Size from list_files is used to skip the metadata request
+    assert (
+        handler.pull_files_to_worker(
+            {"small.txt": {"size": "5", "modified_time": ""}}, tmp_path
+        )
+        == 0
+    )
+    assert (tmp_path / "small.txt").read_bytes() == b"hello"
+    assert len(fake_gcs.requests) == 1
+
+
+def test_pull_files_sliced_download_retries_slice(fake_gcs, bucket_spec, tmp_path):
+    data = os.urandom(100000)
+    fake_gcs.put(BUCKET, "large.bin", data)
+    fake_gcs.inject_error("GET /download", 503)
+
+    handler = BucketTransfer(sliced_spec(bucket_spec))
+    assert handler.pull_files_to_worker(["large.bin"], tmp_path) == 0
+
+    assert (tmp_path / "large.bin").read_bytes() == data
+    # Only the failed slice is requested again
+    assert len(range_requests(fake_gcs)) == 7
+
+
+def test_pull_files_sliced_download_checksum_mismatch(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "large.bin", os.urandom(100000), crc32c="AAAAAA==")
+
+    handler = BucketTransfer(sliced_spec(bucket_spec))
+    assert handler.pull_files_to_worker(["large.bin"], tmp_path) == 1
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_pull_files_sliced_download_checksums_disabled(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, fast_crc32c
+):
+    monkeypatch.setattr(bucket, "FAST_CRC32C", fast_crc32c)
+    data = os.urandom(100000)
+    fake_gcs.put(BUCKET, "large.bin", data, crc32c="AAAAAA==", md5Hash="AAAA")
+    crc32c_extend = bucket.crc32c_extend
+    calls = []
+    monkeypatch.setattr(
+        bucket,
+        "crc32c_extend",
+        lambda *args: calls.append(args) or crc32c_extend(*args),
+    )
+
+    spec = sliced_spec(bucket_spec)
+    spec["download"]["verify"] = False
+    handler = BucketTransfer(spec)
+    assert handler.pull_files_to_worker(["large.bin"], tmp_path) == 0
+    assert (tmp_path / "large.bin").read_bytes() == data
+    assert calls == []
+
+
+def test_pull_files_sliced_download_rename_fails(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    fake_gcs.put(BUCKET, "large.bin", os.urandom(100000))
+
+    def replace(source, destination):
+        raise PermissionError(destination)
+
+    monkeypatch.setattr(bucket.os, "replace", replace)
+    handler = BucketTransfer(sliced_spec(bucket_spec))
+    # The original error is reported, not a failure to close the file twice
+    with pytest.raises(PermissionError):
+        handler._download_file("large.bin", str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_pull_files_verifies_checksum(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, fast_crc32c
+):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", fast_crc32c)
+    # The object's CRC32C doesn't match, but its MD5 does
+    fake_gcs.put(BUCKET, "file.txt", b"hello", crc32c="AAAAAA==")
+
+    handler = BucketTransfer(bucket_spec())
+    result = handler.pull_files_to_worker(["file.txt"], tmp_path)
+    if fast_crc32c:
+        assert result == 1
+        assert os.listdir(tmp_path) == []
+    else:
+        assert result == 0
+        assert (tmp_path / "file.txt").read_bytes() == b"hello"
+
+
+@pytest.mark.parametrize("sliced", [False, True])
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_pull_files_composite_object_checksum(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, caplog, sliced, fast_crc32c
+):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", fast_crc32c)
+    monkeypatch.setattr(bucket, "FAST_CRC32C", fast_crc32c)
+    # Composite objects only have a CRC32C, which doesn't match here
+    data = os.urandom(100000)
+    fake_gcs.put(BUCKET, "dir/large.bin", data, crc32c="AAAAAA==", componentCount=2)
+
+    handler = BucketTransfer(sliced_spec(bucket_spec) if sliced else bucket_spec())
+    result = handler.pull_files_to_worker(["dir/large.bin"], tmp_path)
+    if fast_crc32c:
+        assert result == 1
+    else:
+        # The pure Python CRC32C is too slow, so the download isn't verified
+        assert result == 0
+        assert (tmp_path / "large.bin").read_bytes() == data
+        assert "Not verifying the download" in caplog.text
+
+
+def test_pull_files_verifies_against_listing(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"hello")
+    fake_gcs.put(BUCKET, "dir/file2.txt", b"world")
+
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+    files = handler.list_files()
+    assert files["dir/file1.txt"]["crc32c"]
+    assert handler.pull_files_to_worker(files, tmp_path) == 0
+
+    # The object was replaced after it was listed
+    fake_gcs.put(BUCKET, "dir/file2.txt", b"changed")
+    assert handler.pull_files_to_worker(files, tmp_path / "") == 1
+    assert (tmp_path / "file2.txt").read_bytes() == b"world"
+
+
+def test_pull_files_checksums_disabled(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.put(BUCKET, "file.txt", b"hello", crc32c="AAAAAA==", md5Hash="AAAA")
+
+    handler = BucketTransfer(bucket_spec(download={"verify": False}))
+    assert handler.pull_files_to_worker(["file.txt"], tmp_path) == 0
+
+
+def put_gzipped(fake_gcs, name, data, **metadata):
+    fake_gcs.put(BUCKET, name, gzip.compress(data), contentEncoding="gzip", **metadata)
+
+
+def test_pull_files_decompresses_gzipped_objects(fake_gcs, bucket_spec, tmp_path):
+    data = b"a,b,c\n" * 100000
+    put_gzipped(fake_gcs, "dir/data.csv", data)
+
+    handler = BucketTransfer(bucket_spec(directory="dir"))
+    assert handler.pull_files_to_worker(handler.list_files(), tmp_path) == 0
+    assert (tmp_path / "data.csv").read_bytes() == data
+
+
+def test_pull_files_keeps_gzipped_objects_compressed(fake_gcs, bucket_spec, tmp_path):
+    compressed = gzip.compress(b"a,b,c\n" * 100000)
+    fake_gcs.put(BUCKET, "data.csv", compressed, contentEncoding="gzip")
+
+    handler = BucketTransfer(bucket_spec(download={"decompress": False}))
+    assert handler.pull_files_to_worker(["data.csv"], tmp_path) == 0
+    assert (tmp_path / "data.csv").read_bytes() == compressed
+
+
+def test_pull_files_verifies_gzipped_objects(fake_gcs, bucket_spec, tmp_path):
+    # The checksum is of the compressed bytes, as they're received
+    put_gzipped(fake_gcs, "data.csv", b"a,b,c\n" * 1000, crc32c="AAAAAA==")
+
+    handler = BucketTransfer(bucket_spec())
+    assert handler.pull_files_to_worker(["data.csv"], tmp_path) == 1
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,436 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import gzip
+import os
+
+import pytest
+import requests
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers import checksum
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+
+@pytest.fixture
+def staging_dir(tmp_path):
+    for i in range(20):
+        (tmp_path / f"part-{i:03}.csv").write_bytes(os.urandom(1000 + i))
+    return tmp_path
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_push_files_uploads_every_file(fake_gcs, bucket_spec, staging_dir, concurrency):
+    handler = BucketTransfer(
+        bucket_spec(
+            directory="landing",
+            rename={"pattern": "^part-", "sub": "renamed-"},
+            upload={"concurrency": concurrency},
+        )
+    )
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    assert fake_gcs.names(BUCKET) == [f"landing/renamed-{i:03}.csv" for i in range(20)]
+    for i in range(20):
+        assert (
+            fake_gcs.get(BUCKET, f"landing/renamed-{i:03}.csv").data
+            == (staging_dir / f"part-{i:03}.csv").read_bytes()
+        )
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_push_files_fails_if_any_file_fails(
+    fake_gcs, bucket_spec, staging_dir, concurrency
+):
+    # An early file failing must not be hidden by later files succeeding
+    fake_gcs.inject_error("name=part-000.csv", 403)
+
+    handler = BucketTransfer(bucket_spec(upload={"concurrency": concurrency}))
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+
+    assert len(fake_gcs.names(BUCKET)) == 19
+
+
+def test_push_files_retries_throttled_uploads(fake_gcs, bucket_spec, staging_dir):
+    fake_gcs.inject_error("name=part-003.csv", 429, count=2)
+    fake_gcs.inject_error("name=part-007.csv", 503)
+
+    handler = BucketTransfer(
+        bucket_spec(
+            protocol={
+                "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+                "credentials": {},
+                "http": {"backoffFactor": 0},
+            },
+            upload={"verify": False},
+        )
+    )
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert (
+        fake_gcs.get(BUCKET, "part-003.csv").data
+        == (staging_dir / "part-003.csv").read_bytes()
+    )
+    assert len(fake_gcs.names(BUCKET)) == 20
+
+
+def resumable_spec(bucket_spec, tmp_path, **upload):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"retries": 0, "backoffFactor": 0},
+        },
+        upload={"resumableThreshold": 1024, "chunkSize": 262144, **upload},
+    )
+
+
+def large_file(tmp_path):
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    data = os.urandom(262144 * 3 + 100)
+    (staging_dir / "large.bin").write_bytes(data)
+    return staging_dir, data
+
+
+def chunk_requests(fake_gcs):
+    return [path for method, path in fake_gcs.requests if method == "PUT"]
+
+
+def test_push_files_resumable_upload(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = large_file(tmp_path)
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+    assert len(chunk_requests(fake_gcs)) == 4
+
+
+def test_push_files_resumable_upload_resumes_after_failure(
+    fake_gcs, bucket_spec, tmp_path
+):
+    staging_dir, data = large_file(tmp_path)
+    fake_gcs.inject_error("PUT /upload", 503)
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+
+
+def test_push_files_resumable_upload_persists_session(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = large_file(tmp_path)
+    session_dir = tmp_path / "sessions"
+    spec = resumable_spec(
+        bucket_spec, tmp_path, resumeAttempts=0, sessionDirectory=str(session_dir)
+    )
+
+    # First chunk succeeds, then the upload keeps failing
+    handler = BucketTransfer(spec)
+    original_request = handler._request
+    sent = []
+
+    def flaky_request(method, url, **kwargs):
+        if method == "PUT" and sent:
+            raise requests.ConnectionError("network blip")
+        response = original_request(method, url, **kwargs)
+        if method == "PUT":
+            sent.append(response)
+        return response
+
+    handler._request = flaky_request
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert len(os.listdir(session_dir)) == 1
+    assert fake_gcs.get(BUCKET, "large.bin") is None
+
+    # A new task picks up the saved session, and only sends the remaining chunks
+    fake_gcs.requests.clear()
+    handler = BucketTransfer(spec)
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+    # One status query, then the 3 remaining chunks
+    assert len(chunk_requests(fake_gcs)) == 4
+    assert not [method for method, _ in fake_gcs.requests if method == "POST"]
+    assert os.listdir(session_dir) == []
+
+
+@pytest.mark.parametrize("parts", [4, 40])
+def test_push_files_composite_upload(fake_gcs, bucket_spec, tmp_path, parts):
+    staging_dir, data = large_file(tmp_path)
+
+    handler = BucketTransfer(
+        bucket_spec(
+            directory="landing",
+            upload={"composite": {"threshold": 1024, "parts": parts}},
+        )
+    )
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    assert fake_gcs.get(BUCKET, "landing/large.bin").data == data
+    # Temporary parts are cleaned up
+    assert fake_gcs.names(BUCKET) == ["landing/large.bin"]
+    composes = [path for method, path in fake_gcs.requests if "/compose" in path]
+    # Over 32 parts needs an extra level of composes
+    assert len(composes) == (1 if parts <= 32 else 3)
+
+
+def test_push_files_composite_upload_checksum_mismatch(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = large_file(tmp_path)
+    handler = BucketTransfer(
+        bucket_spec(upload={"composite": {"threshold": 1024, "parts": 4}})
+    )
+    # Corrupt the composed object
+    original_compose = handler._compose_request
+
+    def corrupt_compose(file_name, components, preconditions=None):
+        return original_compose(file_name, list(reversed(components)), preconditions)
+
+    handler._compose_request = corrupt_compose
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert fake_gcs.names(BUCKET) == []
+
+
+def test_push_files_composite_upload_without_fast_crc32c(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", False)
+
+    def slow_crc32c(crc, data):
+        raise AssertionError("The pure Python CRC32C was used")
+
+    monkeypatch.setattr(checksum, "crc32c_extend", slow_crc32c)
+    staging_dir, data = large_file(tmp_path)
+    handler = BucketTransfer(
+        bucket_spec(upload={"composite": {"threshold": 1024, "parts": 4}})
+    )
+    # Each part is checked against its MD5 instead
+    original_upload_part = handler._upload_part
+    algorithms = []
+
+    def upload_part(*args, algorithm=None):
+        algorithms.append(algorithm)
+        return original_upload_part(*args, algorithm=algorithm)
+
+    handler._upload_part = upload_part
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+    assert algorithms == ["md5"] * 4
+
+
+def test_push_files_composite_upload_unverified(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = large_file(tmp_path)
+    handler = BucketTransfer(
+        bucket_spec(
+            upload={"composite": {"threshold": 1024, "parts": 4}, "verify": False}
+        )
+    )
+    original_compose = handler._compose_request
+
+    def corrupt_compose(file_name, components, preconditions=None):
+        return original_compose(file_name, list(reversed(components)), preconditions)
+
+    handler._compose_request = corrupt_compose
+    # Nothing is checked, so the corrupted object is kept
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert fake_gcs.names(BUCKET) == ["large.bin"]
+
+
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_push_files_sends_checksums(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, fast_crc32c
+):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", fast_crc32c)
+    staging_dir, data = large_file(tmp_path)
+    (staging_dir / "small.txt").write_bytes(b"hello")
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+    # One for the media upload, and one with the last chunk of the resumable upload
+    assert len(fake_gcs.hashes) == 2
+    algorithm = "crc32c=" if fast_crc32c else "md5="
+    assert all(value.startswith(algorithm) for value in fake_gcs.hashes)
+
+
+def test_push_files_checksum_mismatch_rejected(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(checksum.StreamingHash, "digest", lambda self: "AAAAAA==")
+    staging_dir, _ = large_file(tmp_path)
+    (staging_dir / "small.txt").write_bytes(b"hello")
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path))
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert fake_gcs.names(BUCKET) == []
+
+
+def test_push_files_checksums_disabled(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, _ = large_file(tmp_path)
+    (staging_dir / "small.txt").write_bytes(b"hello")
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path, verify=False))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert fake_gcs.hashes == []
+
+
+def sync_staging_dir(tmp_path):
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    for name in ("same.txt", "changed.txt", "new.txt"):
+        (staging_dir / name).write_bytes(f"{name} contents".encode())
+    return staging_dir
+
+
+def uploads(fake_gcs):
+    return [path for method, path in fake_gcs.requests if path.startswith("/upload")]
+
+
+@pytest.mark.parametrize("fast_crc32c", [True, False])
+def test_push_files_sync_skips_unchanged(
+    fake_gcs, bucket_spec, tmp_path, monkeypatch, fast_crc32c
+):
+    monkeypatch.setattr(checksum, "FAST_CRC32C", fast_crc32c)
+    staging_dir = sync_staging_dir(tmp_path)
+    fake_gcs.put(BUCKET, "landing/same.txt", b"same.txt contents")
+    # Same size, different content
+    fake_gcs.put(BUCKET, "landing/changed.txt", b"changed.txt CONTENTS")
+
+    handler = BucketTransfer(bucket_spec(directory="landing", upload={"sync": True}))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    for name in ("same.txt", "changed.txt", "new.txt"):
+        assert fake_gcs.get(BUCKET, f"landing/{name}").data == (
+            f"{name} contents".encode()
+        )
+    assert len(uploads(fake_gcs)) == 2
+    assert all("ifGenerationMatch=" in path for path in uploads(fake_gcs))
+    # The destination is only listed once
+    listings = [path for method, path in fake_gcs.requests if method == "GET"]
+    assert len(listings) == 1
+
+
+def test_push_files_sync_precondition_failure(fake_gcs, bucket_spec, tmp_path):
+    staging_dir = sync_staging_dir(tmp_path)
+    fake_gcs.put(BUCKET, "changed.txt", b"old")
+
+    handler = BucketTransfer(bucket_spec(upload={"sync": True}))
+    original_upload = handler._upload_file
+
+    def racing_upload(file, preconditions=None):
+        # Something else writes the object after it's been listed
+        fake_gcs.put(BUCKET, os.path.basename(file), b"racing")
+        return original_upload(file, preconditions)
+
+    handler._upload_file = racing_upload
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert fake_gcs.get(BUCKET, "changed.txt").data == b"racing"
+    assert fake_gcs.get(BUCKET, "new.txt").data == b"racing"
+
+
+def test_push_files_sync_listing_failure(fake_gcs, bucket_spec, tmp_path):
+    staging_dir = sync_staging_dir(tmp_path)
+    fake_gcs.inject_error(f"GET /storage/v1/b/{BUCKET}/o", 403)
+
+    handler = BucketTransfer(bucket_spec(upload={"sync": True}))
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert uploads(fake_gcs) == []
+
+
+def test_push_files_sync_resumable_upload(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = large_file(tmp_path)
+    fake_gcs.put(BUCKET, "large.bin", b"old")
+
+    handler = BucketTransfer(resumable_spec(bucket_spec, tmp_path, sync=True))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert fake_gcs.get(BUCKET, "large.bin").data == data
+
+    # Nothing has changed the second time
+    fake_gcs.requests.clear()
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert uploads(fake_gcs) == []
+
+
+def compressible_staging_dir(tmp_path):
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    data = b"id,name,value\n" + b"".join(
+        f"{i},name{i},{i * 7}\n".encode() for i in range(100000)
+    )
+    (staging_dir / "data.csv").write_bytes(data)
+    return staging_dir, data
+
+
+@pytest.mark.parametrize(
+    "upload",
+    [
+        {},
+        {"resumableThreshold": 1024, "chunkSize": 262144},
+        {"composite": {"threshold": 1024, "parts": 4}},
+    ],
+)
+def test_push_files_compressed(fake_gcs, bucket_spec, tmp_path, upload):
+    staging_dir, data = compressible_staging_dir(tmp_path)
+
+    handler = BucketTransfer(bucket_spec(upload={"compress": True, **upload}))
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+
+    obj = fake_gcs.get(BUCKET, "data.csv")
+    assert obj.metadata["contentEncoding"] == "gzip"
+    assert gzip.decompress(obj.data) == data
+    assert len(obj.data) < len(data) / 3
+    assert fake_gcs.names(BUCKET) == ["data.csv"]
+    # The temporary compressed file is removed
+    assert os.listdir(staging_dir) == ["data.csv"]
+
+
+def test_push_files_compressed_resumes_session(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = compressible_staging_dir(tmp_path)
+    session_dir = tmp_path / "sessions"
+    spec = bucket_spec(
+        upload={
+            "compress": True,
+            "resumableThreshold": 1024,
+            "chunkSize": 262144,
+            "resumeAttempts": 0,
+            "sessionDirectory": str(session_dir),
+        }
+    )
+
+    # First chunk succeeds, then the upload fails
+    handler = BucketTransfer(spec)
+    original_request = handler._request
+    sent = []
+
+    def flaky_request(method, url, **kwargs):
+        if method == "PUT" and sent:
+            raise requests.ConnectionError("network blip")
+        response = original_request(method, url, **kwargs)
+        if method == "PUT":
+            sent.append(response)
+        return response
+
+    handler._request = flaky_request
+    assert handler.push_files_from_worker(str(staging_dir)) == 1
+    assert len(os.listdir(session_dir)) == 1
+    assert os.listdir(staging_dir) == ["data.csv"]
+
+    # The file is compressed to the same name again, so the session is resumed
+    fake_gcs.requests.clear()
+    handler = BucketTransfer(spec)
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert gzip.decompress(fake_gcs.get(BUCKET, "data.csv").data) == data
+    assert not [method for method, _ in fake_gcs.requests if method == "POST"]
+    assert os.listdir(session_dir) == []
+
+
+def test_push_files_compressed_sync(fake_gcs, bucket_spec, tmp_path):
+    staging_dir, data = compressible_staging_dir(tmp_path)
+
+    handler = BucketTransfer(
+        bucket_spec(upload={"compress": True, "compressionLevel": 9, "sync": True})
+    )
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    # The file is compressed the same way again, so it's unchanged
+    fake_gcs.requests.clear()
+    assert handler.push_files_from_worker(str(staging_dir)) == 0
+    assert uploads(fake_gcs) == []
@@ -0,0 +1,243 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import asyncio
+import threading
+import time
+
+import pytest
+from conftest import BUCKET
+
+from opentaskpy.addons.gcp.remotehandlers import ratecontrol
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+from opentaskpy.addons.gcp.remotehandlers.ratecontrol import (
+    AdaptiveLimiter,
+    reserve_object_write,
+)
+
+
+class FakeClock:
+    """A clock that only moves when a test moves it."""
+
+    def __init__(self):
+        """Start the clock at an arbitrary time."""
+        self.now = 100.0
+
+    def __call__(self):
+        """Return the current time, in seconds."""
+        return self.now
+
+
+def test_limiter_grows_while_healthy():
+    limiter = AdaptiveLimiter(4, 1, 6, clock=FakeClock())
+    assert limiter.concurrency == 4
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(200, 0.01)
+    # About one more for every limit responses
+    assert limiter.concurrency == 4
+    limiter.acquire()
+    limiter.release(200, 0.01)
+    assert limiter.concurrency == 5
+
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(200, 0.01)
+    assert limiter.concurrency == 6
+
+
+def test_limiter_holds_while_slow():
+    limiter = AdaptiveLimiter(4, 1, 10, clock=FakeClock())
+    limiter.acquire()
+    limiter.release(200, 0.1)
+    limit = limiter.limit
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(200, 0.5)
+    assert limiter.limit == limit
+    assert limiter.throttle_count == 0
+
+
+def test_limiter_backs_off_once_per_round_trip():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(16, 3, 32, clock=clock)
+    for _ in range(3):
+        limiter.acquire()
+
+    limiter.release(429, 0.1)
+    assert limiter.concurrency == 8
+    # Sent before the limit was cut, so it's not cut again
+    clock.now += 0.05
+    limiter.release(503, 0.1)
+    assert limiter.concurrency == 8
+
+    clock.now += 1
+    limiter.release(None, 0.1)
+    assert limiter.concurrency == 4
+    clock.now += 1
+    limiter.acquire()
+    limiter.release(200, 0.1, throttled=True)
+    assert limiter.concurrency == 3
+    assert limiter.throttle_count == 4
+    assert limiter.in_flight == 0
+
+
+def test_limiter_pauses_for_retry_after():
+    limiter = AdaptiveLimiter(4)
+    limiter.acquire()
+    limiter.release(429, 0.01, retry_after=0.2)
+
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_limiter_blocks_at_the_limit():
+    limiter = AdaptiveLimiter(1)
+    limiter.acquire()
+
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(200, 0.01)
+    assert acquired.wait(1)
+    thread.join()
+    assert limiter.in_flight == 1
+
+
+def test_limiter_acquire_async():
+    limiter = AdaptiveLimiter(2, 1, 2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        await limiter.acquire_async()
+        peak = max(peak, limiter.in_flight)
+        await asyncio.sleep(0.01)
+        limiter.release(200, 0.01)
+
+    async def run_all():
+        await asyncio.gather(*(request() for _ in range(10)))
+
+    asyncio.run(run_all())
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_reserve_object_write():
+    clock = FakeClock()
+    assert reserve_object_write(BUCKET, "archive/file.txt", clock=clock) == 0
+    assert reserve_object_write(BUCKET, "archive/file.txt", clock=clock) == 1
+    assert reserve_object_write(BUCKET, "archive/file.txt", clock=clock) == 2
+    assert reserve_object_write(BUCKET, "archive/other.txt", clock=clock) == 0
+    assert reserve_object_write("other-bucket", "archive/file.txt", clock=clock) == 0
+
+    clock.now += 5
+    assert reserve_object_write(BUCKET, "archive/file.txt", clock=clock) == 0
+
+
+def adaptive_spec(bucket_spec, adaptive, **kwargs):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"backoffFactor": 0.01, "retries": 10, "adaptive": adaptive},
+        },
+        **kwargs,
+    )
+
+
+def test_limiter_shared_per_bucket(fake_gcs, bucket_spec):
+    first = BucketTransfer(adaptive_spec(bucket_spec, {"initialConcurrency": 4}))
+    second = BucketTransfer(adaptive_spec(bucket_spec, {"initialConcurrency": 32}))
+    other = BucketTransfer(
+        adaptive_spec(bucket_spec, {}, bucket="other-bucket", task_id="other")
+    )
+
+    assert first.limiter is second.limiter
+    assert first.limiter.concurrency == 4
+    assert other.limiter is not first.limiter
+    assert BucketTransfer(bucket_spec()).limiter is None
+
+
+def test_pull_files_adapts_to_throttling(fake_gcs, bucket_spec, tmp_path):
+    fake_gcs.latency = 0.02
+    fake_gcs.max_in_flight = 4
+    for i in range(60):
+        fake_gcs.put(BUCKET, f"dir/file{i:02}.txt", b"data")
+
+    handler = BucketTransfer(
+        adaptive_spec(
+            bucket_spec,
+            {"initialConcurrency": 16},
+            directory="dir",
+            download={"concurrency": 16},
+        )
+    )
+    assert handler.pull_files_to_worker(handler.list_files(), tmp_path) == 0
+
+    assert len(list(tmp_path.iterdir())) == 60
+    assert fake_gcs.throttled > 0
+    assert handler.limiter.throttle_count > 0
+    assert handler.limiter.concurrency < 16
+    assert handler.limiter.in_flight == 0
+
+
+def test_adaptive_limit_logged(fake_gcs, bucket_spec, caplog):
+    handler = BucketTransfer(adaptive_spec(bucket_spec, {"initialConcurrency": 4}))
+    handler.list_files()
+
+    with caplog.at_level("INFO", logger=handler.logger.name):
+        handler.tidy()
+    assert f"adaptive concurrency limit for {BUCKET} is 4" in caplog.text
+
+
+def test_post_copy_move_spaces_writes_to_one_name(fake_gcs, bucket_spec):
+    files = ["a/file.txt", "b/file.txt"]
+    for file in files:
+        fake_gcs.put(BUCKET, file, file.encode())
+
+    handler = BucketTransfer(
+        bucket_spec(postCopyAction={"action": "move", "destination": "archive"})
+    )
+    start = time.monotonic()
+    assert handler.handle_post_copy_action(files) == 0
+
+    assert time.monotonic() - start >= ratecontrol.OBJECT_MUTATION_INTERVAL * 0.9
+    assert fake_gcs.names(BUCKET) == ["archive/file.txt"]
+    assert fake_gcs.get(BUCKET, "archive/file.txt").data == b"b/file.txt"
+    # The second copy is made on its own, once the first has been written
+    assert [path.split("/")[-1] for method, path in fake_gcs.requests] == [
+        "v1",
+        "archive%2Ffile.txt",
+        "archive%2Ffile.txt",
+        "v1",
+        "a%2Ffile.txt",
+        "b%2Ffile.txt",
+    ]
+    assert "b%2Ffile.txt/rewriteTo" in fake_gcs.requests[2][1]
+
+
+def test_async_transport_respects_limit(fake_gcs, bucket_spec, tmp_path):
+    pytest.importorskip("aiohttp")
+    fake_gcs.latency = 0.01
+    for i in range(30):
+        fake_gcs.put(BUCKET, f"file{i:02}.txt", b"data")
+
+    spec = adaptive_spec(bucket_spec, {"initialConcurrency": 3, "maxConcurrency": 3})
+    spec["protocol"]["http"]["transport"] = "aiohttp"
+    handler = BucketTransfer(spec)
+    files = handler.list_files()
+    fake_gcs.peak_in_flight = 0
+    assert handler.pull_files_to_worker(files, tmp_path) == 0
+
+    assert len(list(tmp_path.iterdir())) == 30
+    assert fake_gcs.peak_in_flight <= 3
+    assert handler.limiter.in_flight == 0
@@ -141,6 +141,18 @@ def test_gcp_to_gcp(
     }
     assert validate_transfer_json(json_data)
 
+    for transfer_type in ["push", "pull", "proxy"]:
+        json_data["destination"][0]["transferType"] = transfer_type
+        assert validate_transfer_json(json_data)
+    json_data["destination"][0]["transferType"] = "direct"
+    assert not validate_transfer_json(json_data)
+    json_data["destination"][0]["transferType"] = "push"
+
+    json_data["source"]["directTransfer"] = True
+    assert validate_transfer_json(json_data)
+    json_data["source"]["directTransfer"] = "yes"
+    assert not validate_transfer_json(json_data)
+
 
 def test_gcp_source_file_watch(valid_bucket_source_definition):
     json_data = {
@@ -168,6 +180,215 @@ def test_gcp_source_file_watch(valid_bucket_source_definition):
     json_data["source"]["fileWatch"]["watchOnly"] = True
     assert validate_transfer_json(json_data)
 
+    # Add a listing index
+    json_data["source"]["fileWatch"]["index"] = {
+        "path": "/tmp/index.db",
+        "rescanInterval": 600,
+    }
+    assert validate_transfer_json(json_data)
+
+    del json_data["source"]["fileWatch"]["index"]["path"]
+    assert not validate_transfer_json(json_data)
+    del json_data["source"]["fileWatch"]["index"]
+
+    # Watch using bucket notifications
+    json_data["source"]["fileWatch"]["pubsub"] = {
+        "subscription": "projects/my-project/subscriptions/my-subscription",
+        "maxMessages": 10,
+        "pullTimeout": 30,
+    }
+    json_data["source"]["fileWatch"]["sleepTime"] = 0
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["fileWatch"]["pubsub"]["subscription"] = "my-subscription"
+    assert not validate_transfer_json(json_data)
+    del json_data["source"]["fileWatch"]["pubsub"]
+
     # Add error
     json_data["source"]["error"] = True
     assert validate_transfer_json(json_data)
+
+
+def test_gcp_protocol_http_settings(
+    valid_local_definition, valid_bucket_destination_definition
+):
+    json_data = {
+        "type": "transfer",
+        "source": valid_local_definition,
+        "destination": valid_bucket_destination_definition,
+    }
+    json_data["destination"][0]["protocol"]["http"] = {
+        "poolSize": 32,
+        "retries": 5,
+        "backoffFactor": 1.5,
+        "connectTimeout": 10,
+        "timeout": 600,
+    }
+    assert validate_transfer_json(json_data)
+
+    json_data["destination"][0]["protocol"]["http"]["poolSize"] = 0
+    assert not validate_transfer_json(json_data)
+    json_data["destination"][0]["protocol"]["http"]["poolSize"] = 32
+
+    json_data["destination"][0]["protocol"]["http"]["transport"] = "aiohttp"
+    json_data["destination"][0]["protocol"]["http"]["asyncConcurrency"] = 1000
+    assert validate_transfer_json(json_data)
+    json_data["destination"][0]["protocol"]["http"]["transport"] = "urllib"
+    assert not validate_transfer_json(json_data)
+    json_data["destination"][0]["protocol"]["http"]["transport"] = "aiohttp"
+
+    json_data["destination"][0]["protocol"]["http"]["adaptive"] = {}
+    assert validate_transfer_json(json_data)
+    json_data["destination"][0]["protocol"]["http"]["adaptive"] = {
+        "initialConcurrency": 4,
+        "minConcurrency": 2,
+        "maxConcurrency": 64,
+        "decreaseFactor": 0.7,
+        "latencyTolerance": 3,
+    }
+    assert validate_transfer_json(json_data)
+    json_data["destination"][0]["protocol"]["http"]["adaptive"]["decreaseFactor"] = 1
+    assert not validate_transfer_json(json_data)
+
+    json_data["destination"][0]["protocol"]["http"] = {"unknown": 1}
+    assert not validate_transfer_json(json_data)
+
+
+def test_gcp_protocol_metrics_settings(valid_bucket_source_definition):
+    json_data = {
+        "type": "transfer",
+        "source": valid_bucket_source_definition,
+    }
+    json_data["source"]["protocol"]["metrics"] = {
+        "hooks": ["mypackage.metrics.record"],
+        "summary": False,
+    }
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["protocol"]["metrics"] = {"hooks": "mypackage.metrics.record"}
+    assert not validate_transfer_json(json_data)
+
+    json_data["source"]["protocol"]["metrics"] = {"unknown": 1}
+    assert not validate_transfer_json(json_data)
+
+
+def test_gcp_source_download_settings(valid_bucket_source_definition):
+    json_data = {
+        "type": "transfer",
+        "source": valid_bucket_source_definition,
+    }
+
+    json_data["source"]["download"] = {
+        "chunkSize": 1048576,
+        "concurrency": 8,
+        "verify": False,
+        "decompress": False,
+    }
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["download"]["concurrency"] = 0
+    assert not validate_transfer_json(json_data)
+    json_data["source"]["download"]["concurrency"] = 1
+
+    json_data["source"]["download"]["sliced"] = {
+        "threshold": 1073741824,
+        "slices": 16,
+        "concurrency": 8,
+        "attempts": 3,
+    }
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["download"]["sliced"]["slices"] = 1
+    assert not validate_transfer_json(json_data)
+
+    json_data["source"]["download"]["chunkSize"] = 0
+    assert not validate_transfer_json(json_data)
+
+
+def test_gcp_source_recursive(valid_bucket_source_definition):
+    json_data = {
+        "type": "transfer",
+        "source": valid_bucket_source_definition,
+    }
+
+    json_data["source"]["recursive"] = False
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["recursive"] = "no"
+    assert not validate_transfer_json(json_data)
+
+
+def test_gcp_source_post_copy_action(valid_bucket_source_definition):
+    json_data = {
+        "type": "transfer",
+        "source": valid_bucket_source_definition,
+    }
+
+    json_data["source"]["postCopyAction"] = {
+        "action": "move",
+        "destination": "archive",
+        "maxBytesRewrittenPerCall": 268435456,
+    }
+    assert validate_transfer_json(json_data)
+
+    # Must be a multiple of 1 MiB
+    json_data["source"]["postCopyAction"]["maxBytesRewrittenPerCall"] = 1000000
+    assert not validate_transfer_json(json_data)
+    json_data["source"]["postCopyAction"]["maxBytesRewrittenPerCall"] = 1048576
+
+    json_data["source"]["postCopyAction"]["concurrency"] = 8
+    json_data["source"]["postCopyAction"]["continueOnError"] = True
+    assert validate_transfer_json(json_data)
+
+    json_data["source"]["postCopyAction"]["concurrency"] = 0
+    assert not validate_transfer_json(json_data)
+
+
+def test_gcp_destination_upload_settings(
+    valid_local_definition, valid_bucket_destination_definition
+):
+    json_data = {
+        "type": "transfer",
+        "source": valid_local_definition,
+        "destination": valid_bucket_destination_definition,
+    }
+    json_data["destination"][0]["upload"] = {"concurrency": 16, "verify": False}
+    assert validate_transfer_json(json_data)
+
+    json_data["destination"][0]["upload"]["sync"] = "yes"
+    assert not validate_transfer_json(json_data)
+    json_data["destination"][0]["upload"]["sync"] = True
+    assert validate_transfer_json(json_data)
+
+    json_data["destination"][0]["upload"]["compress"] = True
+    json_data["destination"][0]["upload"]["compressionLevel"] = 9
+    assert validate_transfer_json(json_data)
+    json_data["destination"][0]["upload"]["compressionLevel"] = 10
+    assert not validate_transfer_json(json_data)
+    json_data["destination"][0]["upload"]["compressionLevel"] = 1
+
+    json_data["destination"][0]["upload"]["concurrency"] = 0
+    assert not validate_transfer_json(json_data)
+
+    json_data["destination"][0]["upload"] = {
+        "resumableThreshold": 104857600,
+        "chunkSize": 16777216,
+        "resumeAttempts": 3,
+        "sessionDirectory": "/tmp/sessions",
+    }
+    assert validate_transfer_json(json_data)
+
+    # Chunks must be a multiple of 256 KiB
+    json_data["destination"][0]["upload"]["chunkSize"] = 1000000
+    assert not validate_transfer_json(json_data)
+    del json_data["destination"][0]["upload"]["chunkSize"]
+
+    json_data["destination"][0]["upload"]["composite"] = {
+        "threshold": 1073741824,
+        "parts": 16,
+        "concurrency": 8,
+    }
+    assert validate_transfer_json(json_data)
+
+    json_data["destination"][0]["upload"]["composite"]["parts"] = 1
+    assert not validate_transfer_json(json_data)
@@ -0,0 +1,37 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import time
+from email.utils import formatdate
+
+import requests
+
+from opentaskpy.addons.gcp.remotehandlers import session
+
+
+def response_with(headers):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+
+def test_retry_after():
+    assert session.retry_after(response_with({})) is None
+    assert session.retry_after(response_with({"Retry-After": "5"})) == 5
+    assert session.retry_after(response_with({"Retry-After": "soon"})) is None
+    delay = session.retry_after(
+        response_with({"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+    )
+    assert 25 < delay <= 30
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        delay = session.backoff_delay(attempt, 0.5)
+        assert 0 <= delay <= min(0.5 * 2**attempt, session.MAX_BACKOFF)
+    # Retry-After is the minimum delay, but still capped
+    assert session.backoff_delay(0, 0.5, response_with({"Retry-After": "10"})) == 10
+    assert (
+        session.backoff_delay(0, 0.5, response_with({"Retry-After": "3600"}))
+        == session.MAX_BACKOFF
+    )
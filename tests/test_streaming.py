@@ -0,0 +1,199 @@
+# pylint: skip-file
+# mypy: ignore-errors
+import gzip
+import io
+import os
+import shutil
+
+import pytest
+from conftest import BUCKET
+from opentaskpy.exceptions import RemoteTransferError
+
+from opentaskpy.addons.gcp.remotehandlers.bucket import BucketTransfer
+
+CHUNK_SIZE = 256 * 1024
+
+
+def stream_spec(bucket_spec, **kwargs):
+    return bucket_spec(
+        protocol={
+            "name": "opentaskpy.addons.gcp.remotehandlers.bucket.BucketTransfer",
+            "credentials": {},
+            "http": {"retries": 0, "backoffFactor": 0},
+        },
+        download={"chunkSize": 65536},
+        **kwargs,
+    )
+
+
+def upload_puts(fake_gcs):
+    return [
+        path
+        for method, path in fake_gcs.requests
+        if method == "PUT" and path.startswith("/upload")
+    ]
+
+
+def test_iter_object(fake_gcs, bucket_spec):
+    data = os.urandom(300000)
+    fake_gcs.put(BUCKET, "dir/large.bin", data)
+
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    chunks = list(handler.iter_object("dir/large.bin"))
+    assert b"".join(chunks) == data
+    assert max(len(chunk) for chunk in chunks) <= 65536
+
+
+def test_iter_object_decompresses(fake_gcs, bucket_spec):
+    data = b"a,b,c\n" * 100000
+    fake_gcs.put(BUCKET, "data.csv", gzip.compress(data), contentEncoding="gzip")
+
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    assert b"".join(handler.iter_object("data.csv")) == data
+
+
+def test_iter_object_checksum_mismatch(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file.txt", b"hello", crc32c="AAAAAA==", md5Hash="AAAA")
+
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    with pytest.raises(RemoteTransferError, match="Checksum doesn't match"):
+        list(handler.iter_object("file.txt"))
+
+
+def test_iter_object_missing(fake_gcs, bucket_spec):
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    with pytest.raises(RemoteTransferError, match="Failed to download missing.txt"):
+        list(handler.iter_object("missing.txt"))
+
+
+def test_open_object(fake_gcs, bucket_spec):
+    data = os.urandom(200000)
+    fake_gcs.put(BUCKET, "file.bin", data)
+
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    with handler.open_object("file.bin") as reader:
+        assert reader.read(10) == data[:10]
+        destination = io.BytesIO()
+        shutil.copyfileobj(reader, destination)
+    assert destination.getvalue() == data[10:]
+
+
+def test_open_object_closed_early(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "file.bin", os.urandom(1000000))
+
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    reader = handler.open_object("file.bin")
+    assert len(reader.read(100)) == 100
+    reader.close()
+    assert reader.closed
+
+
+@pytest.mark.parametrize("chunked", [True, False])
+def test_upload_stream(fake_gcs, bucket_spec, chunked):
+    data = os.urandom(3 * CHUNK_SIZE + 1000)
+    if chunked:
+        # Chunks of any size are buffered into upload chunks
+        stream = (data[i : i + 10000] for i in range(0, len(data), 10000))
+    else:
+        stream = io.BytesIO(data)
+
+    handler = BucketTransfer(
+        stream_spec(bucket_spec, directory="dir", upload={"chunkSize": CHUNK_SIZE})
+    )
+    assert handler.upload_stream(stream, "large.bin") == 0
+
+    assert fake_gcs.objects[(BUCKET, "dir/large.bin")].data == data
+    assert len(upload_puts(fake_gcs)) == 4
+    assert len(fake_gcs.hashes) == 1
+
+
+def test_upload_stream_exact_chunks(fake_gcs, bucket_spec):
+    data = os.urandom(2 * CHUNK_SIZE)
+
+    handler = BucketTransfer(stream_spec(bucket_spec, upload={"chunkSize": CHUNK_SIZE}))
+    assert handler.upload_stream(io.BytesIO(data), "file.bin") == 0
+    assert fake_gcs.objects[(BUCKET, "file.bin")].data == data
+
+
+def test_upload_stream_empty(fake_gcs, bucket_spec):
+    handler = BucketTransfer(stream_spec(bucket_spec))
+    assert handler.upload_stream(iter([]), "empty.txt") == 0
+    assert fake_gcs.objects[(BUCKET, "empty.txt")].data == b""
+
+
+def test_upload_stream_resumes_after_failure(fake_gcs, bucket_spec):
+    data = os.urandom(3 * CHUNK_SIZE + 1000)
+    fake_gcs.inject_error("PUT /upload", 503, count=2)
+
+    handler = BucketTransfer(stream_spec(bucket_spec, upload={"chunkSize": CHUNK_SIZE}))
+    assert handler.upload_stream(io.BytesIO(data), "file.bin") == 0
+    assert fake_gcs.objects[(BUCKET, "file.bin")].data == data
+
+
+def test_upload_stream_compressed(fake_gcs, bucket_spec):
+    data = b"a,b,c\n" * 200000
+
+    handler = BucketTransfer(
+        stream_spec(bucket_spec, upload={"chunkSize": CHUNK_SIZE, "compress": True})
+    )
+    assert handler.upload_stream(io.BytesIO(data), "data.csv") == 0
+
+    stored = fake_gcs.objects[(BUCKET, "data.csv")]
+    assert stored.metadata["contentEncoding"] == "gzip"
+    assert gzip.decompress(stored.data) == data
+
+
+def test_upload_stream_failing_source_creates_nothing(fake_gcs, bucket_spec):
+    def stream():
+        yield os.urandom(CHUNK_SIZE + 1)
+        raise RemoteTransferError("Source checksum doesn't match")
+
+    handler = BucketTransfer(stream_spec(bucket_spec, upload={"chunkSize": CHUNK_SIZE}))
+    with pytest.raises(RemoteTransferError):
+        handler.upload_stream(stream(), "file.bin")
+    assert (BUCKET, "file.bin") not in fake_gcs.objects
+
+
+class StreamingDestination:
+    """A handler for another protocol that accepts streams."""
+
+    def __init__(self):
+        """Start with nothing uploaded."""
+        self.files = {}
+
+    def upload_stream(self, stream, file_name):
+        """Keep the streamed data, keyed by file name."""
+        self.files[file_name] = b"".join(stream)
+        return 0
+
+
+def test_transfer_files_streams_to_other_handlers(fake_gcs, bucket_spec):
+    fake_gcs.put(BUCKET, "dir/file1.txt", b"hello")
+    fake_gcs.put(BUCKET, "dir/file2.txt", b"world")
+    fake_gcs.put(BUCKET, "dir/file3.txt", b"corrupt", crc32c="AAAAAA==", md5Hash="AAAA")
+
+    handler = BucketTransfer(stream_spec(bucket_spec, directory="dir"))
+    destination = StreamingDestination()
+    files = handler.list_files()
+    del files["dir/file3.txt"]
+    assert handler.transfer_files(files, {}, dest_remote_handler=destination) == 0
+    assert destination.files == {"file1.txt": b"hello", "file2.txt": b"world"}
+
+    assert (
+        handler.transfer_files(["dir/file3.txt"], {}, dest_remote_handler=destination)
+        == 1
+    )
+    assert "file3.txt" not in destination.files
+
+
+def test_transfer_files_bucket_to_bucket_stream(fake_gcs, bucket_spec):
+    data = os.urandom(2 * CHUNK_SIZE + 5)
+    fake_gcs.put(BUCKET, "source/file.bin", data)
+
+    source = BucketTransfer(stream_spec(bucket_spec))
+    destination = BucketTransfer(
+        stream_spec(bucket_spec, directory="copy", upload={"chunkSize": CHUNK_SIZE})
+    )
+    with source.open_object("source/file.bin") as reader:
+        assert destination.upload_stream(reader, "file.bin") == 0
+    assert fake_gcs.objects[(BUCKET, "copy/file.bin")].data == data